@@ -65,9 +65,9 @@ Instructions to create executable using pytinstaller:
 3. A new file named GUI_GO.spec will appear in the project file. Open this file.
 4. In this file there is a variable called datas = []. Replace the empty array with:
     datas = [('.\\global_optimization.py', '.'), ('.\\data_structure.py','.'),('.\\material_structure.py','.'),
-    ('.\\material_model.py','.'), ('.\\Ti34_XAS_Python.py','.'), ('.\\Ti34OpsPython.pkl','.'),('.\\default_script.txt','.'), ('.\\form_factor.pkl','.'),
-    ('.\\form_factor_magnetic.pkl','.'), ('.\\Perovskite_Density.txt','.'), ('.\\Atomic_Mass.txt','.'),
-    ('.\\demo.h5','.'), ('.\\GO-RXR_UserGuide_v0.3.1.pdf','.'), ('.\\license.txt','.'),('.\\tips.txt','.'),('.\\demo.h5','.'), ('.\\logo.png','.')]
+    ('.\\material_model.py','.'), ('.\\Ti34_XAS_Python.py','.'), ('.\\Ti34OpsPython.npz','.'),('.\\default_script.txt','.'), ('.\\form_factor.pkl','.'),
+    ('.\\form_factor_magnetic.pkl','.'), ('.\\form_factor.h5','.'), ('.\\form_factor_magnetic.h5','.'),
+    ('.\\Perovskite_Density.txt','.'), ('.\\Atomic_Mass.txt','.'), ('.\\demo.h5','.'), ('.\\GO-RXR_UserGuide_v0.3.1.pdf','.'), ('.\\license.txt','.'),('.\\tips.txt','.'),('.\\demo.h5','.'), ('.\\logo.png','.')]
 5. This includes all the python files, text files, and all other data used to execute GUI_GO.py. If newer versions
    of GO-RXR depend on more files than they must be included into this array. Follow the same naming convention as shown.
 6. Once satisfied run 'pyinstaller GUI_GO.spec' in the terminal. This will ensure that all desired data is included into
@@ -124,10 +124,6 @@ from UTILS.Ti34_XAS_Python import GetTiFormFactor
 global stop
 stop = False
 
-# this global variable is used to store the parameter values at each optimization iteration
-global x_vars
-x_vars = []
-
 def change_internal_ff(element, ff_dict, my_data): 
     """
     Purpose: Change the atomic form factor data for the global atomic form factor dictionary
@@ -4723,8 +4719,8 @@ class reflectivityWidget(QWidget):
                     E = self.data_dict[name]['Energy']  # energy
 
                     if self.parent.reflectivity_engine == 'PythonReflectivity':
-                        qz, Rsim = self.sample.reflectivity(E, qz, s_min=step_size, bShift=background_shift,
-                                                            sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
+                        qz, Rsim = ds.CachedReflectivity(self.sample, E, qz, s_min=step_size, bShift=background_shift,
+                                                         sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
                     elif self.parent.reflectivity_engine == 'udkm1Dsim':
                         qz, Rsim = self.sample.reflectivity_udkm(E, qz, s_min=step_size, bShift=background_shift,
                                                             sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
@@ -4769,8 +4765,8 @@ class reflectivityWidget(QWidget):
                     R = dat[2]
                     Theta = self.data_dict[name]['Angle']
                     if self.parent.reflectivity_engine == 'PythonReflectivity':
-                        E, Rsim = self.sample.energy_scan(Theta, E, s_min=step_size, bShift=background_shift,
-                                                          sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
+                        E, Rsim = ds.CachedEnergyScan(self.sample, Theta, E, s_min=step_size, bShift=background_shift,
+                                                      sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
                     elif self.parent.reflectivity_engine == 'udkm1Dsim':
                         E, Rsim = self.sample.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
                                                                  sFactor=scaling_factor, precision=Eprec,
@@ -4834,8 +4830,8 @@ class reflectivityWidget(QWidget):
                 E = self.data_dict[name]['Energy']
 
                 if self.parent.reflectivity_engine == 'PythonReflectivity':
-                    qz, Rsim = self.sample.reflectivity(E, qz, s_min=step_size, bShift=background_shift,
-                                                        sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
+                    qz, Rsim = ds.CachedReflectivity(self.sample, E, qz, s_min=step_size, bShift=background_shift,
+                                                     sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
                 elif self.parent.reflectivity_engine == 'udkm1Dsim':
                     qz, Rsim = self.sample.reflectivity_udkm(E, qz, s_min=step_size, bShift=background_shift,
                                                              sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
@@ -4878,8 +4874,8 @@ class reflectivityWidget(QWidget):
                 R = dat[2]
                 Theta = self.data_dict[name]['Angle']
                 if self.parent.reflectivity_engine == 'PythonReflectivity':
-                    E, Rsim = self.sample.energy_scan(Theta, E, s_min=step_size, bShift=background_shift,
-                                                      sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
+                    E, Rsim = ds.CachedEnergyScan(self.sample, Theta, E, s_min=step_size, bShift=background_shift,
+                                                  sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
                 elif self.parent.reflectivity_engine == 'udkm1Dsim':
                     E, Rsim = self.sample.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
                                                              sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
@@ -4941,7 +4937,7 @@ class callback():
 
     def stop_evolution(self, x, convergence):
         # end differential evolution properly
-        x_vars.append(x)
+        go.return_x().append(x)
         if stop:
             return True
         else:
@@ -4949,7 +4945,7 @@ class callback():
 
     def stop_simplicial(self, x):
         # end simplicial homology properly
-        x_vars.append(x)
+        go.return_x().append(x)
         if stop:
             return True
         else:
@@ -4957,7 +4953,23 @@ class callback():
 
     def stop_annealing(self, x, f, connect):
         # end simulated annealing properly
-        x_vars.append(x)
+        go.return_x().append(x, f)
+        if stop:
+            return True
+        else:
+            return False
+
+    def stop_surrogate(self, x, f):
+        # end surrogate assisted optimization properly
+        go.return_x().append(x, f)
+        if stop:
+            return True
+        else:
+            return False
+
+    def stop_direct(self, x, f):
+        # end direct algorithm properly
+        go.return_x().append(x, f)
         if stop:
             return True
         else:
@@ -5058,6 +5070,27 @@ class GlobalOptimizationWidget(QWidget):
         mylayout.addSpacing(5)
         mylayout.addWidget(self.checkBox)
 
+        # checkpoint check box, the checkpoint of an interrupted data fitting is continued with go.resume
+        checkpointLayout = QHBoxLayout()
+        self.checkpointLabel = QLabel('Checkpoint: ')
+        self.checkpointLabel.setFixedWidth(60)
+        self.checkpointBox = QCheckBox()
+        self.checkpointBox.setToolTip('Periodically save the state of the data fitting to <project>_checkpoint.pkl')
+        checkpointLayout.addWidget(self.checkpointLabel)
+        checkpointLayout.addSpacing(5)
+        checkpointLayout.addWidget(self.checkpointBox)
+
+        # trajectory check box, the parameter values of every evaluation are also written to disk
+        trajectoryLayout = QHBoxLayout()
+        self.trajectoryLabel = QLabel('Trajectory: ')
+        self.trajectoryLabel.setFixedWidth(60)
+        self.trajectoryBox = QCheckBox()
+        self.trajectoryBox.setToolTip('Write the parameter values of the data fitting to <project>_trajectory.h5, '
+                                      'the log of a previous data fitting is replaced')
+        trajectoryLayout.addWidget(self.trajectoryLabel)
+        trajectoryLayout.addSpacing(5)
+        trajectoryLayout.addWidget(self.trajectoryBox)
+
         # run optimization button
         self.runButton = QPushButton('Run Optimization')
         self.runButton.pressed.connect(self._run_global_optimization)
@@ -5081,6 +5114,8 @@ class GlobalOptimizationWidget(QWidget):
         buttonLayout.addLayout(isLogLayout)
         buttonLayout.addStretch(1)
         buttonLayout.addLayout(mylayout)
+        buttonLayout.addLayout(checkpointLayout)
+        buttonLayout.addLayout(trajectoryLayout)
         buttonLayout.addWidget(self.runButton)
         buttonLayout.addWidget(self.stopButton)
         buttonLayout.addStretch(1)
@@ -5660,8 +5695,8 @@ class GlobalOptimizationWidget(QWidget):
 
             qz = np.array(myData[0])
             if self.parent.reflectivity_engine == 'PythonReflectivity':
-                qz, Rsim = sample.reflectivity(E, qz, bShift=background_shift, sFactor=scaling_factor, precision=prec,
-                                               s_min=step_size, sf_dict=sf_dict)
+                qz, Rsim = ds.CachedReflectivity(sample, E, qz, bShift=background_shift, sFactor=scaling_factor, precision=prec,
+                                                 s_min=step_size, sf_dict=sf_dict)
             elif self.parent.reflectivity_engine == 'udkm1Dsim':
                 qz, Rsim = self.sample.reflectivity_udkm(E, qz, s_min=step_size, bShift=background_shift,
                                                          sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
@@ -5709,8 +5744,8 @@ class GlobalOptimizationWidget(QWidget):
             pol = myDataScan['Polarization']
 
             if self.parent.reflectivity_engine == 'PythonReflectivity':
-                E, Rsim = sample.energy_scan(Theta, E, bShift=background_shift, sFactor=scaling_factor, precision=Eprec,
-                                             s_min=step_size, sf_dict=sf_dict)
+                E, Rsim = ds.CachedEnergyScan(sample, Theta, E, bShift=background_shift, sFactor=scaling_factor, precision=Eprec,
+                                              s_min=step_size, sf_dict=sf_dict)
             elif self.parent.reflectivity_engine == 'udkm1Dsim':
                 E, Rsim = self.sample.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
                                                          sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
@@ -5791,8 +5826,8 @@ class GlobalOptimizationWidget(QWidget):
 
             qz = np.array(myData[0])
             if self.parent.reflectivity_engine == 'PythonReflectivity':
-                qz, Rsim = sample.reflectivity(E, qz,bShift=background_shift, sFactor=scaling_factor, precision=prec,
-                                               s_min=step_size, sf_dict=sf_dict)
+                qz, Rsim = ds.CachedReflectivity(sample, E, qz,bShift=background_shift, sFactor=scaling_factor, precision=prec,
+                                                 s_min=step_size, sf_dict=sf_dict)
             elif self.parent.reflectivity_engine == 'udkm1Dsim':
                 qz, Rsim = self.sample.reflectivity_udkm(E, qz, s_min=step_size, bShift=background_shift,
                                                          sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
@@ -5846,8 +5881,8 @@ class GlobalOptimizationWidget(QWidget):
             pol = myDataScan['Polarization']
 
             if self.parent.reflectivity_engine == 'PythonReflectivity':
-                E, Rsim = sample.energy_scan(Theta, E, bShift=background_shift, sFactor=scaling_factor, precision=Eprec,
-                                             s_min=step_size, sf_dict=sf_dict)
+                E, Rsim = ds.CachedEnergyScan(sample, Theta, E, bShift=background_shift, sFactor=scaling_factor, precision=Eprec,
+                                              s_min=step_size, sf_dict=sf_dict)
             elif self.parent.reflectivity_engine == 'udkm1Dsim':
                 E, Rsim = self.sample.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
                                                        sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
@@ -6358,8 +6393,8 @@ class GlobalOptimizationWidget(QWidget):
                 R = dat[2]
                 E = self.rWidget.data_dict[name]['Energy']
                 if self.parent.reflectivity_engine == 'PythonReflectivity':
-                    qz, Rsim = sample1.reflectivity(E, qz, s_min=step_size, sFactor=scaling_factor_old,
-                                                    bShift=background_shift_old, precision=prec, sf_dict=sf_dict1)
+                    qz, Rsim = ds.CachedReflectivity(sample1, E, qz, s_min=step_size, sFactor=scaling_factor_old,
+                                                     bShift=background_shift_old, precision=prec, sf_dict=sf_dict1)
                 elif self.parent.reflectivity_engine == 'udkm1Dsim':
                     qz, Rsim = self.sample1.reflectivity_udkm(E, qz, s_min=step_size, bShift=background_shift,
                                                              sFactor=scaling_factor, precision=prec, sf_dict=sf_dict1)
@@ -6374,9 +6409,9 @@ class GlobalOptimizationWidget(QWidget):
                         self.plotWidget.plot(qz, Rsim, pen=pg.mkPen((1, 3), width=2), name='Simulation')
                         if isGO:
                             if self.parent.reflectivity_engine == 'PythonReflectivity':
-                                qz, Rgo = sample2.reflectivity(E, qz, s_min=step_size, sFactor=scaling_factor,
-                                                               bShift=background_shift, precision=prec,
-                                                               sf_dict=sf_dict2)
+                                qz, Rgo = ds.CachedReflectivity(sample2, E, qz, s_min=step_size, sFactor=scaling_factor,
+                                                                bShift=background_shift, precision=prec,
+                                                                sf_dict=sf_dict2)
                             elif self.parent.reflectivity_engine == 'udkm1Dsim':
                                 qz, Rgo = self.sample2.reflectivity_udkm(E, qz, s_min=step_size,
                                                                          bShift=background_shift,
@@ -6392,9 +6427,9 @@ class GlobalOptimizationWidget(QWidget):
                         self.plotWidget.plot(Theta, Rsim, pen=pg.mkPen((1, 3), width=2), name='Simulation')
                         if isGO:
                             if self.parent.reflectivity_engine == 'PythonReflectivity':
-                                qz, Rgo = sample2.reflectivity(E, qz, s_min=step_size, sFactor=scaling_factor,
-                                                               bShift=background_shift, precision=prec,
-                                                               sf_dict=sf_dict2)
+                                qz, Rgo = ds.CachedReflectivity(sample2, E, qz, s_min=step_size, sFactor=scaling_factor,
+                                                                bShift=background_shift, precision=prec,
+                                                                sf_dict=sf_dict2)
                             elif self.parent.reflectivity_engine == 'udkm1Dsim':
                                 qz, Rgo = self.sample2.reflectivity_udkm(E, qz, s_min=step_size,
                                                                          bShift=background_shift,
@@ -6414,8 +6449,8 @@ class GlobalOptimizationWidget(QWidget):
                         self.plotWidget.plot(qz[rm_idx], Rsim[rm_idx], pen=pg.mkPen((1, 3), width=2), name='Simulation')
                         if isGO:
                             if self.parent.reflectivity_engine == 'PythonReflectivity':
-                                qz, Rgo = sample2.reflectivity(E, qz, s_min=step_size, bShift=background_shift,
-                                                               sFactor=scaling_factor, precision=prec, sf_dict=sf_dict2)
+                                qz, Rgo = ds.CachedReflectivity(sample2, E, qz, s_min=step_size, bShift=background_shift,
+                                                                sFactor=scaling_factor, precision=prec, sf_dict=sf_dict2)
                             elif self.parent.reflectivity_engine == 'udkm1Dsim':
                                 qz, Rgo = self.sample2.reflectivity_udkm(E, qz, s_min=step_size,
                                                                          bShift=background_shift,
@@ -6431,9 +6466,9 @@ class GlobalOptimizationWidget(QWidget):
                                              name='Simulation')
                         if isGO:
                             if self.parent.reflectivity_engine == 'PythonReflectivity':
-                                qz, Rgo = sample2.reflectivity(E, qz, s_min=step_size, sFactor=scaling_factor,
-                                                               bShift=background_shift, precision=prec,
-                                                               sf_dict=sf_dict2)
+                                qz, Rgo = ds.CachedReflectivity(sample2, E, qz, s_min=step_size, sFactor=scaling_factor,
+                                                                bShift=background_shift, precision=prec,
+                                                                sf_dict=sf_dict2)
                             elif self.parent.reflectivity_engine == 'udkm1Dsim':
                                 qz, Rgo = self.sample2.reflectivity_udkm(E, qz, s_min=step_size,
                                                                          bShift=background_shift,
@@ -6453,7 +6488,7 @@ class GlobalOptimizationWidget(QWidget):
                 Theta = self.rWidget.data_dict[name]['Angle']
 
                 if self.parent.reflectivity_engine == 'PythonReflectivity':
-                    E, Rsim = sample1.energy_scan(Theta, E, s_min=step_size, sFactor=scaling_factor_old,
+                    E, Rsim = ds.CachedEnergyScan(sample1, Theta, E, s_min=step_size, sFactor=scaling_factor_old,
                                                   bShift=background_shift_old, precision=Eprec, sf_dict=sf_dict1)
                 elif self.parent.reflectivity_engine == 'udkm1Dsim':
                     E, Rsim = self.sample1.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
@@ -6461,7 +6496,7 @@ class GlobalOptimizationWidget(QWidget):
 
                 if isGO:
                     if self.parent.reflectivity_engine == 'PythonReflectivity':
-                        qz, Rgo = sample2.energy_scan(Theta, E, s_min=step_size, sFactor=scaling_factor,
+                        qz, Rgo = ds.CachedEnergyScan(sample2, Theta, E, s_min=step_size, sFactor=scaling_factor,
                                                       bShift=background_shift, precision=Eprec, sf_dict=sf_dict2)
                     elif self.parent.reflectivity_engine == 'udkm1Dsim':
                         E, Rgo = self.sample2.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
@@ -6475,7 +6510,7 @@ class GlobalOptimizationWidget(QWidget):
                 self.plotWidget.plot(E, Rsim, pen=pg.mkPen((1, 3), width=2), name='Simulation')
                 if isGO:
                     if self.parent.reflectivity_engine == 'PythonReflectivity':
-                        qz, Rgo = sample2.energy_scan(Theta, E, s_min=step_size, sFactor=scaling_factor,
+                        qz, Rgo = ds.CachedEnergyScan(sample2, Theta, E, s_min=step_size, sFactor=scaling_factor,
                                                       bShift=background_shift, precision=Eprec, sf_dict=sf_dict2)
                     elif self.parent.reflectivity_engine == 'udkm1Dsim':
                         E, Rsim = self.sample2.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
@@ -6812,6 +6847,14 @@ class GlobalOptimizationWidget(QWidget):
         precisionE = float(self.sWidget._Eprecision)
         step_size = float(self.sWidget._step_size)
 
+        # on-disk log of the parameter values so a crashed data fitting leaves its trajectory
+        trajectory = None
+        if self.trajectoryBox.checkState() > 0:
+            trajectory = os.path.splitext(self.parent.fname)[0] + '_trajectory.h5'
+        checkpoint = None
+        if self.checkpointBox.checkState() > 0:
+            checkpoint = os.path.splitext(self.parent.fname)[0] + '_checkpoint.pkl'  # used by go.resume
+
         # run the selected data fitting algorithm
         if len(parameters) != 0 and len(scans) != 0:
             if idx == 0:  # differential evolution
@@ -6820,18 +6863,19 @@ class GlobalOptimizationWidget(QWidget):
                                                    self.goParameters['differential evolution'], self.callback,
                                                    self.objective, self.shape_weight, r_scale, smooth_dict, script,
                                                    orbitals, sf_dict,nd,temperature, reflectivity_engine,step_size,
-                                                   precision, precisionE,use_script=use_script)
+                                                   precision, precisionE,use_script=use_script, trajectory=trajectory, checkpoint=checkpoint)
             elif idx == 1:  # simplicial homology
                 x, fun = go.shgo(sample, data, data_dict, scans, backS, scaleF, parameters, bounds, sBounds, sWeights,
                                  self.goParameters['simplicial homology'], self.callback,
                                  self.objective, self.shape_weight, r_scale, smooth_dict, script, orbitals, sf_dict,nd,
-                                 temperature, reflectivity_engine,step_size, precision, precisionE,use_script=use_script)
+                                 temperature, reflectivity_engine,step_size, precision, precisionE,use_script=use_script,
+                                 trajectory=trajectory, checkpoint=checkpoint)
             elif idx == 2:  # dual annealing
                 x, fun = go.dual_annealing(sample, data, data_dict, scans, backS, scaleF, parameters, bounds, sBounds,
                                            sWeights, self.goParameters['dual annealing'], self.callback, self.objective,
                                            self.shape_weight, r_scale, smooth_dict, script, orbitals, sf_dict, nd,
                                            temperature, reflectivity_engine, step_size, precision, precisionE,
-                                           use_script=use_script)
+                                           use_script=use_script, trajectory=trajectory, checkpoint=checkpoint)
             elif idx == 3:  # least squares
                 bounds = (lw, up)
 
@@ -6839,7 +6883,8 @@ class GlobalOptimizationWidget(QWidget):
                                           sBounds, sWeights,
                                           self.goParameters['least squares'], self.callback,
                                           self.objective, self.shape_weight, r_scale, smooth_dict, script,orbitals,sf_dict,
-                                          nd, temperature, reflectivity_engine, step_size, precision, precisionE,use_script)
+                                          nd, temperature, reflectivity_engine, step_size, precision, precisionE,use_script,
+                                          trajectory=trajectory)
 
 
             """
@@ -8371,6 +8416,7 @@ class ReflectometryApp(QMainWindow):
         # Preferences
         self.reflectivity_engine = 'PythonReflectivity'
         self.temperature = 300 # kelvin
+        self.processes = 1  # worker processes used to simulate the scans when the simulation is saved
 
         # set the title
         my_name = 'GO-RXR (version '+self.version +')'
@@ -9344,7 +9390,7 @@ class ReflectometryApp(QMainWindow):
         Initialize the preferences widget
         """
 
-        prefer = Preferences([self.reflectivity_engine, self.temperature])
+        prefer = Preferences([self.reflectivity_engine, self.temperature, self.processes])
         prefer.show()
         prefer.exec_()
         userinput = prefer.val
@@ -9352,6 +9398,7 @@ class ReflectometryApp(QMainWindow):
 
         self.reflectivity_engine = userinput[0]
         self.temperature = userinput[1]
+        self.processes = userinput[2]
 
     def _license(self): 
         """
@@ -9661,10 +9708,7 @@ class progressWidget(QWidget):
         self.allScans.setStyleSheet('background: white; selection-background-color: red')
 
         # retrieve current iteration of the data fitting
-        global x_vars
-        x = copy.deepcopy(x_vars)
-        if len(x) == 0:
-            x = go.return_x()
+        x = go.return_x()  # trajectory log of the data fitting
 
         self.plotWidget.clear()
 
@@ -9714,8 +9758,8 @@ class progressWidget(QWidget):
                 R = dat[2]
                 E = self.rWidget.data_dict[name]['Energy']
                 if self.parent.reflectivity_engine == 'PythonReflectivity':
-                    qz, Rsim = sample.reflectivity(E, qz, s_min=step_size, bShift=background_shift,
-                                                   sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
+                    qz, Rsim = ds.CachedReflectivity(sample, E, qz, s_min=step_size, bShift=background_shift,
+                                                     sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
                 elif self.parent.reflectivity_engine == 'udkm1Dsim':
                     qz, Rsim = self.sample.reflectivity_udkm(E, qz, s_min=step_size, bShift=background_shift,
                                                              sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
@@ -9758,8 +9802,8 @@ class progressWidget(QWidget):
                 R = dat[2]
                 Theta = self.rWidget.data_dict[name]['Angle']
                 if self.parent.reflectivity_engine == 'PythonReflectivity':
-                    E, Rsim = sample.energy_scan(Theta, E, s_min=step_size, bShift=background_shift,
-                                                 sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
+                    E, Rsim = ds.CachedEnergyScan(sample, Theta, E, s_min=step_size, bShift=background_shift,
+                                                  sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
                 elif self.parent.reflectivity_engine == 'udkm1Dsim':
                     E, Rsim = self.sample.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
                                                            sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
@@ -9785,10 +9829,7 @@ class progressWidget(QWidget):
         self.scanBox.setStyleSheet('background: white; selection-background-color: grey')
         self.allScans.setStyleSheet('background: red; selection-background-color: red')
         # retrieve current iteration of the data fitting
-        global x_vars
-        x = copy.deepcopy(x_vars)
-        if len(x) == 0:
-            x = go.return_x()
+        x = go.return_x()  # trajectory log of the data fitting
 
         self.plotWidget.clear()
 
@@ -9835,8 +9876,8 @@ class progressWidget(QWidget):
                 R = dat[2]
                 E = self.rWidget.data_dict[name]['Energy']
                 if self.parent.reflectivity_engine == 'PythonReflectivity':
-                    qz, Rsim = sample.reflectivity(E, qz, s_min=step_size, bShift=background_shift,
-                                                   sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
+                    qz, Rsim = ds.CachedReflectivity(sample, E, qz, s_min=step_size, bShift=background_shift,
+                                                     sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
                 elif self.parent.reflectivity_engine == 'udkm1Dsim':
                     qz, Rsim = self.sample.reflectivity_udkm(E, qz, s_min=step_size, bShift=background_shift,
                                                              sFactor=scaling_factor, precision=prec, sf_dict=sf_dict)
@@ -9877,8 +9918,8 @@ class progressWidget(QWidget):
                 R = dat[2]
                 Theta = self.rWidget.data_dict[name]['Angle']
                 if self.parent.reflectivity_engine == 'PythonReflectivity':
-                    E, Rsim = sample.energy_scan(Theta, E, s_min=step_size, bShift=background_shift,
-                                                 sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
+                    E, Rsim = ds.CachedEnergyScan(sample, Theta, E, s_min=step_size, bShift=background_shift,
+                                                  sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
                 elif self.parent.reflectivity_engine == 'udkm1Dsim':
                     E, Rsim = self.sample.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
                                                            sFactor=scaling_factor, precision=Eprec, sf_dict=sf_dict)
@@ -9909,221 +9950,27 @@ class progressWidget(QWidget):
         self.allScans.blockSignals(False)
         self.boundaries = self.rWidget.bounds
 
-    def computeScan(self, x_array, script, use_script=False):
+    def readTelemetry(self, x):
         """
-        Purpose: calculate the cost function of the current data fitting iteration
-        :param x_array: current iteration parameters
+        Purpose: retrieve the cost function terms of the data fitting iterations as computed by the cost function
+        :param x: trajectory log of the data fitting
+        :return: iteration numbers of the iterations kept in memory
         """
-        
-        step_size = float(self.sWidget._step_size)
-        orbitals = copy.copy(self.sWidget.orbitals)
-        prec = float(self.sWidget._precision)
-        Eprec = float(self.sWidget._Eprecision)
-        smooth_dict = self.nWidget.smoothScans  # retrieve the smoothed data
-
-        if len(x_array) != 0:
-            # compute the scans for all the new x values
-            n = len(self.objFun['total'])
-
-            for x in x_array[n:]:
-                sample, backS, scaleF, orbitals = go.changeSampleParams(x, self.parameters, self.sample,
-                                                              self.backS, self.scaleF,script, orbitals,use_script=use_script)
-
-
-                sf_dict = self.sWidget.sf_dict
-
-                for okey in list(orbitals.keys()):
-                    my_data = GetTiFormFactor(float(orbitals[okey][0]),
-                                              float(orbitals[okey][1]),
-                                              float(orbitals[okey][2]),
-                                              float(orbitals[okey][3]),
-                                              T=float(self.parent.temperature),
-                                              nd=int(self.parent.nd))
-
-                    sf_dict[okey] = my_data
-
-                fun = 0
-                gamma = 0
-
-                for i, scan in enumerate(self.scans):
-                    name = scan
-                    Rsmooth = smooth_dict[name]['Data'][2]
-                    fun_val = 0
-                    xbound = self.sBounds[i]
-                    weights = self.sWeights[i]
-
-                    background_shift = float(backS[name])
-                    scaling_factor = float(scaleF[name])
-
-                    if 'Angle' not in self.data[name].keys():
-                        myDataScan = self.data[name]
-                        myData = myDataScan['Data']
-                        E = myDataScan['Energy']
-                        pol = myDataScan['Polarization']
-                        Rdat = np.array(myData[2])
-
-                        qz = np.array(myData[0])
-                        if self.parent.reflectivity_engine == 'PythonReflectivity':
-                            qz, Rsim = sample.reflectivity(E, qz, bShift=background_shift, sFactor=scaling_factor, s_min=step_size, precision=prec, sf_dict=sf_dict)
-                        elif self.parent.reflectivity_engine == 'udkm1Dsim':
-                            qz, Rsim = self.sample.reflectivity_udkm(E, qz, s_min=step_size, bShift=background_shift,
-                                                                     sFactor=scaling_factor, precision=prec,
-                                                                     sf_dict=sf_dict)
-
-                        Rsim = Rsim[pol]
-
-                        j = [x for x in range(len(qz)) if qz[x] > xbound[0][0] and qz[x] < xbound[-1][-1]]
-                        qz = qz[j]
-                        if len(Rsim) != len(j):
-                            Rsim = Rsim[j]
-                        if len(Rdat) != len(j):
-                            Rdat = Rdat[j]
-                        if len(Rsmooth) != len(j):
-                            Rsmooth = Rsmooth[j]
-
-                        if self.y_scale == 'log(x)':
-                            Rsim = np.log10(Rsim)
-                            Rdat = np.log10(Rdat)
-                            Rsmooth = np.log10(Rsmooth)
-                        elif self.y_scale == 'ln(x)':
-                            Rsim = np.log(Rsim)
-                            Rdat = np.log(Rdat)
-                            Rsmooth = np.log(Rsmooth)
-                        elif self.y_scale == 'qz^4':
-                            Rsim = np.multiply(Rsim, np.power(qz, 4))
-                            Rdat = np.multiply(Rdat, np.power(qz, 4))
-                            Rsmooth = np.multiply(Rsmooth, np.power(qz,4))
-                        elif self.y_scale == 'x':
-                            pass
-
-                        if len(Rsmooth) != 0:
-                            val = go.total_variation(Rsmooth, Rsim) / len(Rsmooth)
-                        else:
-                            val = 0
-                        self.varFun[name].append(val * self.shape_weight)
-                        gamma = gamma + val
-
-                        m = 0
-                        for b in range(len(xbound)):
-                            lw = xbound[b][0]
-                            up = xbound[b][1]
-                            w = weights[b]
-
-                            idx = [x for x in range(len(qz)) if
-                                   qz[x] >= lw and qz[x] < up]  # determines index boundaries
-
-                            k = len(idx)
-                            m = m + k
-                            if len(idx) != 0:
-                                if self.objective == 'Chi-Square':
-                                    fun_val = fun_val + sum((Rdat[idx] - Rsim[idx]) ** 2 / abs(Rsim[idx]))
-
-                                elif self.objective == 'L1-Norm':
-                                    fun_val = fun_val + sum(np.abs(Rdat[idx] - Rsim[idx]))
-                                elif self.objective == 'L2-Norm':
-                                    fun_val = fun_val + sum((Rdat[idx] - Rsim[idx]) ** 2)
-                                elif self.objective == 'Arctan':
-                                    fun_val = fun_val + sum(np.arctan((Rdat[idx] - Rsim[idx]) ** 2))
-
-                        if m != 0:
-                            self.costFun[name].append(fun_val / m)
-                            self.objFun[name].append(fun_val / m + val * self.shape_weight)
-                            fun = fun + fun_val / m
+        telemetry = x.telemetry()
+        scan_cost = telemetry['scan_cost']
+        variation = telemetry['variation']
 
-                    else:
+        self.objFun = {'total': telemetry['cost']}
+        self.costFun = {'total': np.sum(scan_cost, axis=1)}
+        self.varFun = {'total': np.sum(variation, axis=1)}
+        for name in self.scans:
+            if name in x.scans:
+                i = x.scans.index(name)
+                self.objFun[name] = scan_cost[:, i] + variation[:, i]
+                self.costFun[name] = scan_cost[:, i]
+                self.varFun[name] = variation[:, i]
 
-                        myDataScan = self.data[name]
-                        myData = myDataScan['Data']
-                        Theta = myDataScan['Angle']
-                        Rdat = np.array(myData[2])
-                        E = np.array(myData[3])
-                        pol = myDataScan['Polarization']
-
-                        if self.parent.reflectivity_engine == 'PythonReflectivity':
-                            E,Rsim = sample.energy_scan(Theta, E, bShift=background_shift, sFactor=scaling_factor, s_min=step_size, precision=Eprec, sf_dict=sf_dict)
-                        elif self.parent.reflectivity_engine == 'udkm1Dsim':
-                            E, Rsim = self.sample.energy_scan_udkm(Theta, E, s_min=step_size, bShift=background_shift,
-                                                                   sFactor=scaling_factor, precision=Eprec,
-                                                                   sf_dict=sf_dict)
-
-                        Rsim = Rsim[pol]
-
-                        j = [x for x in range(len(E)) if E[x] > xbound[0][0] and E[x] < xbound[-1][-1]]
-                        E = E[j]
-                        if len(Rsim) != len(j):
-                            Rsim = Rsim[j]
-                        if len(Rdat) != len(j):
-                            Rdat = Rdat[j]
-                        if len(Rsmooth) != len(j):
-                            Rsmooth = Rsmooth[j]
-
-                        if self.y_scale == 'log(x)':
-                            Rsim = np.log10(Rsim)
-                            Rdat = np.log10(Rdat)
-                            Rsmooth = np.log10(Rsmooth)
-                        elif self.y_scale == 'ln(x)':
-                            Rsim = np.log(Rsim)
-                            Rdat = np.log(Rdat)
-                            Rsmooth = np.log(Rsmooth)
-                        elif self.y_scale == 'qz^4':
-                            qz = np.array(myData[0])
-                            Rsim = np.multiply(Rsim, np.power(qz, 4))
-                            Rdat = np.multiply(Rdat, np.power(qz, 4))
-                            Rsmooth = np.multiply(Rsmooth, np.power(qz, 4))
-                        elif self.y_scale == 'x':
-                            pass
-
-                        if len(Rsmooth) != 0:
-                            val = go.total_variation(Rsmooth, Rsim) / len(Rsmooth)
-                        else:
-                            val = 0
-                        self.varFun[name].append(val * self.shape_weight)
-                        gamma = gamma + val
-
-                        m = 0
-                        for b in range(len(xbound)):
-                            lw = xbound[b][0]
-                            up = xbound[b][1]
-                            w = weights[b]
-
-                            idx = [x for x in range(len(E)) if E[x] >= lw and E[x] < up]  # determines index boundaries
-
-                            k = len(idx)
-                            m = m + k
-                            if len(idx) != 0:
-                                Rnew = (Rdat - min(Rdat)) / (max(Rdat) - min(Rdat))
-                                Rnew_s = (Rsim - min(Rdat)) / (max(Rdat) - min(Rdat))
-                                if self.objective == 'Chi-Square':
-                                    if self.y_scale == 'x':
-                                        fun_val = fun_val + sum((Rnew[idx] - Rnew_s[idx]) ** 2 / abs(Rnew_s[idx]))
-                                    else:
-                                        fun_val = fun_val + sum((Rdat[idx] - Rsim[idx]) ** 2 / abs(Rsim[idx]))
-                                elif self.objective == 'L1-Norm':
-                                    if self.y_scale == 'x':
-                                        fun_val = fun_val + sum(np.abs(Rnew[idx] - Rnew_s[idx]))
-                                    else:
-                                        fun_val = fun_val + sum(np.abs(Rdat[idx] - Rsim[idx]))
-                                elif self.objective == 'L2-Norm':
-                                    if self.y_scale == 'x':
-                                        fun_val = fun_val + sum((Rnew[idx] - Rnew_s[idx]) ** 2)
-                                    else:
-                                        fun_val = fun_val + sum((Rdat[idx] - Rsim[idx]) ** 2)
-                                elif self.objective == 'Arctan':
-                                    if self.y_scale == 'x':
-                                        fun_val = fun_val + sum(np.arctan((Rnew[idx] - Rnew_s[idx]) ** 2)) * w
-                                    else:
-                                        fun_val = fun_val + sum(np.arctan((Rdat[idx] - Rsim[idx]) ** 2)) * w
-
-                        if m != 0:
-                            self.costFun[name].append(fun_val / m)
-                            self.objFun[name].append(fun_val / m + val * self.shape_weight)
-                            fun = fun + fun_val / m
-
-
-                self.costFun['total'].append(fun)
-                self.varFun['total'].append(gamma * self.shape_weight)
-                fun = fun + gamma * self.shape_weight
-                self.objFun['total'].append(fun)
+        return telemetry['iteration']
 
     def plotProgress(self):
         """
@@ -10136,17 +9983,12 @@ class progressWidget(QWidget):
             use_script=True
 
         # retrieve the parameters of the current data fitting iteration
-        global x_vars
-        x = copy.deepcopy(x_vars)
-        if len(x) == 0:
-            x = go.return_x()
+        x = go.return_x()  # trajectory log of the data fitting
         self.plotWidget.clear()
 
-        self.computeScan(x, script,use_script=use_script)
+        iterations = self.readTelemetry(x)  # only the iterations kept in memory
 
         idx = self.whichPlot.index(True)
-        n = len(x)
-        iterations = np.arange(1, n + 1)
 
         self.plotWidget.setLogMode(False, False)
         if len(x) != 0:
@@ -10154,7 +9996,8 @@ class progressWidget(QWidget):
                 m = len(list(self.objFun.keys()))
                 for i, key in enumerate(list(self.objFun.keys())):
                     val = self.objFun[key]
-                    self.plotWidget.plot(iterations, val, pen=pg.mkPen((i, m), width=2), name=key)
+                    self.plotWidget.plot(iterations, val, pen=pg.mkPen((i, m), width=2), name=key,
+                                         connect='finite')
                     self.plotWidget.setLabel('left', "Function")
                     self.plotWidget.setLabel('bottom', "Iteration")
 
@@ -10162,7 +10005,8 @@ class progressWidget(QWidget):
                 m = len(list(self.costFun.keys()))
                 for i, key in enumerate(list(self.costFun.keys())):
                     val = self.costFun[key]
-                    self.plotWidget.plot(iterations, val, pen=pg.mkPen((i, m), width=2), name=key)
+                    self.plotWidget.plot(iterations, val, pen=pg.mkPen((i, m), width=2), name=key,
+                                         connect='finite')
                     self.plotWidget.setLabel('left', "Function")
                     self.plotWidget.setLabel('bottom', "Iteration")
 
@@ -10170,15 +10014,17 @@ class progressWidget(QWidget):
                 m = len(list(self.varFun.keys()))
                 for i, key in enumerate(list(self.varFun.keys())):
                     val = self.varFun[key]
-                    self.plotWidget.plot(iterations, val, pen=pg.mkPen((i, m), width=2), name=key)
+                    self.plotWidget.plot(iterations, val, pen=pg.mkPen((i, m), width=2), name=key,
+                                         connect='finite')
                     self.plotWidget.setLabel('left', "Function")
                     self.plotWidget.setLabel('bottom', "Iteration")
 
             elif idx == 3:  # varying parameters
                 m = len(self.par)
+                x_iterations, x_window = x.window()  # only the iterations kept in memory
                 for i in range(len(self.par)):
-                    x_values = [x_val[i] for x_val in x]
-                    self.plotWidget.plot(iterations, x_values, pen=pg.mkPen((i, m), width=2), name=self.par[i])
+                    x_values = [x_val[i] for x_val in x_window]
+                    self.plotWidget.plot(x_iterations, x_values, pen=pg.mkPen((i, m), width=2), name=self.par[i])
             elif idx == 4:  # plot the density profile
                 sample = copy.deepcopy(self.sample)
                 sample, backS, scaleF, orbitals = go.changeSampleParams(x[-1], self.parameters, sample,
@@ -10321,8 +10167,7 @@ class progressWidget(QWidget):
         self.shape_weight = shape_weight
 
         # clear x and start saving as optimization started
-        global x_vars
-        x_vars = []
+        go.reset_x()
 
         # make call to function that will plot the optimization progress
         self.objFun = dict()
@@ -10421,25 +10266,10 @@ class progressWidget(QWidget):
         """
         Purpose: Data fitting update process
         """
-        script, problem, my_error = checkscript(self.sWidget.sample)
-        use_script = False
-        if not(problem):
-            use_script=True
-
+        # the cost function terms are recorded by the cost function while it runs, nothing is computed here
         self.keep_going = True
-        idx = 0
         while self.keep_going:
-            idx = idx + 1
             time.sleep(0.01)
-
-            if 51 / idx == 1:
-                global x_vars
-                x = copy.deepcopy(x_vars)
-                if len(x) == 0:
-                    x = go.return_x()
-
-                self.computeScan(x, script, use_script=use_script)
-                idx = 0
         return
 
     def _setPar(self):
@@ -10775,6 +10605,7 @@ class Preferences(QDialog):
         self.val = values
         self.reflectivity_engine = values[0]
         self.temperature = values[1]
+        self.processes = values[2]
         pageLayout = QVBoxLayout()  # page layout
         self.setWindowTitle('Preferences')
         #self.setGeometry(80, 80, 80, 80)  # window geometry
@@ -10810,12 +10641,23 @@ class Preferences(QDialog):
         tempLayout.addWidget(tempLabel)
         tempLayout.addWidget(self.tempField)
 
+        # every worker process is a new interpreter, so the simulations run in the GUI process by default
+        processLayout = QHBoxLayout()
+        processLabel = QLabel('Simulation processes:')
+        self.processField = QLineEdit()
+        self.processField.setText(str(self.processes))
+        self.processField.setToolTip('Worker processes used to simulate the scans when the simulation is saved '
+                                     '(at most ' + str(mp.cpu_count()) + ')')
+        processLayout.addWidget(processLabel)
+        processLayout.addWidget(self.processField)
+
 
         saveButton = QPushButton('Save Preferences')
         saveButton.clicked.connect(self.savePreferences)
 
         pageLayout.addLayout(buttonLayout)
         pageLayout.addLayout(tempLayout)
+        pageLayout.addLayout(processLayout)
         pageLayout.addWidget(saveButton)
         pageLayout.setSpacing(20)
         self.setLayout(pageLayout)
@@ -10832,8 +10674,10 @@ class Preferences(QDialog):
         #self.accept()  # close the widget
         if is_float(self.tempField.text()):
             self.temperature = float(self.tempField.text())
+        if self.processField.text().strip().isdigit():
+            self.processes = min(max(int(self.processField.text()), 1), mp.cpu_count())
 
-        self.val = [self.reflectivity_engine, self.temperature]  # reset layer values
+        self.val = [self.reflectivity_engine, self.temperature, self.processes]  # reset layer values
 
 
 class scriptWidget(QDialog): 
@@ -11003,7 +10847,12 @@ class LoadingScreen(QDialog):
         import matplotlib.pyplot as plt
         my_keys = list(self.temp_sim.keys())
         n = self.n
-        if n != 0:
+        if n != 0 and self.parent.reflectivity_engine == 'PythonReflectivity':
+            # unchanged scans are taken from the simulation cache, the others use the processes of the preferences
+            ds.SimulateScans(self.sample, self.temp_sim, self.rWidget.data_dict, s_min=self.s_min,
+                             precision=self.my_precision, Eprecision=self.Eprecision, sf_dict=self.sWidget.sf_dict,
+                             processes=self.parent.processes, callback=self.progress.setValue)
+        elif n != 0:
             for idx in range(len(my_keys)):
 
                 if idx % 2 == 0:
@@ -11650,6 +11499,7 @@ def is_float(string):
     except ValueError:
         return False
 if __name__ == '__main__':
+    mp.freeze_support()  # worker processes of the frozen (PyInstaller) application must not start the GUI
     fname = 'Pim10uc.h5'
 
     app = QApplication(sys.argv)
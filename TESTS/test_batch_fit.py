@@ -0,0 +1,170 @@
+import os
+import sys
+import shutil
+import tempfile
+import h5py
+
+# Get the parent directory of the current script's directory
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Add the parent directory to the system path
+sys.path.append(parent_dir)
+
+import numpy as np
+import UTILS.material_structure as ms
+import UTILS.data_structure as ds
+import UTILS.global_optimization as go
+import UTILS.batch_fit as bf
+import unittest
+
+# This test script can be executed by inputting
+#  ->  python -m unittest -v test_batch_fit.py
+# into the terminal
+
+
+def create_project(fname):
+    # project with a simulated reflectivity scan of a 10 angstrom Al film, the fit starts from 15 angstrom
+    # (the least squares step is larger than the slabs of the density profile)
+    sample = ms.slab(2)
+    sample.addlayer(0, 'Si', 50, density=0.028)
+    sample.addlayer(1, 'Al', 10, density=0.028)
+
+    qz = np.linspace(0.01, 0.3, 100)
+    qz, R = sample.reflectivity(500.0, qz)
+    scan = {'DatasetNumber': 1, 'DataPoints': len(qz), 'Energy': 500.0, 'Polarization': 'S',
+            'Background Shift': 0, 'Scaling Factor': 1, 'Data': np.array([qz, qz, R['S']])}
+    data_dict = {'1_500.0_S': scan}
+
+    sample.structure[1]['Al'].thickness = 15
+
+    goParameters = {
+        'differential evolution': ['best1bin', 20, 10, 1e-6, 0, 0.5, 1, 0.7, False, 'latinhypercube', 'immediate'],
+        'simplicial homology': ['None', 1, 'simplicial'],
+        'dual annealing': [150, 5230.0, 2e-5, 2.62, 5.0, 10000000.0, True],
+        'least squares': ['2-point', 'trf', 1e-8, 1e-8, 1e-8, 1.0, 'linear', 1.0, '0.05', 'None']}
+
+    fit = [[], [], [[1, 'STRUCTURAL', 'ELEMENT', 'Al', 'THICKNESS']], [[15.0, [5.0, 20.0]]], ['1_500.0_S'],
+           [[['0.01', '0.3']]], [['1']], [], 0]
+    ds.saveAsFileHDF5(fname, sample, data_dict, data_dict, fit, goParameters, '0.3')
+
+
+class TestBatchFit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmp, 'project.h5')
+        create_project(self.fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_LoadFit(self):
+        fit, x0, goParameters = bf.LoadFit(self.fname)
+
+        self.assertListEqual(fit['scan'], ['1_500.0_S'])
+        self.assertListEqual(fit['parameters'], [[1, 'STRUCTURAL', 'ELEMENT', 'Al', 'THICKNESS']])
+        self.assertListEqual(fit['bounds'], [(5.0, 20.0)])
+        self.assertListEqual(fit['sBounds'], [[(0.01, 0.3)]])
+        self.assertListEqual(x0, [15.0])
+        self.assertEqual(fit['sample'].structure[1]['Al'].thickness, 15)
+        self.assertEqual(goParameters['differential evolution'][0], 'best1bin')
+
+    def test_batch_fit(self):
+        output = os.path.join(self.tmp, 'results')
+        status = bf.main([self.fname, '--output-dir', output, '--seed', '1', '--scale', 'x', '--no-checkpoint'])
+        self.assertEqual(status, 0)
+
+        # the results are written to the copy of the project
+        fname = os.path.join(output, 'project.h5')
+        self.assertEqual(ds.ReadSampleHDF5(self.fname).structure[1]['Al'].thickness, 15)
+        sample = ds.ReadSampleHDF5(fname)
+        self.assertAlmostEqual(sample.structure[1]['Al'].thickness, 10, delta=0.1)
+
+        fitParams = ds.ReadFitHDF5(fname)
+        self.assertAlmostEqual(fitParams[7][0], 10, delta=0.1)
+        self.assertAlmostEqual(fitParams[3][0][0], fitParams[7][0])
+        self.assertListEqual(fitParams[3][0][1], [5.0, 20.0])
+
+        trajectory = go.ReadTrajectoryHDF5(os.path.join(output, 'project_trajectory.h5'))
+        self.assertTrue(len(trajectory['x']) > 0)
+        self.assertFalse(os.path.exists(os.path.join(output, 'project_checkpoint.pkl')))
+
+        # the same seed gives the same data fitting
+        x, fun = bf.RunFit(self.fname, seed=1, r_scale='x', checkpoint=False)
+        self.assertEqual(x[0], fitParams[7][0])
+
+    def test_fidelity(self):
+        x, fun = bf.RunFit(self.fname, seed=1, r_scale='x', checkpoint=False, fidelity=3)
+        self.assertAlmostEqual(x[0], 10, delta=0.2)
+        self.assertAlmostEqual(ds.ReadFitHDF5(self.fname)[7][0], x[0])
+
+        x, fun = bf.RunFit(self.fname, seed=1, r_scale='x', checkpoint=False, fidelity=3, subsample=0.1)
+        self.assertAlmostEqual(x[0], 10, delta=0.2)
+
+    def test_multistart(self):
+        x, fun = bf.RunFit(self.fname, algorithm='least squares', starts=4, workers=2, seed=1)
+        self.assertAlmostEqual(x[0], 10, delta=0.1)
+        self.assertEqual(len(go.return_x()), 5)
+
+    def test_uncertainty(self):
+        x, fun = bf.RunFit(self.fname, algorithm='least squares', seed=1, uncertainty='bootstrap', resamples=4, workers=2)
+
+        with h5py.File(self.fname, 'r') as f:
+            results = f['Fitting Parameters']['Results']
+            self.assertEqual(results.attrs['Uncertainty'], 'bootstrap')
+            self.assertEqual(results.attrs['Std'].shape, (1,))
+            self.assertEqual(results.attrs['Correlation'].shape, (1, 1))
+
+    def test_mcmc(self):
+        bf.RunFit(self.fname, algorithm='least squares', seed=1, mcmc_steps=10, walkers=4, workers=2,
+                  mcmc_scale=1e-3)
+
+        self.assertEqual(go.ReadChainHDF5(os.path.join(self.tmp, 'project_chain.h5'))['chain'].shape, (10, 4, 1))
+        with h5py.File(self.fname, 'r') as f:
+            results = f['Fitting Parameters']['Results']
+            self.assertAlmostEqual(results.attrs['Posterior Mean'][0], 10, delta=0.5)
+            self.assertEqual(results.attrs['Posterior Std'].shape, (1,))
+
+    def test_direct(self):
+        # the batches of the direct algorithm give the same data fitting with and without workers
+        fit, x0, goParameters = bf.LoadFit(self.fname, r_scale='x')
+        goParam = [0.0001, '60', 1000, False, 0.0001, 1e-16, 1e-6]
+        x, fun = go.direct(**fit, goParam=goParam, cb=go.FitCallback(), workers=2)
+        self.assertAlmostEqual(x[0], 10, delta=0.1)
+
+        x1, fun1 = go.direct(**fit, goParam=goParam, cb=go.FitCallback())
+        self.assertEqual(x1[0], x[0])
+        self.assertEqual(fun1, fun)
+
+    def test_workers(self):
+        # without --processes the projects are fitted one after another, each with all the workers
+        cpus = []
+        FitJob = bf._FitJob
+        bf._FitJob = lambda fname, budget, options: cpus.append(budget) or (np.array([10.0]), 0.0)
+        try:
+            status = bf.main([self.fname, self.fname, '--workers', '8'])
+        finally:
+            bf._FitJob = FitJob
+        self.assertEqual(status, 0)
+        self.assertListEqual(cpus, [8, 8])
+
+    def test_ScheduleFits(self):
+        projects = [self.fname]
+        for i in range(2):
+            fname = os.path.join(self.tmp, 'project' + str(i) + '.h5')
+            shutil.copyfile(self.fname, fname)
+            projects.append(fname)
+        projects.append(os.path.join(self.tmp, 'missing.h5'))
+
+        results = bf.ScheduleFits(projects, processes=2, cpus=1, seed=1, r_scale='x',
+                                  checkpoint=False)
+        self.assertListEqual(sorted(results.keys()), sorted(projects))
+        self.assertIsInstance(results[projects[-1]], Exception)
+        for fname in projects[:-1]:
+            x, fun = results[fname]
+            self.assertAlmostEqual(x[0], 10, delta=0.1)
+            self.assertAlmostEqual(ds.ReadFitHDF5(fname)[7][0], x[0])
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import sys
+
+# Get the parent directory of the current script's directory
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Add the parent directory to the system path
+sys.path.append(parent_dir)
+
+import numpy as np
+import UTILS.Broaden_Spectrum as bs
+import unittest
+
+# This test script can be executed by inputting
+#  ->  python -m unittest -v test_broaden_spectrum.py
+# into the terminal
+
+
+def make_spectrum():
+    # random stick spectrum with the energy dependent widths used for Ti
+    rng = np.random.default_rng(1)
+    sticks = np.zeros((800, 2))
+    sticks[:, 0] = np.sort(rng.uniform(-8, 8, 800))
+    sticks[:, 1] = rng.uniform(0, 1, 800)
+
+    gamma = [[-9999, -0.900, 2.000, 4.750, 6.500, 9999],
+             [0.064, 0.560, 1.000, 1.360, 0.888],
+             [0.3, 0.300, 0.300, 0.300, 0.300, 0.300]]
+    sigma = [[-9999, -0.750, 9999],
+             [0.200, 0.350],
+             [0.300, 0.300, 0.300]]
+
+    energies = np.linspace(-20, 20, 1000)
+    return energies, sticks, bs.GetBroadeningList(gamma, sticks[:, 0]), bs.GetBroadeningList(sigma, sticks[:, 0])
+
+
+class TestBroadenSpectrum(unittest.TestCase):
+
+    def test_fft_lorentzian(self):
+        energies, sticks, gammaVals, sigmaVals = make_spectrum()
+
+        exact = bs.BroadenGamma(energies, sticks, gammaVals)
+        fast = bs.BroadenGammaFFT(energies, sticks, gammaVals)
+        bound = bs.BroadeningErrorBound(energies, sticks, gammaVals, shape='Lorentzian')
+
+        self.assertTrue(np.array_equal(exact[:, 0], fast[:, 0]))
+        self.assertTrue(np.max(np.abs(exact[:, 1] - fast[:, 1])) <= bound)
+        self.assertTrue(bound < 0.05 * np.max(exact[:, 1]))
+
+    def test_fft_gaussian(self):
+        energies, sticks, gammaVals, sigmaVals = make_spectrum()
+
+        exact = bs.BroadenSigma(energies, sticks, sigmaVals)
+        fast = bs.BroadenSigmaFFT(energies, sticks, sigmaVals)
+        bound = bs.BroadeningErrorBound(energies, sticks, sigmaVals, shape='Gaussian')
+
+        self.assertTrue(np.max(np.abs(exact[:, 1] - fast[:, 1])) <= bound)
+        self.assertTrue(bound < 0.05 * np.max(exact[:, 1]))
+
+    def test_direct(self):
+        energies, sticks, gammaVals, sigmaVals = make_spectrum()
+
+        exact = bs.BroadenGamma(energies, sticks, gammaVals)
+        fast = bs.BroadenGammaDirect(energies, sticks, gammaVals)
+        bound = bs.BroadeningErrorBound(energies, sticks, gammaVals, shape='Lorentzian', method='direct')
+        self.assertTrue(np.max(np.abs(exact[:, 1] - fast[:, 1])) <= bound)
+
+        exact = bs.BroadenSigma(energies, sticks, sigmaVals)
+        fast = bs.BroadenSigmaDirect(energies, sticks, sigmaVals)
+        self.assertTrue(np.max(np.abs(exact[:, 1] - fast[:, 1])) < 1e-10)
+
+    def test_non_uniform_mesh(self):
+        energies, sticks, gammaVals, sigmaVals = make_spectrum()
+        energies = energies**3
+
+        with self.assertRaises(ValueError):
+            bs.BroadenGammaFFT(energies, sticks, gammaVals)
+
+
+if __name__ == "__main__":
+
+    unittest.main()
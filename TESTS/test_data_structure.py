@@ -7,8 +7,13 @@ parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(parent_dir)
 
 import numpy as np
+import shutil
+import tempfile
 import unittest
 from UTILS.data_structure import *
+import UTILS.data_structure as ds
+import UTILS.material_structure as ms
+import UTILS.material_model as mm
 
 # Define epsilon using np.finfo(float).eps
 EPS = np.sqrt(np.finfo(float).eps)
@@ -267,7 +272,356 @@ class TestMaterialStructure(unittest.TestCase):
         for i, test in enumerate(tests):
             value = evaluate_parameters(test)
             self.assertListEqual(value, solution[i])
-            
+
+    def test_ReadDataHDF5_lazy(self):
+        # lazy scan dictionaries must hold the same data and attributes as the materialized dictionaries
+        fname = os.getcwd() + '/test_data/Pim4uc_test.h5'
+
+        with h5py.File(fname, 'r') as f:
+            solution = dict()
+            for key in f['Experimental_data']['Reflectivity_Scan'].keys():
+                solution[key] = f['Experimental_data']['Reflectivity_Scan'][key]
+            for key in f['Experimental_data']['Energy_Scan'].keys():
+                solution[key] = f['Experimental_data']['Energy_Scan'][key]
+            solution = hdf5ToDict(solution)
+
+        data, data_dict, sim_dict = ReadDataHDF5(fname)
+        self.assertEqual(data_dict.loaded(), [])
+        self.assertEqual(len(data), len(solution))
+        self.assertListEqual(sorted(data_dict.keys()), sorted(solution.keys()))
+
+        for key in solution.keys():
+            self.assertTrue(np.array_equal(np.array(solution[key]['Data']), data_dict[key]['Data']))
+            self.assertListEqual(sorted(solution[key].keys()), sorted(data_dict[key].keys()))
+
+    def test_LazyScanDict_copy(self):
+        fname = os.getcwd() + '/test_data/Pim4uc_test.h5'
+
+        data, data_dict, sim_dict = LoadDataHDF5(fname)
+        name = data[0][2]
+        original = np.array(data_dict[name]['Data'])
+
+        # changing a copy must not change the original or the file
+        new_dict = copy.deepcopy(data_dict)
+        new_dict[name]['Data'][2] = 0
+        self.assertTrue(np.array_equal(original, data_dict[name]['Data']))
+        self.assertEqual(new_dict.loaded(), [name])
+
+        data, data_dict, sim_dict = LoadDataHDF5(fname)
+        self.assertTrue(np.array_equal(original, data_dict[name]['Data']))
+        self.assertEqual(len(data_dict.load_all().loaded()), len(data))
+
+        # detached scans no longer depend on the file
+        data, data_dict, sim_dict = LoadDataHDF5(fname)
+        data_dict.detach()
+        self.assertEqual(len(data_dict.loaded()), len(data))
+        self.assertTrue(np.array_equal(original, data_dict[name]['Data']))
+
+
+    def test_MigrateFileHDF5(self):
+        # the migrated file must hold the same scans in the chunked and compressed layout with a scan table
+        fname = os.getcwd() + '/test_data/Pim4uc_test.h5'
+        new_fname = os.path.join(tempfile.mkdtemp(), 'Pim4uc_migrated.h5')
+        MigrateFileHDF5(fname, new_fname)
+
+        data, data_dict, sim_dict = ReadDataHDF5(fname)
+        new_data, new_data_dict, new_sim_dict = ReadDataHDF5(new_fname)
+        self.assertTrue(np.array_equal(data, new_data))
+
+        with h5py.File(new_fname, 'r') as f:
+            self.assertEqual(f.attrs['Scan Layout'], SCAN_LAYOUT_VERSION)
+            self.assertEqual(len(f['Scan_Table']), len(data_dict) + len(sim_dict))
+            self.assertEqual(f['Experimental_data/Reflectivity_Scan'][data[0][2]].compression, 'gzip')
+            self.assertTrue('Sample' in f)
+
+        # the scans read through the table of the migrated file must match the dataset attributes of the original
+        with h5py.File(fname, 'r') as f:
+            for group, scans, new_scans in [('Experimental_data', data_dict, new_data_dict),
+                                            ('Simulated_data', sim_dict, new_sim_dict)]:
+                for key in scans.keys():
+                    scanType = 'Energy_Scan' if key in f[group]['Energy_Scan'] else 'Reflectivity_Scan'
+                    dset = f[group][scanType][key]
+                    self.assertTrue(np.array_equal(dset[()], new_scans[key]['Data']))
+                    self.assertEqual(set(new_scans[key].keys()) - {'Data'}, set(dset.attrs.keys()) - {'Fingerprint'})
+                    for attrskey, val in dset.attrs.items():
+                        if attrskey != 'Fingerprint':
+                            self.assertEqual(new_scans[key][attrskey], val)
+
+    def test_ScanTable_stale(self):
+        # attributes written by updateHDF5Data, scans renamed behind the table and attributes without a column
+        # of the table must all be read back as they are in the datasets
+        fname = os.path.join(tempfile.mkdtemp(), 'Pim4uc_table.h5')
+        MigrateFileHDF5(os.getcwd() + '/test_data/Pim4uc_test.h5', fname)
+
+        with h5py.File(fname, 'r') as f:
+            numScans = len(f['Experimental_data/Reflectivity_Scan']) + len(f['Experimental_data/Energy_Scan'])
+            first = list(f['Experimental_data/Reflectivity_Scan'].keys())[0]
+        with h5py.File(fname, 'a') as f:
+            f['Experimental_data/Reflectivity_Scan'][first].attrs['Comment'] = 'measured twice'
+
+        scalingFactor = list(np.linspace(1, 2, numScans))
+        backgroundShift = list(np.linspace(0, 1e-5, numScans))
+        updateHDF5Data(fname, scalingFactor, backgroundShift)
+
+        data, data_dict, sim_dict = ReadDataHDF5(fname)
+        self.assertEqual(data_dict[first]['Comment'], 'measured twice')
+        with h5py.File(fname, 'r') as f:
+            for scanType in ['Reflectivity_Scan', 'Energy_Scan']:
+                for key, dset in f['Experimental_data'][scanType].items():
+                    self.assertEqual(data_dict[key]['Scaling Factor'], dset.attrs['Scaling Factor'])
+                    self.assertEqual(data_dict[key]['Background Shift'], dset.attrs['Background Shift'])
+
+        # same number of scans but different names
+        with h5py.File(fname, 'a') as f:
+            f['Experimental_data/Reflectivity_Scan'].move(first, 'renamed')
+
+        data, data_dict, sim_dict = ReadDataHDF5(fname)
+        self.assertNotIn(first, data_dict)
+        self.assertEqual(data_dict['renamed']['Comment'], 'measured twice')
+
+    def test_WriteSampleHDF5_incremental(self):
+        # only the layers that changed are rewritten and the file still holds the full sample
+        fname = os.path.join(tempfile.mkdtemp(), 'Pim4uc_sample.h5')
+        shutil.copy(os.getcwd() + '/test_data/Pim4uc_test.h5', fname)
+
+        sample = ReadSampleHDF5(fname)
+        WriteSampleHDF5(fname, sample, '0.3.1')
+        with h5py.File(fname, 'r') as f:
+            fingerprints = [f['Sample']['Layer_' + str(i)].attrs['Fingerprint'] for i in range(len(sample.structure))]
+
+        ele = list(sample.structure[2].keys())[0]
+        sample.structure[2][ele].thickness = 7.5
+        WriteSampleHDF5(fname, sample, '0.3.1')
+        with h5py.File(fname, 'r') as f:
+            for i in range(len(sample.structure)):
+                changed = f['Sample']['Layer_' + str(i)].attrs['Fingerprint'] != fingerprints[i]
+                self.assertEqual(changed, i == 2)
+
+        new_sample = ReadSampleHDF5(fname)
+        self.assertEqual(new_sample.structure[2][ele].thickness, 7.5)
+        self.assertEqual(len(new_sample.structure), len(sample.structure))
+
+    def test_SimulateScans(self):
+        sample = ms.slab(2)
+        sample.addlayer(0, 'Si', 50, density=0.028)
+        sample.addlayer(1, 'Al', 10, density=0.028)
+
+        qz = np.linspace(0.01, 0.3, 100)
+        E = np.linspace(500, 600, 50)
+        sim_dict = dict()
+        for i in range(3):
+            sim_dict['R' + str(i)] = {'Data': np.array([qz, qz, qz * 0]), 'Energy': 500.0 + 50 * i, 'Polarization': 'S',
+                                      'Background Shift': 0, 'Scaling Factor': 1}
+        sim_dict['E'] = {'Data': np.array([qz[:50], qz[:50], E * 0, E]), 'Energy': 500.0, 'Angle': 10.0,
+                         'Polarization': 'P', 'Background Shift': 0, 'Scaling Factor': 1}
+
+        ClearSimulationCache()
+        serial = SimulateScans(sample, copy.deepcopy(sim_dict))
+        parallel = SimulateScans(sample, copy.deepcopy(sim_dict), processes=2)
+
+        qz_test, R = sample.reflectivity(550.0, qz)
+        self.assertTrue(np.array_equal(serial['R1']['Data'][2], R['S']))
+        for key in sim_dict.keys():
+            self.assertTrue(np.array_equal(serial[key]['Data'], parallel[key]['Data']))
+
+        # a changed sample must not be taken from the cache
+        sample.structure[1]['Al'].thickness = 20
+        changed = SimulateScans(sample, copy.deepcopy(sim_dict))
+        self.assertFalse(np.array_equal(serial['R1']['Data'][2], changed['R1']['Data'][2]))
+
+    def test_SimulateScans_cache(self):
+        sample = ms.slab(2)
+        sample.addlayer(0, 'Si', 50, density=0.028)
+        sample.addlayer(1, 'Al', 10, density=0.028)
+
+        # counts the simulations that were not taken from the cache
+        calls = []
+        reflectivity = sample.reflectivity
+        sample.reflectivity = lambda *args, **kwargs: calls.append(args) or reflectivity(*args, **kwargs)
+
+        qz = np.linspace(0.01, 0.3, 100)
+        sim_dict = dict()
+        for i in range(4):
+            sim_dict['R' + str(i)] = {'Data': np.array([qz, qz, qz * 0]), 'Energy': 500.0 + 50 * i, 'Polarization': 'S',
+                                      'Background Shift': 0, 'Scaling Factor': 1}
+
+        # the first simulation changes the sample, the same scans are still found the second time
+        ClearSimulationCache()
+        first = SimulateScans(sample, copy.deepcopy(sim_dict))
+        second = SimulateScans(sample, copy.deepcopy(sim_dict))
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(len(ds._simulationCache), 4)
+        for key in sim_dict.keys():
+            self.assertTrue(np.array_equal(first[key]['Data'], second[key]['Data']))
+
+        # the plots use the same cache
+        qz_test, R = CachedReflectivity(sample, 550.0, qz)
+        self.assertEqual(len(calls), 4)
+        self.assertTrue(np.array_equal(R['S'], first['R1']['Data'][2]))
+
+        # replacing a form factor of the database invalidates the cached results
+        al = mm.ff['Al']
+        try:
+            mm.change_ff('Al', al * 1.01)
+            changed = SimulateScans(sample, copy.deepcopy(sim_dict))
+            self.assertEqual(len(calls), 8)
+            self.assertFalse(np.array_equal(first['R1']['Data'][2], changed['R1']['Data'][2]))
+        finally:
+            mm.change_ff('Al', al)
+
+    def test_CachedReflectivity(self):
+        sample = ms.slab(2)
+        sample.addlayer(0, 'Si', 50, density=0.028)
+        sample.addlayer(1, 'Al', 10, density=0.028)
+
+        # counts the simulations that were not taken from the cache
+        calls = []
+        reflectivity = sample.reflectivity
+        sample.reflectivity = lambda *args, **kwargs: calls.append(args) or reflectivity(*args, **kwargs)
+
+        qz = np.linspace(0.01, 0.3, 100)
+        ClearSimulationCache()
+        qz_test, R = CachedReflectivity(sample, 550.0, qz, sFactor=2)
+        R['S'][:] = 0  # the caller gets a copy
+        qz_test, R = CachedReflectivity(sample, 550.0, qz, sFactor=2)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(np.array_equal(R['S'], reflectivity(550.0, qz, sFactor=2)[1]['S']))
+
+        CachedReflectivity(sample, 550.0, qz, sFactor=3)
+        CachedReflectivity(sample, 550.0, qz[:50], sFactor=2)
+        sample.structure[1]['Al'].thickness = 20
+        CachedReflectivity(sample, 550.0, qz, sFactor=2)
+        self.assertEqual(len(calls), 4)
+
+        # replacing a form factor invalidates the cached results
+        CachedReflectivity(sample, 550.0, qz, sFactor=2)
+        self.assertEqual(len(calls), 4)
+        mm.ff['Al'] = mm.ff['Al']
+        CachedReflectivity(sample, 550.0, qz, sFactor=2)
+        self.assertEqual(len(calls), 5)
+
+    def test_SampleToArray(self):
+        sample = ms.slab(3)
+        sample.addlayer(0, 'SrTiO3', 50, density=[0.028, 0.028, 0.084], roughness=[1.5, 2, 2.5])
+        sample.addlayer(1, 'LaMnO3', 15, density=[0.028, 0.028, 0.084], roughness=[0, 1, 3], linked_roughness=0.5)
+        sample.addlayer(2, 'CCO', [15, 10, 4], density=[0, 0.08, 0.05], roughness=[2, 3, 0.75])
+        sample.polymorphous(1, 'Mn', ['Mn2', 'Mn3'], [0.4, 0.6], sf=['Fe', 'Mn'])
+        sample.magnetization(1, ['Mn2', 'Mn3'], [0.01, 0.02], ['Co', 'Ni'])
+
+        records, variations, header = SampleToArray(sample)
+        self.assertEqual(len(records), 9)
+        self.assertListEqual(records['symbol'][3:6].tolist(), ['La', 'Mn', 'O'])
+        self.assertListEqual(variations['polymorph'].tolist(), ['Mn2', 'Mn3'])
+
+        new_sample = ArrayToSample(records, variations, header)
+        for layer, new_layer in zip(sample.structure, new_sample.structure):
+            self.assertListEqual(list(layer.keys()), list(new_layer.keys()))
+            for ele in layer.keys():
+                for key, val in layer[ele].__getstate__().items():
+                    self.assertTrue(np.array_equal(np.asarray(val), np.asarray(getattr(new_layer[ele], key))))
+                self.assertEqual(type(layer[ele].linked_roughness), type(new_layer[ele].linked_roughness))
+
+        thickness, density, mag_density = sample.density_profile()
+        new_thickness, new_density, new_mag_density = new_sample.density_profile()
+        self.assertTrue(np.array_equal(thickness, new_thickness))
+        for key in density.keys():
+            self.assertTrue(np.array_equal(density[key], new_density[key]))
+        for key in mag_density.keys():
+            self.assertTrue(np.array_equal(mag_density[key], new_mag_density[key]))
+
+    def test_IterReMagX(self):
+        # the scans are streamed in file order with the content of the stored parse of the file
+        my_path = os.getcwd() + '/test_data/Pim7uc.all'
+        with open(os.getcwd() + '/test_data/Pim7uc.pkl', 'rb') as f:
+            solution = pickle.load(f)
+
+        scans = IterReMagX(my_path)
+        self.assertFalse(isinstance(scans, (list, dict)))
+
+        names = list()
+        for dataset_number, scan_type, name, scan in scans:
+            names.append(name)
+            self.assertEqual(scan['DatasetNumber'], dataset_number)
+            self.assertEqual(scan_type == 'Energy', 'Angle' in scan)
+            self.assertEqual(scan['DataPoints'], len(scan['Data'][0]))
+
+            # the angles of the stored parse differ in the last digits
+            self.assertEqual(np.shape(scan['Data']), np.shape(solution[name]['Data']))
+            self.assertTrue(np.allclose(scan['Data'], solution[name]['Data'], rtol=0, atol=EPS, equal_nan=True))
+            self.assertEqual(set(scan.keys()), set(solution[name].keys()))
+            for key in scan.keys():
+                if key != 'Data':
+                    self.assertEqual(scan[key], solution[name][key])
+
+        self.assertListEqual(names, list(solution.keys()))
+
+    def test_QUAD_to_data_dict(self):
+        fname = os.path.join(tempfile.mkdtemp(), 'scans.dat')
+        with open(fname, 'w') as f:
+            f.write('5 S A 499.931 0\n0 1.0 0.01 0.5\n0 2.0 0.02 0.25\n0 3.0 0.03 0.125\n==========\n')
+            f.write('6 P E 640.2 10.5\n640.2 10.5 0.11 0.01\n640.3 10.5 0.12 0.02\n==========\n')
+
+        data_dict = QUAD_to_data_dict(fname)
+        self.assertListEqual(list(data_dict.keys()), ['5_499.93_S', '6_E640.2_Th10.5_P'])
+
+        scan = data_dict['5_499.93_S']
+        self.assertEqual(scan['DataPoints'], 3)
+        self.assertTrue(np.array_equal(scan['Data'][0], [0.01, 0.02, 0.03]))
+        self.assertTrue(np.array_equal(scan['Data'][2], [0.5, 0.25, 0.125]))
+
+        scan = data_dict['6_E640.2_Th10.5_P']
+        self.assertEqual(scan['Angle'], 10.5)
+        self.assertEqual(len(scan['Data']), 4)
+        self.assertTrue(np.array_equal(scan['Data'][3], [640.2, 640.3]))
+
+    def test_ReadDataASCII(self):
+        sample = ms.slab(2)
+        sample.addlayer(0, 'SrTiO3', 50, density=5.12, roughness=2)
+        sample.addlayer(1, 'LaMnO3', 20, density=6.5, roughness=1.5)
+        sample.scaling_factor = 1.0
+        sample.background_shift = 0.0
+
+        qz = np.linspace(0.01, 0.5, 10)
+        E = np.linspace(630, 660, 10)
+        AScans = [np.column_stack([np.full(10, 642.2), qz, qz, np.exp(-10 * qz) * (1 + 0.1 * k)]) for k in range(2)]
+        AInfo = [[1, 'S', 0, '642.2', 0], [2, 'P', 0, '642.2', 0]]
+        EScans = [np.column_stack([E, E, np.full(10, 0.1), np.full(10, 1.0 + k)]) for k in range(2)]
+        EInfo = [[3, 'L', 0, '645.0', '5.0'], [4, 'R', 0, '645.0', '5.0']]
+
+        fname = os.path.join(tempfile.mkdtemp(), 'project.all')
+        with open(fname, 'w') as f:
+            WriteSampleASCII(f, sample)
+            WriteExperimentalDataASCII(f, AScans, AInfo, EScans, EInfo)
+            f.write('# Simulation \n')
+            f.write('datasetnumber = 1 \n# comment line\ndatasettitle = 1_A_642.2_S \n')
+            f.write('datasetenergy   =   642.2 \npolarization = S \ndatasetpoints = 2 \n')
+            f.write('dataset_qz = 0.1 \ndataset_R0 = 0.5 \ndataset_qz = 0.2 \ndataset_R0 = 0.25 \n')
+
+        Sinfo, Sscan, SimInfo, SimScan, test_sample = ReadDataASCII(fname)
+
+        self.assertEqual(len(test_sample.structure), 2)
+        self.assertListEqual(list(test_sample.structure[1].keys()), ['La', 'Mn', 'O'])
+        self.assertAlmostEqual(test_sample.structure[1]['La'].density, sample.structure[1]['La'].density, 6)
+
+        # two reflectivity scans, their asymmetry, two energy scans and their asymmetry
+        self.assertListEqual([info['dataNumber'] for info in Sinfo], [1, 2, 3, 4, 5, 6])
+        self.assertListEqual([info['scanType'] for info in Sinfo], ['Reflectivity'] * 3 + ['Energy'] * 3)
+        self.assertListEqual([info['polarization'] for info in Sinfo], ['S', 'P', 'AL', 'LC', 'RC', 'AC'])
+        self.assertListEqual([info['numberPoints'] for info in Sinfo], [10, 10, 10, 10, 10, None])
+        self.assertEqual(Sinfo[3]['angle'], 5.0)
+        self.assertEqual(Sinfo[3]['energy'], 645.0)
+
+        self.assertEqual(len(Sscan), 6)
+        self.assertTrue(np.allclose(Sscan[0][0], qz, atol=1e-6))
+        self.assertTrue(np.allclose(Sscan[0][1], AScans[0][:, 3], rtol=1e-6))
+        self.assertTrue(np.allclose(Sscan[3][0], E, atol=1e-6))
+        self.assertTrue(np.allclose(Sscan[5][1], -1 / 3))
+        self.assertTrue(np.allclose(Sscan[5][2], 0.1))
+
+        self.assertEqual(len(SimInfo), 1)
+        self.assertEqual(SimInfo[0]['energy'], 642.2)
+        self.assertTrue(np.array_equal(SimScan[0][0], [0.1, 0.2]))
+        self.assertTrue(np.array_equal(SimScan[0][1], [0.5, 0.25]))            
             
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,465 @@
+import os
+import sys
+import shutil
+import pickle
+import tempfile
+
+# Get the parent directory of the current script's directory
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Add the parent directory to the system path
+sys.path.append(parent_dir)
+
+import numpy as np
+import UTILS.global_optimization as go
+import unittest
+
+# This test script can be executed by inputting
+#  ->  python -m unittest -v test_global_optimization.py
+# into the terminal
+
+
+class LinearSample():
+    # stands in for a slab, the reflectivity only depends on the scaling factor and background shift
+    def __init__(self):
+        self.scaling_factor = 1
+        self.background_shift = 0
+
+    def reflectivity(self, E, qz, bShift=0, sFactor=1, sf_dict={}, s_min=0.1, precision=1e-6):
+        R = sFactor * np.exp(-10 * qz) + bShift
+        return qz, {'S': R, 'P': R}
+
+
+def linear_fit():
+    # data fitting of the scaling factor and background shift of a single scan
+    qz = np.linspace(0.01, 0.5, 50)
+    R = 2.5 * np.exp(-10 * qz) + 0.01
+    scan = {'Data': np.array([qz, qz, R]), 'Energy': 640.0, 'Polarization': 'S'}
+    fit = dict(sample=LinearSample(), data_info=[[1, 'Reflectivity', 'scan']], data={'scan': scan}, scan=['scan'],
+               backS={'scan': 0}, scaleF={'scan': 1},
+               parameters=[['SCALING FACTOR', 'scan'], ['BACKGROUND SHIFT', 'scan']],
+               bounds=[(0.5, 5), (-0.1, 0.1)], sBounds=[[(0, 1)]], sWeights=[[1]], objective='L2-Norm',
+               shape_weight=0, r_scale='x', smooth_dict={'scan': scan}, script=[], orbitals={}, sf_dict={}, nd=1,
+               temperature=300, reflectivity_engine='PythonReflectivity', step=0.1, prec=1e-6, precE=1e-6)
+    return fit
+
+
+class StopAfter(go.FitCallback):
+    # stops the data fitting after a number of iterations
+    def __init__(self, n):
+        self.n = n
+
+    def stop_evolution(self, x, convergence):
+        self.n = self.n - 1
+        return self.n <= 0
+
+    def stop_simplicial(self, x):
+        self.n = self.n - 1
+        return self.n <= 0
+
+    def stop_annealing(self, x, f, context):
+        self.n = self.n - 1
+        return self.n <= 0
+
+    def stop_surrogate(self, x, f):
+        self.n = self.n - 1
+        return self.n <= 0
+
+    def stop_direct(self, x, f):
+        self.n = self.n - 1
+        return self.n <= 0
+
+
+class TestGlobalOptimization(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_trajectory_ring_buffer(self):
+        log = go.TrajectoryLog(maxlen=5)
+        for i in range(12):
+            log.append([i, 2 * i], cost=i)
+
+        self.assertEqual(len(log), 12)
+        self.assertEqual(log.first, 7)
+        self.assertTrue(np.array_equal(log[-1], [11, 22]))
+        self.assertTrue(np.array_equal(log[7], [7, 14]))
+        with self.assertRaises(IndexError):
+            log[6]
+
+        # slices use the iteration numbers of the whole fit
+        self.assertEqual(len(log[10:]), 2)
+        self.assertEqual(len(log[3:]), 5)
+        self.assertEqual(len(log[12:]), 0)
+
+        iterations, x = log.window()
+        self.assertTrue(np.array_equal(iterations, [8, 9, 10, 11, 12]))
+        self.assertTrue(np.array_equal(log.costs(), [7, 8, 9, 10, 11]))
+
+    def test_trajectory_file(self):
+        fname = os.path.join(self.tmp, 'fit_trajectory.h5')
+        log = go.reset_x(fname, scans=['1_A', '2_E'])
+        self.assertIs(log, go.return_x())
+
+        # the callback records the cost of a previous evaluation
+        log.evaluated(np.array([1.0, 2.0]), 0.5, [0.2, 0.3])
+        log.append(np.array([1.0, 2.0]))
+        log.append(np.array([3.0, 4.0]))
+        log.append(np.array([5.0, 6.0]), 0.1, [0.05, 0.05])
+
+        # the on-disk log is readable while the fit is still running
+        trajectory = go.ReadTrajectoryHDF5(fname)
+        self.assertListEqual(trajectory['scans'], ['1_A', '2_E'])
+        self.assertTrue(np.array_equal(trajectory['x'], [[1, 2], [3, 4], [5, 6]]))
+        self.assertTrue(np.array_equal(trajectory['cost'], [0.5, np.nan, 0.1], equal_nan=True))
+        self.assertTrue(np.array_equal(trajectory['scan_cost'][0], [0.2, 0.3]))
+        self.assertTrue(np.all(np.isnan(trajectory['scan_cost'][1])))
+        self.assertTrue(np.all(np.diff(trajectory['time']) >= 0))
+
+        go.reset_x()
+        self.assertEqual(len(go.return_x()), 0)
+        self.assertEqual(len(go.ReadTrajectoryHDF5(fname)['x']), 3)
+
+    def test_trajectory_best(self):
+        # the best parameters recorded by a callback keep their cost after many other evaluations
+        log = go.TrajectoryLog(scans=['1_A'])
+        log.evaluated(np.array([0.0, 0.0]), np.nan, [np.nan], [np.nan])
+        log.evaluated(np.array([1.0, 2.0]), 0.5, [0.4], [0.1])
+        for i in range(5000):
+            log.evaluated(np.array([i, 1.0]), 1.0 + i, [1.0 + i], [0.0])
+        log.append(np.array([1.0, 2.0]))
+        log.append(np.array([3.0, 4.0]))
+
+        telemetry = log.telemetry()
+        self.assertTrue(np.array_equal(telemetry['cost'], [0.5, np.nan], equal_nan=True))
+        self.assertTrue(np.array_equal(telemetry['scan_cost'][0], [0.4]))
+        self.assertTrue(np.array_equal(telemetry['variation'][0], [0.1]))
+
+    def test_trajectory_append(self):
+        # a resumed fit starts with the end of the on-disk log in memory, so the last iteration can be plotted
+        fname = os.path.join(self.tmp, 'fit_trajectory.h5')
+        log = go.TrajectoryLog(fname, scans=['1_A', '2_E'])
+        for i in range(4):
+            log.append([i, 2 * i], cost=i, scan_costs=[i, 0])
+        log.close()
+
+        log = go.TrajectoryLog(fname, maxlen=3, scans=['1_A', '2_E'], append=True)
+        self.assertEqual(len(log), 4)
+        self.assertEqual(log.first, 1)
+        self.assertTrue(np.array_equal(log[-1], [3, 6]))
+        self.assertEqual(len(log[:]), 3)
+        self.assertTrue(np.array_equal(log.telemetry()['iteration'], [2, 3, 4]))
+        self.assertTrue(np.array_equal(log.telemetry()['scan_cost'][:, 0], [1, 2, 3]))
+
+        log.append([4, 8], cost=4)
+        self.assertEqual(len(log), 5)
+        self.assertTrue(np.array_equal(log.costs(), [2, 3, 4]))
+        log.close()
+        self.assertEqual(len(go.ReadTrajectoryHDF5(fname)['x']), 5)
+
+    def test_trajectory_telemetry(self):
+        # the callback records the cost terms computed by the cost function
+        fname = os.path.join(self.tmp, 'fit_trajectory.h5')
+        fit = linear_fit()
+        fit['shape_weight'] = 0.5
+        goParam = ['best1bin', '5', '10', '1e-12', '0', '0.5', '1', '0.7', 'False', 'latinhypercube', 'deferred']
+        go.differential_evolution(**fit, goParam=goParam, cb=go.FitCallback(), trajectory=fname)
+
+        log = go.return_x()
+        telemetry = log.telemetry()
+        self.assertEqual(len(telemetry['iteration']), len(log))
+        self.assertEqual(telemetry['scan_cost'].shape, (len(log), 1))
+        self.assertTrue(np.all(np.isfinite(telemetry['cost'])))
+        self.assertTrue(np.all(telemetry['variation'] > 0))
+        self.assertTrue(np.allclose(telemetry['cost'], telemetry['scan_cost'][:, 0] + telemetry['variation'][:, 0]))
+
+        trajectory = go.ReadTrajectoryHDF5(fname)
+        self.assertTrue(np.array_equal(trajectory['variation'], telemetry['variation']))
+
+    def test_multistart_least_squares(self):
+        fname = os.path.join(self.tmp, 'fit_trajectory.h5')
+        fit = linear_fit()
+        fit['bounds'] = ([0.5, -0.1], [5, 0.1])
+        goParam = ['2-point', 'trf', '1e-12', '1e-12', '1e-12', '1', 'linear', '1', 'None', 'None']
+
+        solutions = go.multistart_least_squares(**fit, goParam=goParam, cb=go.FitCallback(), trajectory=fname,
+                                                x0=[1, 0], n_starts=8, sampling='sobol', seed=1)
+
+        # every start converges to the same minimum
+        self.assertEqual(len(solutions), 1)
+        self.assertEqual(solutions[0]['count'], 9)
+        self.assertTrue(np.allclose(solutions[0]['x'], [2.5, 0.01], atol=1e-4))
+        self.assertTrue(np.all(solutions[0]['std'] > 0))
+        self.assertEqual(len(go.ReadTrajectoryHDF5(fname)['x']), 9)
+
+        # the Sobol' points are not rounded up to a power of 2
+        with self.assertRaises(ValueError):
+            go.multistart_least_squares(**fit, goParam=goParam, cb=go.FitCallback(), n_starts=6, sampling='sobol')
+
+    def test_resample_uncertainty(self):
+        # two noisy scans of the same sample
+        fit = linear_fit()
+        rng = np.random.default_rng(0)
+        for name in ['scan', 'scan2']:
+            qz = np.linspace(0.01, 0.5, 50)
+            R = 2.5 * np.exp(-10 * qz) + 0.01 + rng.normal(0, 0.01, len(qz))
+            fit['data'][name] = {'Data': np.array([qz, qz, R]), 'Energy': 640.0, 'Polarization': 'S'}
+        fit.update(data_info=[[1, 'Reflectivity', 'scan'], [2, 'Reflectivity', 'scan2']], scan=['scan', 'scan2'],
+                   backS={'scan': 0, 'scan2': 0}, scaleF={'scan': 1, 'scan2': 1},
+                   parameters=[['SCALING FACTOR', 'ALL SCANS'], ['BACKGROUND SHIFT', 'ALL SCANS']],
+                   bounds=([0.5, -0.1], [5, 0.1]), sBounds=[[(0, 1)], [(0, 1)]], sWeights=[[1], [1]],
+                   smooth_dict=fit['data'])
+        goParam = ['2-point', 'trf', '1e-12', '1e-12', '1e-12', '1', 'linear', '1', 'None', 'None']
+
+        bootstrap = go.resample_uncertainty([2.5, 0.01], **fit, goParam=goParam, cb=go.FitCallback(),
+                                            method='bootstrap', n_samples=20, seed=1)
+        self.assertEqual(bootstrap['x'].shape, (20, 2))
+        self.assertTrue(np.allclose(bootstrap['mean'], [2.5, 0.01], atol=0.05))
+        self.assertTrue(np.all(bootstrap['std'] > 0) and np.all(bootstrap['std'] < 0.05))
+        self.assertTrue(np.allclose(np.diag(bootstrap['correlation']), 1))
+        self.assertTrue(bootstrap['correlation'][0, 1] < 0)  # a larger scaling factor needs a lower background
+
+        jackknife = go.resample_uncertainty([2.5, 0.01], **fit, goParam=goParam, cb=go.FitCallback(),
+                                            method='jackknife')
+        self.assertEqual(jackknife['x'].shape, (2, 2))
+        self.assertTrue(np.all(jackknife['std'] > 0))
+
+    def test_FidelitySchedule(self):
+        schedule = go.FidelitySchedule(0.1, 1e-6, 1e-8, levels=3, patience=2)
+        self.assertTrue(np.allclose(schedule.current(), [0.4, 1e-4, 1e-6]))
+
+        # the precision is refined once the cost stops improving
+        self.assertFalse(schedule.update(1.0, [1.0, 2.0]))
+        self.assertFalse(schedule.update(0.5, [0.5, 2.0]))
+        self.assertFalse(schedule.update(0.5, [0.5, 2.0]))
+        self.assertTrue(schedule.update(0.5, [0.5, 2.0]))
+        schedule.refine()
+        self.assertTrue(np.allclose(schedule.current(), [0.2, 1e-5, 1e-7]))
+
+        # or once the population has converged, the last level is the precision of the data fitting
+        self.assertTrue(schedule.update(0.5, [0.5, 0.5001]))
+        schedule.refine()
+        self.assertTrue(np.allclose(schedule.current(), [0.1, 1e-6, 1e-8]))
+        self.assertFalse(schedule.update(0.5, [0.5, 0.5]))
+
+    def test_subsample(self):
+        fit = linear_fit()
+        fit['sBounds'] = [[(0.1, 0.3), (0.3, 0.5)]]
+        schedule = go.FidelitySchedule(0.1, 1e-6, 1e-8, levels=3, fraction=0.2, seed=1)
+        data, smooth_dict = schedule.subsample(fit['data'], fit['smooth_dict'], fit['data_info'], fit['sBounds'])
+
+        # one point of each stratum within the boundaries
+        qz = data['scan']['Data'][0]
+        all_qz = fit['data']['scan']['Data'][0]
+        n = [np.sum((all_qz > 0.1) & (all_qz < 0.3)), np.sum((all_qz >= 0.3) & (all_qz < 0.5))]
+        self.assertEqual(len(qz), np.ceil(0.2 * n[0]) + np.ceil(0.2 * n[1]))
+        self.assertTrue(np.all((qz > 0.1) & (qz < 0.5)))
+        self.assertTrue(np.array_equal(smooth_dict['scan']['Data'], data['scan']['Data']))
+        self.assertEqual(fit['data']['scan']['Data'].shape, (3, 50))
+
+        # the same subset for the same seed and level, all the data points at the last level
+        same, _ = go.FidelitySchedule(0.1, 1e-6, 1e-8, levels=3, fraction=0.2, seed=1).subsample(
+            fit['data'], fit['smooth_dict'], fit['data_info'], fit['sBounds'])
+        self.assertTrue(np.array_equal(same['scan']['Data'], data['scan']['Data']))
+        schedule.refine()
+        fraction = np.sqrt(0.2)
+        self.assertEqual(len(schedule.subsample(fit['data'], fit['smooth_dict'], fit['data_info'],
+                                                fit['sBounds'])[0]['scan']['Data'][0]),
+                         np.ceil(fraction * n[0]) + np.ceil(fraction * n[1]))
+        schedule.refine()
+        self.assertIs(schedule.subsample(fit['data'], fit['smooth_dict'], fit['data_info'], fit['sBounds'])[0],
+                      fit['data'])
+
+    def test_differential_evolution_subsample(self):
+        goParam = ['best1bin', '40', '10', '1e-12', '0', '0.5', '1', '0.7', 'True', 'latinhypercube', 'deferred']
+        x, fun = go.differential_evolution(**linear_fit(), goParam=goParam, cb=go.FitCallback(), seed=1,
+                                           subsample=0.1)
+        self.assertTrue(np.allclose(x, [2.5, 0.01], atol=1e-4))
+
+        # stopped at the first level, the cost function value uses all the data points
+        fit = linear_fit()
+        x, fun = go.differential_evolution(**fit, goParam=goParam, cb=StopAfter(2), seed=1, subsample=0.1)
+        params = [fit['sample'], fit['data_info'], fit['data'], fit['backS'], fit['scaleF'], fit['parameters'],
+                  fit['sBounds'], fit['sWeights'], fit['objective'], fit['shape_weight'], False, fit['r_scale'],
+                  fit['smooth_dict'], fit['script'], False, fit['orbitals'], fit['sf_dict'], fit['nd'],
+                  fit['temperature'], fit['reflectivity_engine'], fit['step'], fit['prec'], fit['precE']]
+        self.assertEqual(fun, go.scanCompute(x, *params))
+
+    def test_differential_evolution_fidelity(self):
+        # the last level runs at the precision of the data fitting
+        goParam = ['best1bin', '40', '10', '1e-12', '0', '0.5', '1', '0.7', 'True', 'latinhypercube', 'deferred']
+        x, fun = go.differential_evolution(**linear_fit(), goParam=goParam, cb=go.FitCallback(), seed=1, fidelity=3)
+        self.assertTrue(np.allclose(x, [2.5, 0.01], atol=1e-4))
+
+        # the callback stops every level
+        cb = StopAfter(2)
+        go.differential_evolution(**linear_fit(), goParam=goParam, cb=cb, seed=1, fidelity=3)
+        self.assertEqual(cb.n, 0)
+
+    def test_surrogate(self):
+        fname = os.path.join(self.tmp, 'fit_trajectory.h5')
+        goParam = ['100', '4', 'None']
+
+        x, fun = go.surrogate(**linear_fit(), goParam=goParam, cb=go.FitCallback(), trajectory=fname, seed=1)
+        self.assertTrue(fun < 1e-3)
+        self.assertTrue(np.allclose(x, [2.5, 0.01], atol=0.1))
+
+        # every iteration is recorded, the evaluations are only spent where the surrogate predicts an improvement
+        trajectory = go.ReadTrajectoryHDF5(fname)
+        self.assertTrue(len(trajectory['x']) > 0)
+        self.assertTrue(np.all(np.diff(trajectory['cost']) <= 0))
+
+        # the callback stops the optimization after two iterations
+        cb = StopAfter(2)
+        go.surrogate(**linear_fit(), goParam=goParam, cb=cb, seed=1)
+        self.assertEqual(cb.n, 0)
+
+        # a fixed parameter (equal boundaries) is evaluated at its value only
+        shifts = []
+
+        class ShiftSample(LinearSample):
+            def reflectivity(self, E, qz, bShift=0, sFactor=1, **kwargs):
+                shifts.append(bShift)
+                return LinearSample.reflectivity(self, E, qz, bShift=bShift, sFactor=sFactor)
+
+        fit = linear_fit()
+        fit['sample'] = ShiftSample()
+        fit['bounds'] = [(0.5, 5), (0.01, 0.01)]
+        x, fun = go.surrogate(**fit, goParam=['20', '4', 'None'], cb=go.FitCallback(), seed=1)
+        self.assertTrue(len(shifts) > 0)
+        self.assertTrue(np.all(np.array(shifts) == 0.01))
+        self.assertEqual(x[1], 0.01)
+
+    def test_direct(self):
+        fname = os.path.join(self.tmp, 'fit_trajectory.h5')
+
+        for local in ['False', 'True']:
+            goParam = ['1e-4', 'None', '1000', local, '1e-4', '1e-16', '1e-6']
+            x, fun = go.direct(**linear_fit(), goParam=goParam, cb=go.FitCallback(), trajectory=fname)
+            self.assertTrue(fun < 1e-6)
+            self.assertTrue(np.allclose(x, [2.5, 0.01], atol=1e-2))
+            self.assertTrue(np.all(np.diff(go.ReadTrajectoryHDF5(fname)['cost']) <= 0))
+
+        # the data fitting stops close to a known minimum of the cost function
+        goParam = ['1e-4', 'None', '1000', 'False', '1e-4', '1e-16', '1e-6']
+        x, fun = go.direct(**linear_fit(), goParam=goParam, cb=go.FitCallback(), f_min=0)
+        self.assertTrue(fun < 1e-4)
+        self.assertTrue(len(go.return_x()) < 30)
+
+        # the callback stops the optimization after two iterations
+        cb = StopAfter(2)
+        go.direct(**linear_fit(), goParam=['1e-4', 'None', '1000', 'False', '1e-4', '1e-16', '1e-6'], cb=cb)
+        self.assertEqual(cb.n, 0)
+
+    def test_mcmc_resume(self):
+        fname = os.path.join(self.tmp, 'fit_chain.h5')
+        fit = linear_fit()
+
+        # a chain continued from its file is the same as an uninterrupted chain
+        go.mcmc(**fit, goParam=None, cb=None, x0=[2.5, 0.01], n_walkers=8, n_steps=20, scale=1e-3, seed=1,
+                chain=fname)
+        self.assertEqual(go.ReadChainHDF5(fname)['chain'].shape, (20, 8, 2))
+        resumed = go.mcmc(**fit, goParam=None, cb=None, x0=[2.5, 0.01], n_walkers=8, n_steps=40, scale=1e-3,
+                          seed=1, chain=fname, resume=True)
+        chain = go.mcmc(**fit, goParam=None, cb=None, x0=[2.5, 0.01], n_walkers=8, n_steps=40, scale=1e-3, seed=1)
+
+        self.assertEqual(resumed['chain'].shape, (40, 8, 2))
+        self.assertTrue(np.array_equal(resumed['chain'], chain['chain']))
+
+        # a chain interrupted before its first step starts again with the same walkers
+        go.mcmc(**fit, goParam=None, cb=None, x0=[2.5, 0.01], n_walkers=8, n_steps=0, scale=1e-3, seed=1,
+                chain=fname)
+        self.assertEqual(go.ReadChainHDF5(fname)['acceptance'].shape, (8,))
+        resumed = go.mcmc(**fit, goParam=None, cb=None, x0=[2.5, 0.01], n_walkers=8, n_steps=40, scale=1e-3,
+                          seed=2, chain=fname, resume=True)
+        self.assertTrue(np.array_equal(resumed['chain'], chain['chain']))
+        self.assertTrue(np.array_equal(resumed['log_prob'], chain['log_prob']))
+        self.assertTrue(np.allclose(resumed['acceptance'], chain['acceptance']))
+        self.assertListEqual(resumed['parameters'], fit['parameters'])
+
+        self.assertTrue(np.all(chain['acceptance'] > 0) and np.all(chain['acceptance'] < 1))
+        self.assertTrue(np.all(chain['chain'][:, :, 0] >= 0.5) and np.all(chain['chain'][:, :, 0] <= 5))
+        self.assertTrue(np.allclose(np.mean(chain['chain'][20:], axis=(0, 1)), [2.5, 0.01], atol=0.1))
+
+    def test_differential_evolution_resume(self):
+        fname = os.path.join(self.tmp, 'fit_checkpoint.pkl')
+        goParam = ['best1bin', '40', '10', '1e-12', '0', '0.5', '1', '0.7', 'False', 'latinhypercube', 'deferred']
+
+        go.differential_evolution(**linear_fit(), goParam=goParam, cb=StopAfter(3), checkpoint=fname,
+                                  checkpoint_interval=0)
+        with open(fname, 'rb') as f:
+            checkpoint = pickle.load(f)
+        self.assertFalse(checkpoint['Finished'])
+        self.assertEqual(checkpoint['State']['nit'], 3)
+        self.assertEqual(checkpoint['State']['population'].shape, (20, 2))
+        self.assertIsInstance(checkpoint['Config']['sample'], LinearSample)
+
+        x, fun = go.resume(fname, checkpoint_interval=0)
+        with open(fname, 'rb') as f:
+            checkpoint = pickle.load(f)
+        self.assertTrue(checkpoint['Finished'])
+        self.assertTrue(checkpoint['State']['nit'] > 3)
+        self.assertTrue(fun < 1e-3)
+        self.assertTrue(np.allclose(x, [2.5, 0.01], atol=0.05))
+
+        # a finished data fitting returns its result
+        self.assertTrue(np.array_equal(go.resume(fname)[0], x))
+
+    def test_dual_annealing_resume(self):
+        fname = os.path.join(self.tmp, 'fit_checkpoint.pkl')
+        goParam = ['1000', '5230', '2e-5', '2.62', '-5', '300', 'False']
+
+        go.dual_annealing(**linear_fit(), goParam=goParam, cb=StopAfter(2), checkpoint=fname, checkpoint_interval=0)
+        with open(fname, 'rb') as f:
+            state = pickle.load(f)['State']
+        self.assertTrue(0 < state['nfev'] < 300)
+
+        # the resumed annealing only uses the function evaluations that were left
+        x, fun = go.resume(fname)
+        self.assertTrue(fun <= state['fun'])
+        with open(fname, 'rb') as f:
+            checkpoint = pickle.load(f)
+        self.assertTrue(checkpoint['Finished'])
+        self.assertEqual(checkpoint['State']['nfev'], 300)
+
+    def test_interrupted_fit(self):
+        # an exception during the data fitting closes the trajectory and saves the checkpoint
+        fname = os.path.join(self.tmp, 'fit_checkpoint.pkl')
+        trajectory = os.path.join(self.tmp, 'fit_trajectory.h5')
+        goParam = ['1000', '5230', '2e-5', '2.62', '-5', '300', 'False']
+
+        class Interrupt(go.FitCallback):
+            def stop_annealing(self, x, f, context):
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            go.dual_annealing(**linear_fit(), goParam=goParam, cb=Interrupt(), trajectory=trajectory,
+                              checkpoint=fname, checkpoint_interval=3600)
+        with open(fname, 'rb') as f:
+            checkpoint = pickle.load(f)
+        self.assertFalse(checkpoint['Finished'])
+        self.assertTrue(checkpoint['State']['nfev'] > 0)
+        go.reset_x(trajectory).close()  # the trajectory can be written again
+
+        go.resume(fname)
+        with open(fname, 'rb') as f:
+            self.assertTrue(pickle.load(f)['Finished'])
+
+    def test_shgo_resume(self):
+        fname = os.path.join(self.tmp, 'fit_checkpoint.pkl')
+        goParam = ['32', '3', 'sobol']
+
+        x, fun = go.shgo(**linear_fit(), goParam=goParam, cb=go.FitCallback(), checkpoint=fname,
+                         checkpoint_interval=0)
+        with open(fname, 'rb') as f:
+            checkpoint = pickle.load(f)
+        self.assertTrue(checkpoint['Finished'])
+        self.assertEqual(checkpoint['State']['fun'], fun)
+        self.assertTrue(checkpoint['State']['nfev'] > 32)
+
+
+if __name__ == "__main__":
+
+    unittest.main()
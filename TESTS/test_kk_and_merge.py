@@ -0,0 +1,76 @@
+import os
+import sys
+
+# Get the parent directory of the current script's directory
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Add the parent directory to the system path
+sys.path.append(parent_dir)
+
+import numpy as np
+import UTILS.KK_And_Merge as kk
+from UTILS import DATA_DIR
+import unittest
+
+# This test script can be executed by inputting
+#  ->  python -m unittest -v test_kk_and_merge.py
+# into the terminal
+
+
+class TestKramersKronig(unittest.TestCase):
+
+    def setUp(self):
+        # off-resonance Ti form factor bundled with GO-RXR
+        spec = kk.GetSpecFromFile(os.path.join(DATA_DIR, 'Ti.ff'))
+        self.E = spec[0]
+        self.f2 = spec[2]
+        self.offset = kk.GetOffset('Ti')
+
+    def test_windowed_matches_slow(self):
+        solution = kk.KK_RobertSlow(self.E, self.f2, self.offset)
+        test_case = kk.KK(self.E, self.f2, self.offset, method='windowed')
+
+        self.assertTrue(np.max(np.abs(solution - test_case)) < 1e-9)
+
+    def test_numba_matches_robert(self):
+        solution = kk.KK_Robert(self.E, self.f2, self.offset)
+        test_case = kk.KK(self.E, self.f2, self.offset, method='numba')
+
+        self.assertTrue(np.max(np.abs(solution - test_case)) < 1e-9)
+
+    def test_numba_close_to_slow(self):
+        # the dist condition of KK_RobertSlow is an approximation of the full log expressions
+        solution = kk.KK_RobertSlow(self.E, self.f2, self.offset)
+        test_case = kk.KK_Numba(self.E, self.f2, self.offset)
+
+        self.assertTrue(np.max(np.abs(solution - test_case)) < 0.1)
+
+    def test_off_resonance_merge(self):
+        # cached tail contributions must give the same merge as the full transform
+        table = kk.GetOffResTable('Ti.ff')
+        self.assertIs(table, kk.GetOffResTable(os.path.join(DATA_DIR, 'Ti.ff')))
+
+        E = np.linspace(430, 490, 1500)
+        f2 = 2 + np.exp(-(E - 460) ** 2 / 4)
+
+        for dist in [None, 10]:
+            mergedE, mergedf1, mergedf2 = table.merge(E, f2, 443, 479, self.offset, dist)
+
+            window = (E > 443) & (E < 479)
+            low = self.E < 443
+            high = self.E > 479
+            solutionE = np.hstack((self.E[low], E[window], self.E[high]))
+            solutionf2 = np.hstack((self.f2[low], f2[window], self.f2[high]))
+            solutionf1 = kk.KK_Numba(solutionE, solutionf2, self.offset, dist)
+
+            self.assertTrue(np.array_equal(solutionE, mergedE))
+            self.assertTrue(np.array_equal(solutionf2, mergedf2))
+            self.assertTrue(np.max(np.abs(solutionf1 - mergedf1)) < 1e-9)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            kk.KK(self.E, self.f2, self.offset, method='fourier')
+
+
+if __name__ == "__main__":
+
+    unittest.main()
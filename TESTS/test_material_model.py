@@ -8,6 +8,8 @@ sys.path.append(parent_dir)
 
 import UTILS.material_model as mm
 import numpy as np
+import pickle
+import copy
 import UTILS.material_structure as ms
 import unittest
 
@@ -263,5 +265,37 @@ class TestMaterialModel(unittest.TestCase):
         self.assertTrue(total_delta < 1e-7)
         self.assertTrue(total_beta < 1e-7)
 
+    def test_form_factor_store(self):
+        # database entries are only read on first lookup and must match the pickled database
+        store = mm.FormFactorStore(os.path.join(mm.ROOT_DIR, 'DATA/form_factor.h5'))
+        self.assertEqual(store.loaded(), [])
+        self.assertEqual(len(store), 104)
+        self.assertTrue('Mn' in store)
+        self.assertEqual(store.loaded(), [])
+
+        with open(os.path.join(mm.ROOT_DIR, 'DATA/form_factor.pkl'), 'rb') as f:
+            solution = pickle.load(f)
+        self.assertTrue(np.array_equal(solution['Mn']['Data'], store['Mn']))
+        self.assertEqual(store.loaded(), ['Mn'])
+
+        with self.assertRaises(KeyError):
+            store['Mn2']
+
+    def test_form_factor_store_copy(self):
+        # change_ff semantics: assigned form factors override the database and copies are independent
+        store = mm.FormFactorStore(os.path.join(mm.ROOT_DIR, 'DATA/form_factor.h5'))
+        store_copy = copy.copy(store)
+        store_copy['Mn2'] = np.zeros((3, 3))
+        store_copy['Mn'] = np.ones((3, 3))
+
+        self.assertFalse('Mn2' in store)
+        self.assertTrue('Mn2' in store_copy)
+        self.assertEqual(store['Mn'].shape[1], 3)
+        self.assertTrue(np.array_equal(store_copy['Mn'], np.ones((3, 3))))
+
+        restored = pickle.loads(pickle.dumps(store_copy))
+        self.assertTrue(np.array_equal(restored['Mn2'], np.zeros((3, 3))))
+        self.assertTrue(np.array_equal(restored['O'], store['O']))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -558,6 +558,35 @@ class TestMaterialStructure(unittest.TestCase):
                 value = sample.mag_eShift[test_key]
                 self.assertEqual(value, mag_eShift[test_key])
 
+    def test_element_slots(self):
+        # elements store their attributes in slots and still pickle and copy with all attributes
+        sample = ms.slab(2)
+        sample.addlayer(0, 'SrTiO3', 50, density=[0.028, 0.028, 0.084], roughness=[1.5, 2, 2.5])
+        sample.addlayer(1, 'LaMnO3', 15, density=[0.028, 0.028, 0.084], roughness=[0, 1, 3])
+        sample.polymorphous(1, 'Mn', ['Mn2', 'Mn3'], [0.4, 0.6], sf=['Fe', 'Mn'])
+
+        ele = sample.structure[1]['Mn']
+        self.assertFalse(hasattr(ele, '__dict__'))
+        with self.assertRaises(AttributeError):
+            ele.color = 'red'
+
+        new_ele = pickle.loads(pickle.dumps(ele))
+        self.assertListEqual(new_ele.polymorph, ['Mn2', 'Mn3'])
+        self.assertTrue(np.array_equal(new_ele.poly_ratio, [0.4, 0.6]))
+        self.assertEqual(new_ele.thickness, ele.thickness)
+
+        # state of an element pickled with an attribute dictionary
+        old_ele = ms.element.__new__(ms.element)
+        old_ele.__setstate__((None, {'name': 'Mn', 'density': 0.028}))
+        self.assertEqual(old_ele.density, 0.028)
+
+        # the density profile of a pickled sample is unchanged
+        thickness, density, mag_density = sample.density_profile()
+        new_thickness, new_density, new_mag_density = pickle.loads(pickle.dumps(sample)).density_profile()
+        self.assertTrue(np.array_equal(thickness, new_thickness))
+        for key in density.keys():
+            self.assertTrue(np.array_equal(density[key], new_density[key]))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import sys
+import pickle
+
+# Get the parent directory of the current script's directory
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Add the parent directory to the system path
+sys.path.append(parent_dir)
+
+import numpy as np
+import UTILS.Ti34_XAS_Python as ti
+from UTILS import DATA_DIR
+import unittest
+
+# This test script can be executed by inputting
+#  ->  python -m unittest -v test_ti34_xas.py
+# into the terminal
+
+
+class TestTi34XAS(unittest.TestCase):
+
+    def test_operator_store_lazy(self):
+        store = ti.OperatorStore(os.path.join(DATA_DIR, 'Ti34OpsPython.npz'))
+        self.assertEqual(store.loaded(), [])
+
+        M = store['p6d0_Oppz2']
+        self.assertEqual(store.loaded(), ['p6d0_Oppz2'])
+        self.assertIs(M, store['p6d0_Oppz2'])
+
+        with self.assertRaises(KeyError):
+            store['p6d0_missing']
+
+    def test_operator_store_matches_pickle(self):
+        with open(os.path.join(DATA_DIR, 'Ti34OpsPython.pkl'), 'rb') as f:
+            solution = pickle.load(f)
+
+        store = ti.OperatorStore(os.path.join(DATA_DIR, 'Ti34OpsPython.npz'))
+        self.assertListEqual(sorted(solution.keys()), store.keys())
+
+        for name in solution.keys():
+            self.assertEqual(solution[name].shape, store[name].shape)
+            self.assertEqual(solution[name].dtype, store[name].dtype)
+            self.assertEqual((solution[name] != store[name]).nnz, 0)
+
+    def test_pickle_fallback(self):
+        store = ti.OperatorStore(os.path.join(DATA_DIR, 'missing.npz'),
+                                 fallback=os.path.join(DATA_DIR, 'Ti34OpsPython.pkl'))
+        self.assertTrue('p5d1_TXASx' in store)
+        self.assertEqual(len(store), 76)
+
+    def test_form_factor(self):
+        ff = ti.GetTiFormFactor(0.1, 0, 0.2, 0)
+
+        self.assertEqual(ff.shape[1], 5)
+        self.assertTrue(np.all(np.isfinite(ff)))
+        self.assertTrue(np.all(np.diff(ff[:, 0]) > 0))
+
+    def test_unknown_broadening(self):
+        # engine names are case sensitive, a misspelled engine must not fall back to the exact sums
+        with self.assertRaises(ValueError):
+            ti.GetTiFormFactor(0.1, 0, 0.2, 0, broadening='FFT')
+
+
+if __name__ == "__main__":
+
+    unittest.main()
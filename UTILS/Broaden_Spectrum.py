@@ -1,5 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
+import scipy.fft as sfft
+from numba import njit
 
 
  
@@ -33,10 +35,236 @@ def BroadenSigma(eVals,inSpec,SigmaList):
         specBroad[:,1] = specBroad[:,1] + inSpec[j,1]/SigmaList[j,1]*cfact/np.sqrt(2*np.pi)*np.exp(-(eVals-inSpec[j,0])**2/(2*SigmaList[j,1]*SigmaList[j,1]/cfact/cfact)) * (eVals[1] - eVals[0])
         
     return specBroad
-    
 
 
+#-----------------------------------------------------------------------------
+# Fast broadening engines
+#
+# BroadenGamma/BroadenSigma above are the reference (exact) sums, O(sticks x mesh).
+# The FFT engine groups the sticks into a small number of constant-width
+# classes, bins each class onto an (oversampled) uniform grid and convolves
+# every class with its own kernel in a single batched FFT. The direct engine
+# is a numba loop that only visits the mesh points within cutoff*FWHM of a stick.
+# BroadeningErrorBound returns a rigorous bound on max|fast - exact| for either.
+#-----------------------------------------------------------------------------
+
+cfactGauss = 2*np.sqrt(2*np.log(2)) #FWHM = cfactGauss*sigma
+
+
+def LorentzKernel(x,G,dE):
+    #Lorentzian with FWHM G evaluated at offset x, same normalization as BroadenGamma
+    return (G/np.pi/2)/(x*x+G*G/4)*dE
+
+
+def GaussKernel(x,S,dE):
+    #Gaussian with FWHM S evaluated at offset x, same normalization as BroadenSigma
+    return cfactGauss/(S*np.sqrt(2*np.pi))*np.exp(-x*x*cfactGauss*cfactGauss/(2*S*S))*dE
+
+
+def _CheckUniform(eVals):
+    #the FFT engine needs a uniform, increasing energy mesh
+    eVals = np.asarray(eVals, dtype=float)
+    if len(eVals) < 2:
+        raise ValueError('Energy mesh must contain at least two points')
+    dE = eVals[1]-eVals[0]
+    if dE <= 0 or not np.allclose(np.diff(eVals), dE, rtol=1e-6, atol=1e-12):
+        raise ValueError('FFT broadening requires a uniform, increasing energy mesh')
+    return eVals, dE
+
+
+def _CheckWidths(inSpec,WidthList):
+    #returns stick positions, amplitudes and widths as flat arrays
+    inSpec = np.asarray(inSpec, dtype=float)
+    widths = np.asarray(WidthList, dtype=float)[:,1]
+    if len(widths) != len(inSpec):
+        raise ValueError('Width list and spectrum must have the same length')
+    if np.any(widths <= 0):
+        raise ValueError('Broadening widths must be strictly positive')
+    return inSpec[:,0], inSpec[:,1], widths
+
+
+def WidthClasses(widths,nWidths=32):
+    #Piecewise-constant width classes, geometrically spaced between the smallest and largest width.
+    #Each stick is split linearly between the two classes that bracket its width.
+    #Returns (levels, lower class index, weight on the upper class)
+    widths = np.asarray(widths, dtype=float)
+    wmin = np.min(widths)
+    wmax = np.max(widths)
+    if nWidths < 2 or wmax <= wmin*(1+1e-12):
+        return np.array([wmin]), np.zeros(len(widths), dtype=int), np.zeros(len(widths))
+
+    levels = np.geomspace(wmin, wmax, nWidths)
+    k = np.searchsorted(levels, widths, side='right') - 1
+    k = np.clip(k, 0, nWidths-2)
+    t = (widths - levels[k])/(levels[k+1]-levels[k])
+    return levels, k, np.clip(t, 0, 1)
+
+
+def BinSticks(grid0,h,nGrid,positions,weights,rows=None,nRows=1):
+    #linear (cloud-in-cell) deposit of sticks onto the uniform grid grid0 + h*arange(nGrid)
+    #rows optionally sends each stick to its own row of an (nRows, nGrid) array
+    x = (np.asarray(positions, dtype=float)-grid0)/h
+    i0 = np.clip(np.floor(x).astype(int), 0, nGrid-2)
+    t = x - i0
+    if rows is not None:
+        i0 = i0 + np.asarray(rows)*nGrid
+    binned = np.bincount(i0, weights=weights*(1-t), minlength=nRows*nGrid)
+    binned = binned + np.bincount(i0+1, weights=weights*t, minlength=nRows*nGrid)
+    binned = binned[:nRows*nGrid]
+    if rows is not None:
+        return binned.reshape(nRows, nGrid)
+    return binned
+
+
+def _BroadenFFT(eVals,inSpec,WidthList,kernel,nWidths,oversample):
+    eVals, dE = _CheckUniform(eVals)
+    pos, amp, widths = _CheckWidths(inSpec, WidthList)
+
+    specBroad = np.zeros((len(eVals),2))
+    specBroad[:,0] = eVals
+    if len(pos) == 0:
+        return specBroad
+
+    #fine grid aligned with eVals and extended to cover every stick
+    oversample = max(int(oversample), 1)
+    h = dE/oversample
+    nLow = max(int(np.ceil((eVals[0]-np.min(pos))/h)), 0)
+    nHigh = max(int(np.ceil((np.max(pos)-eVals[-1])/h)), 0)
+    grid0 = eVals[0] - nLow*h
+    nGrid = nLow + (len(eVals)-1)*oversample + 1 + nHigh
+
+    levels, k, t = WidthClasses(widths, nWidths)
+    nClass = len(levels)
+
+    #bin every width class onto its own row
+    if nClass > 1:
+        binned = BinSticks(grid0, h, nGrid, np.concatenate((pos, pos)), np.concatenate((amp*(1-t), amp*t)),
+                           rows=np.concatenate((k, k+1)), nRows=nClass)
+    else:
+        binned = BinSticks(grid0, h, nGrid, pos, amp, rows=k, nRows=1)
+
+    #linear convolution through a zero padded circular one
+    nFFT = sfft.next_fast_len(2*nGrid-1, real=True)
+    offsets = np.zeros(nFFT)
+    offsets[:nGrid] = np.arange(nGrid)*h
+    offsets[nFFT-nGrid+1:] = -np.arange(nGrid-1, 0, -1)*h
+    kernels = kernel(offsets[None,:], levels[:,None], dE)
+
+    total = np.sum(sfft.rfft(binned, nFFT, axis=1)*sfft.rfft(kernels, axis=1), axis=0)
+    conv = sfft.irfft(total, nFFT)[:nGrid]
+
+    specBroad[:,1] = conv[nLow:nLow+(len(eVals)-1)*oversample+1:oversample]
+    return specBroad
+
+
+def BroadenGammaFFT(eVals,inSpec,GammaList,nWidths=32,oversample=4):
+    #Lorentzian broadening, FFT engine. eVals must be uniform.
+    return _BroadenFFT(eVals, inSpec, GammaList, LorentzKernel, nWidths, oversample)
+
+
+def BroadenSigmaFFT(eVals,inSpec,SigmaList,nWidths=32,oversample=4):
+    #Gaussian broadening, FFT engine. eVals must be uniform.
+    return _BroadenFFT(eVals, inSpec, SigmaList, GaussKernel, nWidths, oversample)
+
+
+@njit()
+def _DirectSum(eVals,pos,amp,widths,cutoff,lorentz,dE):
+    #truncated direct sum, each stick only touches eVals within cutoff*FWHM
+    out = np.zeros(len(eVals))
+    cfact = 2*np.sqrt(2*np.log(2))
+    for j in range(len(pos)):
+        G = widths[j]
+        lo = np.searchsorted(eVals, pos[j]-cutoff*G)
+        hi = np.searchsorted(eVals, pos[j]+cutoff*G, side='right')
+        for i in range(lo, hi):
+            x = eVals[i]-pos[j]
+            if lorentz:
+                out[i] += amp[j]*(G/np.pi/2)/(x*x+G*G/4)*dE
+            else:
+                out[i] += amp[j]*cfact/(G*np.sqrt(2*np.pi))*np.exp(-x*x*cfact*cfact/(2*G*G))*dE
+    return out
+
+
+def _BroadenDirect(eVals,inSpec,WidthList,lorentz,cutoff):
+    eVals = np.asarray(eVals, dtype=float)
+    pos, amp, widths = _CheckWidths(inSpec, WidthList)
+    specBroad = np.zeros((len(eVals),2))
+    specBroad[:,0] = eVals
+    specBroad[:,1] = _DirectSum(eVals, np.ascontiguousarray(pos), np.ascontiguousarray(amp),
+                                np.ascontiguousarray(widths), float(cutoff), lorentz, eVals[1]-eVals[0])
+    return specBroad
+
+
+def BroadenGammaDirect(eVals,inSpec,GammaList,cutoff=50.0):
+    #Lorentzian broadening, numba direct sum truncated at cutoff*FWHM
+    return _BroadenDirect(eVals, inSpec, GammaList, True, cutoff)
+
+
+def BroadenSigmaDirect(eVals,inSpec,SigmaList,cutoff=5.0):
+    #Gaussian broadening, numba direct sum truncated at cutoff*FWHM
+    return _BroadenDirect(eVals, inSpec, SigmaList, False, cutoff)
+
+
+def _ErrorEnvelope(x,Ga,Gb,width,h,dE,lorentz):
+    #pointwise bound on |FFT - exact| for sticks at offset x (2D arrays), FFT engine.
+    #width interpolation: (G-Ga)(Gb-G)/2 * max |d2K/dG2| over [Ga,Gb]
+    #binning:             h^2/8 * max |d2K/dx2| within h of x, for both bracketing classes
+    ax = np.abs(x)
+    xs = np.maximum(ax-h, 0)
+    if lorentz:
+        d2G = 3*Gb/(4*np.pi)*(x*x+Gb*Gb/4)/(x*x+Ga*Ga/4)**3*dE
+        d2x = 6*Gb/(2*np.pi)*(xs*xs+Gb*Gb/4)/(xs*xs+Ga*Ga/4)**3*dE
+    else:
+        #envelopes (y^2+5y+2)exp(-y/2) and (1+y)exp(-y/2), maximized over the admissible y = x^2/sigma^2
+        sa = Ga/cfactGauss
+        sb = Gb/cfactGauss
+        C = dE/np.sqrt(2*np.pi)
+        y = np.clip(2.3722813232690143, x*x/(sb*sb), x*x/(sa*sa))
+        d2G = C/sa**3*(y*y+5*y+2)*np.exp(-y/2)/cfactGauss**2
+        y = np.clip(1.0, xs*xs/(sb*sb), (ax+h)**2/(sa*sa))
+        d2x = C/sa**3*(1+y)*np.exp(-y/2)
+    return np.abs((width-Ga)*(Gb-width))/2*d2G + h*h/8*d2x
+
+
+def BroadeningErrorBound(eVals,inSpec,WidthList,shape='Lorentzian',method='fft',nWidths=32,oversample=4,cutoff=None):
+    #Upper bound on max|fast - exact| over eVals, where exact is BroadenGamma/BroadenSigma.
+    #  fft:    width interpolation + binning error, summed stick by stick at every mesh point
+    #  direct: sum over sticks of the kernel value at the truncation radius
+    #Floating point round-off of the FFT (~1e-15 of the largest value) is not included.
+    #This is a diagnostic and costs as much as one exact broadening.
+    eVals = np.asarray(eVals, dtype=float)
+    pos, amp, widths = _CheckWidths(inSpec, WidthList)
+    amp = np.abs(amp)
+    dE = eVals[1]-eVals[0]
+    lorentz = shape.lower().startswith('l')
+
+    if method == 'direct':
+        if cutoff is None:
+            cutoff = 50.0 if lorentz else 5.0
+        R = cutoff*widths
+        if lorentz:
+            return float(np.sum(amp*LorentzKernel(R, widths, dE)))
+        return float(np.sum(amp*GaussKernel(R, widths, dE)))
+
+    if method != 'fft':
+        raise ValueError("method must be 'fft' or 'direct'")
+
+    levels, k, t = WidthClasses(widths, nWidths)
+    if len(levels) > 1:
+        Ga = levels[k]
+        Gb = levels[k+1]
+    else:
+        Ga = Gb = widths
+    h = dE/max(int(oversample), 1)
 
+    bound = np.zeros(len(eVals))
+    chunk = 512
+    for j0 in range(0, len(pos), chunk):
+        sl = slice(j0, j0+chunk)
+        x = eVals[None,:]-pos[sl,None]
+        env = _ErrorEnvelope(x, Ga[sl,None], Gb[sl,None], widths[sl,None], h, dE, lorentz)
+        bound = bound + amp[sl] @ env
+    return float(np.max(bound))
 
 
  
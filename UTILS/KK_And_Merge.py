@@ -1,6 +1,10 @@
 #!/usr/bin/python
+import math
+import os
 import numpy as np
+from numba import njit
 from pylab import *
+from . import DATA_DIR
 
 
 #read from input file
@@ -114,6 +118,179 @@ def KK_Robert(e,im,offset):
       
   return re
 
+
+@njit()
+def _KK_Partial(e,im,iStart,iStop,newE,dist):
+  #Sum of the piecewise-linear analytic contributions of the hats iStart..iStop-1 of (e,im), evaluated at newE.
+  #Points closer than dist use the exact log expressions, the others the midpoint rule (KK_RobertSlow).
+  #dist < 0 uses the log expressions everywhere (KK_Robert).
+  total = np.zeros(len(newE))
+
+  if dist < 0:
+    #every hat uses the log expressions, so log|E-x_(k+1)|-log|E-x_k| and log(E+x_(k+1))-log(E+x_k) are computed
+    #once per segment (with log1p, the differences of rounded logs lose ~1e-9 far from fine segments)
+    #and shared by the two hats touching it
+    Dm = np.zeros(iStop-iStart+1)
+    Dp = np.zeros(iStop-iStart+1)
+    for j in range(len(newE)):
+      E = newE[j]
+      for k in range(iStart-1,iStop):
+        t = (e[k]-e[k+1])/(E-e[k])
+        if t > -1:
+          Dm[k-iStart+1] = np.log1p(t)
+        else:
+          Dm[k-iStart+1] = np.log(abs(E-e[k+1])/abs(E-e[k]))
+        Dp[k-iStart+1] = np.log1p((e[k+1]-e[k])/(E+e[k]))
+      acc = 0.0
+      for i in range(iStart,iStop):
+        xm = e[i-1]
+        x0 = e[i]
+        xp = e[i+1]
+        beta = im[i]
+
+        m1 = -beta/(xp-x0)
+        m2 = beta / (x0-xm)
+
+        #b1 +- E*m1 and b2 +- E*m2 written without the cancellation of the large intercepts
+        delta = 0.5 * beta*(xp-E)/(xp-x0) * Dm[i-iStart+1] + 0.5 * beta*(xp+E)/(xp-x0) * Dp[i-iStart+1] + m1*(xp-x0)
+        delta = delta + 0.5 * beta*(E-xm)/(x0-xm) * Dm[i-iStart] - 0.5 * beta*(E+xm)/(x0-xm) * Dp[i-iStart] + m2*(x0-xm)
+        acc = acc + delta
+      total[j] = acc
+    return total
+
+  for i in range(iStart,iStop):
+    xm = e[i-1]
+    x0 = e[i]
+    xp = e[i+1]
+    beta = im[i]
+
+    m1 = -beta/(xp-x0)
+    b1 = beta - m1*x0
+
+    m2 = beta / (x0-xm)
+    b2 = beta - m2*x0
+
+    dEnergy = 0.5*(xp-xm)
+
+    near = 0.0
+    if dist >= 0:
+      near = dist
+      if (xp-xm)*3 > near:
+        near = (xp-xm)*3
+
+    for j in range(len(newE)):
+      E = newE[j]
+      if dist < 0 or abs(x0-E) < near:
+        delta = 0.5 * b1 * np.log(abs((E-xp)*(E+xp))/abs((E-x0)*(E+x0))) + m1*(xp-x0) + 0.5 * E * m1 * np.log((E+x0)/(E+xp)) + 0.5 * E * m1 * np.log(abs(E-xp)/abs(E-x0))
+        delta = delta + 0.5 * b2 * np.log(abs((E-x0)*(E+x0))/abs((E-xm)*(E+xm))) + m2*(x0-xm) + 0.5 * E * m2 * np.log((E+xm)/(E+x0)) + 0.5 * E * m2 * np.log(abs(E-x0)/abs(E-xm))
+      else:
+        delta = - dEnergy * (beta*x0)/((E-x0)*(E+x0))
+      total[j] = total[j] + delta
+
+  return total
+
+
+def KKPartial(e,im,iStart,iStop,newE,dist=None):
+#Contribution (before the -2/pi factor) of the hats iStart..iStop-1 to the real part at newE
+  if dist is None:
+    dist = -1.0
+  iStart = max(int(iStart), 1)
+  iStop = min(int(iStop), len(e)-1)
+  if iStop <= iStart or len(newE) == 0:
+    return np.zeros(len(newE))
+  return _KK_Partial(np.ascontiguousarray(e, dtype=float), np.ascontiguousarray(im, dtype=float),
+                     iStart, iStop, np.ascontiguousarray(newE, dtype=float), float(dist))
+
+
+def KK_Numba(e,im,offset,dist=None):
+#Compiled version of the piecewise-linear analytic integral.
+#dist=None uses the log expressions for every point and reproduces KK_Robert,
+#dist=10 restores the dist condition and reproduces KK_RobertSlow.
+  e = np.asarray(e, dtype=float)
+  return offset - 2.0/3.14159265359 * KKPartial(e, im, 1, len(e)-1, e + 0.00234563, dist)
+
+
+def KK(e,im,offset,method='numba'):
+#Dispatch to one of the Kramers-Kronig engines
+#  robert:   KK_Robert, vectorized numpy
+#  numba:    compiled KK_Robert, same result to round-off
+#  windowed: compiled KK_RobertSlow, exact log expressions only near each point
+#  slow:     KK_RobertSlow, pure python
+  if method == 'robert':
+    return KK_Robert(e, im, offset)
+  elif method == 'numba':
+    return KK_Numba(e, im, offset)
+  elif method == 'windowed':
+    return KK_Numba(e, im, offset, dist=10)
+  elif method == 'slow':
+    return KK_RobertSlow(e, im, offset)
+  raise ValueError("Unknown Kramers-Kronig method '" + str(method) + "'")
+
+class OffResTable:
+  #Off-resonance form factor table (E, f1, f2) loaded once, with the merge partitions and
+  #the Kramers-Kronig contributions of its fixed tails cached per (c1, c2) window
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.spec = np.loadtxt(filename, usecols=(0,1,2)).T
+    self._partitions = {}
+    self._tailKK = {}
+
+  def partition(self, c1, c2):
+    #off-resonance points below c1 and above c2
+    key = (c1, c2)
+    if key not in self._partitions:
+      E = self.spec[0]
+      low = np.where(E < c1)[0]
+      high = np.where(E > c2)[0]
+      self._partitions[key] = (self.spec[0,low], self.spec[2,low], self.spec[0,high], self.spec[2,high])
+    return self._partitions[key]
+
+  def tailKK(self, c1, c2, dist=None):
+    #KK sum of the tail hats that only touch tail points, evaluated at the tail points
+    key = (c1, c2, dist)
+    if key not in self._tailKK:
+      lowE, lowf2, highE, highf2 = self.partition(c1, c2)
+      tailE = np.hstack((lowE, highE)) + 0.00234563
+      self._tailKK[key] = KKPartial(lowE, lowf2, 1, len(lowE)-1, tailE, dist) + KKPartial(highE, highf2, 1, len(highE)-1, tailE, dist)
+    return self._tailKK[key]
+
+  def merge(self, E, f2, c1, c2, offset, dist=None):
+    #Replace the off-resonance f2 between c1 and c2 by (E, f2) and return (mergedE, mergedf1, mergedf2).
+    #Only the hats touching the resonant window and the tail hats at the window points are recomputed.
+    lowE, lowf2, highE, highf2 = self.partition(c1, c2)
+    window = np.where((E > c1) & (E < c2))[0]
+    mergedE = np.hstack((lowE, E[window], highE))
+    mergedf2 = np.hstack((lowf2, f2[window], highf2))
+
+    nL = len(lowE)
+    nW = len(window)
+    newE = mergedE + 0.00234563
+    tail = np.r_[0:nL, nL+nW:len(mergedE)]
+
+    delta = np.zeros(len(mergedE))
+    delta[tail] = self.tailKK(c1, c2, dist)
+    # fixed tail hats at the window points
+    delta[nL:nL+nW] = KKPartial(lowE, lowf2, 1, nL-1, newE[nL:nL+nW], dist) + KKPartial(highE, highf2, 1, len(highE)-1, newE[nL:nL+nW], dist)
+    # window hats plus the two boundary hats, at every point
+    delta = delta + KKPartial(mergedE, mergedf2, nL-1, nL+nW+1, newE, dist)
+
+    return mergedE, offset - 2.0/3.14159265359 * delta, mergedf2
+
+
+_offResTables = {}
+
+def GetOffResTable(filename):
+  #Registry of off-resonance tables, a table is read from disk only the first time it is requested.
+  #Relative names that do not exist in the working directory are looked up in DATA.
+  if not os.path.isfile(filename):
+    filename = os.path.join(DATA_DIR, filename)
+  filename = os.path.abspath(filename)
+  if filename not in _offResTables:
+    _offResTables[filename] = OffResTable(filename)
+  return _offResTables[filename]
+
+
 def GetOffset(element):
   switcher = { "H": 1, "He": 2, "Li": 3, "Be": 4, "B": 5, "C": 6, "N": 7, "O": 8, "F": 9, "Ne": 10, "Na": 11, "Mg": 12, "Al": 13, "Si": 14, "P": 15, "S": 16, "Cl": 17, "Ar": 18, 
                "K": 19, "Ca": 20, "Sc": 21, "Ti": 22, "V": 23, "Cr": 24, "Mn": 25, "Fe": 26, "Co": 27, "Ni": 28, "Cu": 29, "Zn": 30, "Ga": 31, "Ge": 32, "As": 33, "Se": 34, "Br": 35, "Kr": 36,
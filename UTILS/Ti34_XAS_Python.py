@@ -11,7 +11,8 @@ import pickle
 import os
 import glob
 from scipy.sparse.linalg import LinearOperator
-from UTILS.Broaden_Spectrum import GetBroadeningList, BroadenGamma, BroadenSigma
+from UTILS.Broaden_Spectrum import GetBroadeningList, BroadenGamma, BroadenSigma, BroadenGammaFFT, BroadenSigmaFFT, \
+    BroadenGammaDirect, BroadenSigmaDirect
 import matplotlib.pyplot as plt
 from time import perf_counter
 from UTILS.KK_And_Merge import *
@@ -20,10 +21,73 @@ import copy
 # Import ROOT_DIR from the __init__.py file
 from . import ROOT_DIR
 
-global OpsTi
 
-with open(os.path.join(ROOT_DIR, "DATA/Ti34OpsPython" + '.pkl'), 'rb') as f:
-    OpsTi = pickle.load(f)
+class OperatorStore:
+    """
+    Purpose: Read-only dictionary of sparse operators that are only loaded when first used.
+             Operators are stored in an uncompressed npz archive as CSR components
+             (<name>.data, <name>.indices, <name>.indptr, <name>.shape), numpy reads each member on demand.
+             If the npz archive does not exist the legacy pickle is loaded (in full) on first access.
+    """
+    def __init__(self, filename, fallback=None):
+        """
+        :param filename: npz archive written by WriteOpsToNpz
+        :param fallback: pickle file with a dictionary of csr matrices, used if filename does not exist
+        """
+        self.filename = filename
+        self.fallback = fallback
+        self._archive = None
+        self._names = None
+        self._ops = dict()
+
+    def _open(self):
+        # opens the archive (or loads the pickle) the first time an operator is requested
+        if self._names is not None:
+            return
+        if os.path.isfile(self.filename):
+            self._archive = np.load(self.filename)
+            self._names = sorted(set(key.rsplit('.', 1)[0] for key in self._archive.files))
+        else:
+            with open(self.fallback, 'rb') as f:
+                self._ops = pickle.load(f)
+            self._names = sorted(self._ops.keys())
+
+    def __getitem__(self, name):
+        if name not in self._ops:
+            self._open()
+            if name not in self._ops:
+                if name not in self._names:
+                    raise KeyError(name)
+                arc = self._archive
+                self._ops[name] = sparse.csr_matrix((arc[name + '.data'], arc[name + '.indices'], arc[name + '.indptr']),
+                                                    shape=tuple(arc[name + '.shape']))
+        return self._ops[name]
+
+    def __contains__(self, name):
+        self._open()
+        return name in self._names
+
+    def __iter__(self):
+        self._open()
+        return iter(self._names)
+
+    def __len__(self):
+        self._open()
+        return len(self._names)
+
+    def keys(self):
+        self._open()
+        return list(self._names)
+
+    def loaded(self):
+        """
+        Purpose: Names of the operators that have been materialized so far
+        """
+        return list(self._ops.keys())
+
+
+OpsTi = OperatorStore(os.path.join(ROOT_DIR, "DATA/Ti34OpsPython.npz"),
+                      fallback=os.path.join(ROOT_DIR, "DATA/Ti34OpsPython.pkl"))
 
 
 def Lanczos(HS, v=None, m=100):
@@ -418,9 +482,24 @@ def WriteOpsToPickle():
 
   save_obj(Ops,"Ti34OpsPython")
 
+def WriteOpsToNpz(Ops, filename):
+  """
+  Purpose: Write a dictionary of sparse operators as CSR components into an uncompressed npz archive
+  :param Ops: dictionary of sparse matrices
+  :param filename: name of the npz archive
+  """
+  arrays = dict()
+  for name in Ops.keys():
+    M = sparse.csr_matrix(Ops[name])
+    arrays[name + '.data'] = M.data
+    arrays[name + '.indices'] = M.indices
+    arrays[name + '.indptr'] = M.indptr
+    arrays[name + '.shape'] = np.array(M.shape)
+  np.savez(filename, **arrays)
 
 
-def MergeWithOffRes(inSpec,EShift,S1,S2,m,b,E1,w1,E2,w2,offresFile,element,c1,c2,fi1,fi2,ff1,ff2):
+
+def MergeWithOffRes(inSpec,EShift,S1,S2,m,b,E1,w1,E2,w2,offresFile,element,c1,c2,fi1,fi2,ff1,ff2,kkMethod='numba'):
 
   mySpec = {}
   edgeJump = {}
@@ -453,24 +532,20 @@ def MergeWithOffRes(inSpec,EShift,S1,S2,m,b,E1,w1,E2,w2,offresFile,element,c1,c2
   
   
  #Example call:  python KK_And_Merge.py spec.dat Ti.ff Ti 432 437
-    
-  offres = GetSpecFromFile(offresFile)    
-  offres = offres.T
-  
-  
-  mergedE = np.hstack((offres[np.where(offres[:,0] < c1)[0],0],inSpec[np.where((inSpec[:,0]>c1) & (inSpec[:,0]<c2))[0],0],offres[np.where(offres[:,0]>c2)[0],0]))
-  
-  mergedf2 = np.hstack((offres[np.where(offres[:,0] < c1)[0],2],inSpec[np.where((inSpec[:,0]>c1) & (inSpec[:,0]<c2))[0],1],offres[np.where(offres[:,0]>c2)[0],2]))
-   
-  
-  
-  #print(offres.shape)
-  
-  #spec = MergeOffRes(inSpec,offres,c1,c2)
 
+  #the off-resonance table, its partitions and the KK sums of its tails are cached between calls
+  offres = GetOffResTable(offresFile)
   offset = GetOffset(element) #'Ti'
 
-  mergedf1 = KK_Robert(mergedE, mergedf2, offset)
+  if kkMethod in ('numba', 'windowed'):
+    dist = None if kkMethod == 'numba' else 10
+    mergedE, mergedf1, mergedf2 = offres.merge(inSpec[:,0], inSpec[:,1], c1, c2, offset, dist)
+  else:
+    lowE, lowf2, highE, highf2 = offres.partition(c1, c2)
+    window = np.where((inSpec[:,0]>c1) & (inSpec[:,0]<c2))[0]
+    mergedE = np.hstack((lowE, inSpec[window,0], highE))
+    mergedf2 = np.hstack((lowf2, inSpec[window,1], highf2))
+    mergedf1 = KK(mergedE, mergedf2, offset, method=kkMethod)
 
   return np.transpose(np.vstack((mergedE,mergedf1,mergedf2)))
 '''
@@ -496,17 +571,24 @@ def MergeWithOffRes(inSpec,EShift,S1,S2,m,b,E1,w1,E2,w2,offresFile,element,c1,c2
 
 
 
-def GetTiFormFactor(dExy,dExzyz,dEx2y2,dEz2, nd=0,T=300,tenDq=2.12):
+#broadening engines of GetTiFormFactor: (gamma broadening, sigma broadening)
+BROADENING_ENGINES = {'exact': (BroadenGamma, BroadenSigma), 'fft': (BroadenGammaFFT, BroadenSigmaFFT),
+                      'direct': (BroadenGammaDirect, BroadenSigmaDirect)}
+
+def GetTiFormFactor(dExy,dExzyz,dEx2y2,dEz2, nd=0,T=300,tenDq=2.12,broadening='exact',kkMethod='numba'):
 
 #prepath = "ff/"
 #OrbE = np.loadtxt(prepath + "OrbitalEnergies.txt")
+  if broadening not in BROADENING_ENGINES:
+    raise ValueError("Unknown broadening engine '" + str(broadening) + "'")
+
   dExy = float(dExy)
   dExzyz = float(dExzyz)
   dEx2y2 = float(dEx2y2)
   dEz2 = float(dEz2)
 
   #Ops = load_obj("Ti34OpsPython")
-  Ops = copy.deepcopy(OpsTi)
+  Ops = OpsTi  # operators are only read, never modified in place
   
   KelvinToeV = 8.61735E-5
   T = T * KelvinToeV
@@ -674,8 +756,11 @@ def GetTiFormFactor(dExy,dExzyz,dEx2y2,dEz2, nd=0,T=300,tenDq=2.12):
   
 
 
-  spec_xx = BroadenGamma(erange, BroadenSigma(erange, spec_xx, sigmaVals), gammaVals)
-  spec_zz = BroadenGamma(erange, BroadenSigma(erange, spec_zz, sigmaValszz), gammaVals)
+  #broadening engine: 'exact' reference sums, 'fft' binned convolutions or 'direct' truncated numba sums
+  broadGamma, broadSigma = BROADENING_ENGINES[broadening]
+
+  spec_xx = broadGamma(erange, broadSigma(erange, spec_xx, sigmaVals), gammaVals)
+  spec_zz = broadGamma(erange, broadSigma(erange, spec_zz, sigmaValszz), gammaVals)
   #Spectra_xx.Broaden(,)
   
   #print(np.sum(spec_xx[:,1]), np.sum(spec_zz[:,1]))
@@ -712,8 +797,8 @@ def GetTiFormFactor(dExy,dExzyz,dEx2y2,dEz2, nd=0,T=300,tenDq=2.12):
     m = -0.013
     S2 = 8.95
 
-  merged_xx = MergeWithOffRes(spec_xx,EShift,S1,S2,m,b,E1,w1,E2,w2,offResFile,element,c1,c2,fi1,fi2,ff1,ff2)
-  merged_zz = MergeWithOffRes(spec_zz,EShift,S1,S2,m,b,E1,w1,E2,w2,offResFile,element,c1,c2,fi1,fi2,ff1,ff2)
+  merged_xx = MergeWithOffRes(spec_xx,EShift,S1,S2,m,b,E1,w1,E2,w2,offResFile,element,c1,c2,fi1,fi2,ff1,ff2,kkMethod)
+  merged_zz = MergeWithOffRes(spec_zz,EShift,S1,S2,m,b,E1,w1,E2,w2,offResFile,element,c1,c2,fi1,fi2,ff1,ff2,kkMethod)
 
   final = np.hstack((merged_xx,merged_zz[:,1:]))
   
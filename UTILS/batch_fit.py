@@ -0,0 +1,466 @@
+"""
+Library: batch_fit.py
+Version: 0.1
+Author: Lucas Korol
+Institution: University of Saskatchewan
+Python: version 3.7
+
+Purpose: Command line entry point that runs the data fitting of project files without the GUI. The sample, the
+         algorithm parameters and the fitting parameters (parameters, boundaries, selected scans and their boundaries
+         and weights) are loaded from the project, the selected algorithm is run and the results (fitted parameters,
+         cost function value, fitted sample, background shifts and scaling factors) are written back to the project.
+         The parameter uncertainties can be estimated by refitting bootstrap or leave-one-scan-out samples of the data,
+         their standard deviations and correlations are saved with the results. The posterior of the parameters can
+         be sampled with an ensemble sampler started from the fit, the chain is saved next to the project.
+         The trajectory and the checkpoint of each data fitting are saved next to the project as in the GUI.
+
+         The objective function, total variation weight, optimization scale and precisions are set in the GUI and not
+         saved in the project file, they are given as options instead (the defaults are the defaults of the GUI).
+         Orbital parameters are skipped as the orbital energies are not saved in the project file.
+
+         Several projects (for example a thickness or temperature series) are fitted concurrently on a shared pool of
+         processes with ScheduleFits, each data fitting using its own number of CPUs. The form factor databases and
+         the Ti operators are loaded once in every process of the pool.
+
+Usage:
+    python -m UTILS.batch_fit sample1.h5 sample2.h5 --algorithm "differential evolution" --workers 8 --seed 1
+    python -m UTILS.batch_fit series/*.h5 --processes 64 --workers 4
+
+Imported Libraries
+
+global_optimization (version 0.3) - Part of the 'name' software package and contains the data fitting wrappers
+
+data_structure (version 0.3) - Part of the 'name' software package and contains all functions used for reading and
+                               writing of hdf5 files
+"""
+
+import argparse
+import ast
+import copy
+import os
+import shutil
+import h5py
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import UTILS.data_structure as ds
+import UTILS.material_model as mm
+import UTILS.global_optimization as go
+import UTILS.Ti34_XAS_Python as ti
+
+ALGORITHMS = ['differential evolution', 'simplicial homology', 'dual annealing', 'least squares', 'surrogate',
+              'direct']
+
+
+def ReadScript(fname):
+    """
+    Purpose: Read the lines of a script file in the format used by the data fitting
+    :param fname: script file name (None for no script)
+    :return: list of the script lines split at '='
+    """
+    script = list()
+    if fname is None:
+        return script
+
+    with open(fname, 'r') as f:
+        for line in f.readlines():
+            test = line.strip(' ')
+            if test.strip() != '' and not (test.startswith('#')):
+                script.append(line.strip("\n").split('='))
+    return script
+
+
+def LoadFit(fname, objective='Chi-Square', shape_weight=0, r_scale='log(x)', script=None, reflectivity_engine='PythonReflectivity',
+            step=0.1, prec=1e-6, precE=1e-8, nd=0, temperature=300):
+    """
+    Purpose: Load everything needed to run the data fitting of a project file
+    :param fname: project file name
+    :param objective: cost function ('Chi-Square', 'L1-Norm', 'L2-Norm' or 'Arctan')
+    :param shape_weight: total variation weight
+    :param r_scale: scale of the reflectivity used in the cost function ('log(x)', 'ln(x)', 'x' or 'qz^4')
+    :param script: script file name (None for no script)
+    :param reflectivity_engine: reflectivity engine used in the calculation
+    :param step: slab thickness used in the density profile
+    :param prec: precision of the reflectivity scans
+    :param precE: precision of the energy scans
+    :param nd: oxidation state used for the orbital energies
+    :param temperature: sample temperature in kelvin
+    :return:
+        fit - dictionary of the arguments of the data fitting wrappers
+        x0 - current parameter values
+        goParameters - algorithm parameters of the project
+    """
+    mm._use_given_ff(os.path.dirname(os.path.abspath(fname)))  # form factors in the project directory
+
+    sample = ds.ReadSampleHDF5(fname)
+    sample.energy_shift()
+
+    data_info, data_dict, sim_dict = ds.ReadDataHDF5(fname)
+    data_dict.detach()  # the project is rewritten once the data fitting is done
+
+    sfbsFit, sfbsVal, sampleFit, sampleVal, selected_scans, scan_bounds, scan_weights, x, chi = ds.ReadFitHDF5(fname)
+    goParameters = ds.ReadAlgorithmHDF5(fname)
+
+    parameters = []
+    lw = []  # lower parameter bound
+    up = []  # upper parameter bound
+    x0 = []  # current value
+    for fit, val in list(zip(sampleFit, sampleVal)) + list(zip(sfbsFit, sfbsVal)):
+        if fit[0] == 'ORBITAL':
+            continue
+        parameters.append(fit)
+        lw.append(float(val[1][0]))
+        up.append(float(val[1][1]))
+        x0.append(float(val[0]))
+
+    # selected scans with their boundaries and weights
+    scans = []
+    sBounds = []
+    sWeights = []
+    for name, bound, weight in zip(selected_scans, scan_bounds, scan_weights):
+        if name in list(data_dict.keys()):
+            scans.append(name)
+            sBounds.append([(float(b[0]), float(b[1])) for b in bound])
+            sWeights.append([float(w) for w in weight])
+
+    backS = dict()  # background shift
+    scaleF = dict()  # scaling factor
+    for name in scans:
+        backS[name] = str(data_dict[name]['Background Shift'])
+        scaleF[name] = str(data_dict[name]['Scaling Factor'])
+
+    script = ReadScript(script)
+
+    fit = dict(sample=sample, data_info=data_info, data=data_dict, scan=scans, backS=backS, scaleF=scaleF,
+               parameters=parameters, bounds=list(zip(lw, up)), sBounds=sBounds, sWeights=sWeights,
+               objective=objective, shape_weight=shape_weight, r_scale=r_scale, smooth_dict=data_dict, script=script,
+               orbitals=dict(), sf_dict=dict(), nd=nd, temperature=temperature,
+               reflectivity_engine=reflectivity_engine, step=step, prec=prec, precE=precE,
+               use_script=len(script) != 0)
+
+    return fit, x0, goParameters
+
+
+def RunFit(fname, algorithm='differential evolution', workers=1, seed=None, resume=False, checkpoint=True,
+           starts=0, uncertainty=None, resamples=50, mcmc_steps=0, walkers=None, mcmc_scale=1.0, fidelity=None,
+           subsample=None, cb=None, **kwargs):
+    """
+    Purpose: Run the data fitting of a project file and write the results back to the project
+    :param fname: project file name
+    :param algorithm: data fitting algorithm (one of ALGORITHMS)
+    :param workers: number of processes used by differential evolution, simplicial homology, the surrogate assisted
+                    optimization, the direct algorithm and multi-start least squares
+    :param seed: seed of the random number generator used by differential evolution, dual annealing, the surrogate
+                 assisted optimization and the starting points of multi-start least squares
+    :param resume: continue the data fitting from the checkpoint of the project if there is one
+    :param checkpoint: periodically save the state of the data fitting
+    :param fidelity: number of precision levels of a coarse to fine differential evolution (None for the precision
+                     of the data fitting only)
+    :param subsample: fraction of the data points of each scan used at the first level of a coarse to fine
+                      differential evolution (None for all the data points)
+    :param starts: number of additional starting points of least squares drawn within the parameter boundaries
+                   (0 to only start from the current values)
+    :param uncertainty: resampling used to estimate the parameter uncertainties ('bootstrap', 'jackknife' or None)
+    :param resamples: number of bootstrap samples
+    :param mcmc_steps: number of steps of the ensemble sampler started from the fit (0 for no posterior sampling)
+    :param walkers: number of walkers of the ensemble sampler (twice the number of parameters if None)
+    :param mcmc_scale: temperature of the cost function in the posterior, log probability = -cost/mcmc_scale
+    :param cb: callback class used to stop the data fitting (FitCallback if None)
+    :param kwargs: options of LoadFit
+    :return:
+        x - the parameter values
+        fun - the cost function value
+    """
+    if cb is None:
+        cb = go.FitCallback()
+
+    fit, x0, goParameters = LoadFit(fname, **kwargs)
+    if len(fit['parameters']) == 0 or len(fit['scan']) == 0:
+        raise ValueError('A fitting parameter and a data scan must be selected to perform a data fit.')
+
+    trajectory = os.path.splitext(fname)[0] + '_trajectory.h5'
+    ckname = os.path.splitext(fname)[0] + '_checkpoint.pkl'
+
+    if resume and os.path.exists(ckname):
+        x, fun = go.resume(ckname, cb=cb)
+    else:
+        if not checkpoint:
+            ckname = None
+
+        # the surrogate assisted optimization and the direct algorithm are not part of the project file, the
+        # surrogate evaluates a batch per worker
+        defaults = {'surrogate': [100, workers, 'None'], 'direct': [0.0001, 'None', 1000, False, 0.0001, 1e-16, 1e-6]}
+        goParam = goParameters.get(algorithm, defaults.get(algorithm))
+        if algorithm == 'differential evolution':
+            x, fun = go.differential_evolution(**fit, goParam=goParam, cb=cb, trajectory=trajectory, workers=workers,
+                                               seed=seed, checkpoint=ckname, fidelity=fidelity,
+                                               subsample=subsample)
+        elif algorithm == 'simplicial homology':
+            x, fun = go.shgo(**fit, goParam=goParam, cb=cb, trajectory=trajectory, workers=workers,
+                             checkpoint=ckname)
+        elif algorithm == 'dual annealing':
+            x, fun = go.dual_annealing(**fit, goParam=goParam, cb=cb, trajectory=trajectory, seed=seed,
+                                       checkpoint=ckname)
+        elif algorithm == 'surrogate':
+            x, fun = go.surrogate(**fit, goParam=goParam, cb=cb, trajectory=trajectory, workers=workers, seed=seed)
+        elif algorithm == 'direct':
+            x, fun = go.direct(**fit, goParam=goParam, cb=cb, trajectory=trajectory, workers=workers)
+        elif algorithm == 'least squares' and starts > 0:
+            bounds = ([b[0] for b in fit['bounds']], [b[1] for b in fit['bounds']])
+            solutions = go.multistart_least_squares(**dict(fit, bounds=bounds), goParam=goParam, cb=cb,
+                                                    trajectory=trajectory, x0=x0, n_starts=starts, workers=workers,
+                                                    seed=seed)
+            x, fun = solutions[0]['x'], solutions[0]['fun']
+        elif algorithm == 'least squares':
+            bounds = ([b[0] for b in fit['bounds']], [b[1] for b in fit['bounds']])
+            x, fun = go.least_squares(x0, **dict(fit, bounds=bounds), goParam=goParam, cb=cb, trajectory=trajectory)
+        else:
+            raise ValueError('Unknown data fitting algorithm ' + str(algorithm))
+
+    WriteFitResults(fname, fit, x, fun)
+
+    if uncertainty is not None:
+        bounds = ([b[0] for b in fit['bounds']], [b[1] for b in fit['bounds']])
+        result = go.resample_uncertainty(x, **dict(fit, bounds=bounds), goParam=goParameters['least squares'], cb=cb,
+                                         method=uncertainty, n_samples=resamples, workers=workers, seed=seed)
+        with h5py.File(fname, 'a') as f:
+            results = f['Fitting Parameters']['Results']
+            results.attrs['Uncertainty'] = uncertainty
+            results.attrs['Std'] = result['std']
+            results.attrs['Correlation'] = result['correlation']
+
+    if mcmc_steps > 0:
+        # the chain is continued on resume, the first half of the chain is discarded as burn-in
+        chain = os.path.splitext(fname)[0] + '_chain.h5'
+        result = go.mcmc(**fit, goParam=goParameters['differential evolution'], cb=cb, x0=x, n_walkers=walkers,
+                         n_steps=mcmc_steps, scale=mcmc_scale, workers=workers, seed=seed, chain=chain, resume=resume)
+        samples = result['chain'][len(result['chain']) // 2:].reshape(-1, len(x))
+        with h5py.File(fname, 'a') as f:
+            results = f['Fitting Parameters']['Results']
+            results.attrs['Posterior Mean'] = np.mean(samples, axis=0)
+            results.attrs['Posterior Std'] = np.std(samples, axis=0)
+
+    return x, fun
+
+
+def WriteFitResults(fname, fit, x, fun):
+    """
+    Purpose: Write the results of a data fitting to the project file. The fitted values become the current values of
+             the fitting parameters, the sample is changed to the fitted sample and the background shifts and scaling
+             factors of the scans are updated.
+    :param fname: project file name
+    :param fit: dictionary of the arguments of the data fitting wrappers (from LoadFit)
+    :param x: fitted parameter values
+    :param fun: cost function value
+    """
+    x = [float(val) for val in x]
+    parameters = fit['parameters']
+
+    sample, backS, scaleF, orbitals = go.changeSampleParams(x, parameters, copy.deepcopy(fit['sample']),
+                                                            copy.deepcopy(fit['backS']), copy.deepcopy(fit['scaleF']),
+                                                            fit['script'], fit['orbitals'],
+                                                            use_script=fit['use_script'])
+
+    with h5py.File(fname, 'r') as f:
+        version = f.attrs.get('Version', '')
+        sample_fit = f['Fitting Parameters']['Sample Fit']
+        sampleFit = ast.literal_eval(sample_fit.attrs['Sample Fit'])
+        sampleVal = ds.evaluate_parameters(sample_fit.attrs['Sample Val'])
+        sfbsFit = ast.literal_eval(sample_fit.attrs['sfbsFit'])
+        sfbsVal = ds.evaluate_parameters(sample_fit.attrs['sfbsVal'])
+
+    # the fitted values become the current values of the parameters
+    def fitted(fits, vals):
+        new_vals = []
+        for params, val in zip(fits, vals):
+            val = [float(val[0]), [float(val[1][0]), float(val[1][1])]]
+            if params in parameters:
+                val[0] = x[parameters.index(params)]
+            new_vals.append(val)
+        return new_vals
+
+    ds.WriteSampleHDF5(fname, sample, version)
+
+    with h5py.File(fname, 'a') as f:
+        sample_fit = f['Fitting Parameters']['Sample Fit']
+        sample_fit.attrs['Sample Val'] = str(fitted(sampleFit, sampleVal))
+        sample_fit.attrs['sfbsVal'] = str(fitted(sfbsFit, sfbsVal))
+
+        results = f['Fitting Parameters']['Results']
+        results.attrs['Value'] = str(x)
+        results.attrs['Chi'] = float(fun)
+
+        experiment = f['Experimental_data']
+        for name in fit['scan']:
+            if name in experiment['Energy_Scan']:
+                dset = experiment['Energy_Scan'][name]
+            else:
+                dset = experiment['Reflectivity_Scan'][name]
+            dset.attrs['Background Shift'] = float(backS[name])
+            dset.attrs['Scaling Factor'] = float(scaleF[name])
+
+        ds.WriteScanTable(f)
+
+
+def LoadTables():
+    """
+    Purpose: Load the form factor databases and the Ti operators. Called once in every worker of the scheduler (and
+             before the workers are forked so they share the pages of the parent process).
+    """
+    for store in [mm.ff, mm.ffm]:
+        for key in store:
+            store[key]
+    for name in ti.OpsTi:
+        ti.OpsTi[name]
+
+
+def _InitFitWorker():
+    LoadTables()
+
+
+def _FitJob(fname, cpus, options):
+    # form factors of the project directory must not be used by the next project of the worker
+    ff = copy.copy(mm.ff)
+    ffm = copy.copy(mm.ffm)
+    try:
+        return RunFit(fname, workers=cpus, **options)
+    finally:
+        mm.ff.restore(ff)
+        mm.ffm.restore(ffm)
+
+
+def ScheduleFits(projects, processes=None, cpus=1, **options):
+    """
+    Purpose: Run the data fitting of several projects concurrently on a shared pool of processes. Every data fitting
+             gets a number of CPUs (used as the workers of the algorithms, see RunFit) and a new
+             data fitting is started, in the order of the projects, as soon as enough CPUs are free.
+    :param projects: list of project file names
+    :param processes: number of CPUs shared by the data fittings (number of CPUs of the computer if None). The data
+                      fittings are run one after another in this process if 1, each with all of its CPUs.
+    :param cpus: CPUs of each data fitting, either a number or a dictionary {project: number}. A data fitting run
+                 concurrently with others gets at most processes CPUs.
+    :param options: options of RunFit
+    :return: dictionary {project: (x, fun)}, the exception raised is given instead for a data fitting that failed
+    """
+    if processes is None:
+        processes = os.cpu_count()
+    processes = max(int(processes), 1)
+
+    jobs = []
+    for fname in projects:
+        budget = cpus.get(fname, 1) if isinstance(cpus, dict) else cpus
+        jobs.append((fname, max(int(budget), 1)))
+
+    results = dict()
+    if processes == 1 or len(jobs) == 1:
+        for fname, budget in jobs:
+            try:
+                results[fname] = _FitJob(fname, budget, options)
+            except Exception as error:
+                results[fname] = error
+        return results
+
+    # the CPUs of a data fitting are only limited by the CPUs shared with the other data fittings
+    jobs = [(fname, min(budget, processes)) for fname, budget in jobs]
+
+    LoadTables()
+    free = processes
+    running = dict()  # future -> (project, cpus)
+    max_workers = min(len(jobs), processes // min([budget for fname, budget in jobs]))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_InitFitWorker) as pool:
+        while len(jobs) != 0 or len(running) != 0:
+            # start the data fittings that fit in the free CPUs
+            for job in list(jobs):
+                if job[1] <= free:
+                    running[pool.submit(_FitJob, job[0], job[1], options)] = job
+                    free = free - job[1]
+                    jobs.remove(job)
+
+            done, not_done = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for future in done:
+                fname, budget = running.pop(future)
+                free = free + budget
+                try:
+                    results[fname] = future.result()
+                except Exception as error:
+                    results[fname] = error
+
+    return results
+
+
+def main(argv=None):
+    """
+    Purpose: Run the data fitting of the project files given on the command line
+    :param argv: command line arguments (sys.argv if None)
+    :return: exit status
+    """
+    parser = argparse.ArgumentParser(description='Run the data fitting of GO-RXR project files without the GUI.')
+    parser.add_argument('projects', nargs='+', help='project files (.h5)')
+    parser.add_argument('--algorithm', default='differential evolution', choices=ALGORITHMS)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='CPUs of each data fitting (not used by dual annealing and single start least squares)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='CPUs shared by the data fittings, projects are fitted concurrently if more than one '
+                             '(by default the projects are fitted one after another with --workers CPUs each)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed of differential evolution and dual annealing')
+    parser.add_argument('--objective', default='Chi-Square', choices=['Chi-Square', 'L1-Norm', 'L2-Norm', 'Arctan'])
+    parser.add_argument('--shape-weight', type=float, default=0, help='total variation weight')
+    parser.add_argument('--scale', default='log(x)', choices=['log(x)', 'ln(x)', 'x', 'qz^4'], help='optimization scale')
+    parser.add_argument('--engine', default='PythonReflectivity', help='reflectivity engine')
+    parser.add_argument('--step', type=float, default=0.1, help='slab thickness of the density profile')
+    parser.add_argument('--precision', type=float, default=1e-6, help='precision of the reflectivity scans')
+    parser.add_argument('--eprecision', type=float, default=1e-8, help='precision of the energy scans')
+    parser.add_argument('--fidelity', type=int, default=None,
+                        help='precision levels of a coarse to fine differential evolution')
+    parser.add_argument('--subsample', type=float, default=None,
+                        help='fraction of the data points used at the first level of a coarse to fine differential '
+                             'evolution')
+    parser.add_argument('--script', default=None, help='script file applied to the sample in the data fitting')
+    parser.add_argument('--output-dir', default=None,
+                        help='copy the projects to this directory and write the results to the copies')
+    parser.add_argument('--starts', type=int, default=0,
+                        help='additional starting points of least squares drawn within the boundaries')
+    parser.add_argument('--uncertainty', default=None, choices=['bootstrap', 'jackknife'],
+                        help='estimate the parameter uncertainties by refitting resampled data')
+    parser.add_argument('--resamples', type=int, default=50, help='number of bootstrap samples')
+    parser.add_argument('--mcmc-steps', type=int, default=0,
+                        help='steps of the ensemble sampler of the posterior started from the fit')
+    parser.add_argument('--walkers', type=int, default=None, help='walkers of the ensemble sampler')
+    parser.add_argument('--mcmc-scale', type=float, default=1.0,
+                        help='temperature of the cost function in the posterior (log probability = -cost/scale)')
+    parser.add_argument('--resume', action='store_true', help='continue from the checkpoint of each project')
+    parser.add_argument('--no-checkpoint', action='store_true', help='do not save checkpoints')
+    args = parser.parse_args(argv)
+
+    projects = []
+    for fname in args.projects:
+        if args.output_dir is not None:
+            os.makedirs(args.output_dir, exist_ok=True)
+            new_fname = os.path.join(args.output_dir, os.path.basename(fname))
+            shutil.copyfile(fname, new_fname)
+            fname = new_fname
+        projects.append(fname)
+
+    results = ScheduleFits(projects, processes=args.processes, cpus=args.workers, algorithm=args.algorithm,
+                           seed=args.seed, starts=args.starts, uncertainty=args.uncertainty,
+                           resamples=args.resamples, mcmc_steps=args.mcmc_steps, walkers=args.walkers,
+                           mcmc_scale=args.mcmc_scale, fidelity=args.fidelity,
+                           subsample=args.subsample, resume=args.resume,
+                           checkpoint=not args.no_checkpoint,
+                           objective=args.objective, shape_weight=args.shape_weight, r_scale=args.scale,
+                           script=args.script, reflectivity_engine=args.engine, step=args.step,
+                           prec=args.precision, precE=args.eprecision)
+
+    # one failing project does not stop the remaining data fittings
+    status = 0
+    for fname in projects:
+        if isinstance(results[fname], Exception):
+            print(fname + ': ' + str(results[fname]))
+            status = 1
+        else:
+            print(fname + ': Chi ' + str(results[fname][1]))
+
+    return status
+
+if __name__ == "__main__":
+    raise SystemExit(main())
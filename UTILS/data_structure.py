@@ -37,6 +37,11 @@ functions will need to change accordingly. However, there is a problem with the
 that was saved using an older version of GO-RXR will not be able to load properly. So the idea behind the
 version attribute was to be able to identify which version this file was last saved so that the appropriate loading
 sequence can be done.
+
+Scan layout: Files carry a 'Scan Layout' attribute (see SCAN_LAYOUT_VERSION). Layout 2 writes the scans chunked and
+gzip compressed and keeps a 'Scan_Table' dataset with the metadata of every scan, which is rewritten by WriteScanTable
+whenever the scan attributes change. Files without the table are still read through the dataset attributes and can be
+converted with MigrateFileHDF5.
 """
 
 import matplotlib.pyplot as plt
@@ -46,9 +51,16 @@ import numpy as np
 
 from UTILS.material_structure import *
 from UTILS.material_model import *
+import UTILS.material_model as material_model
 from time import *
 import ast
+import mmap
 import h5py
+import copy
+import hashlib
+import json
+import multiprocessing as mp
+from collections.abc import MutableMapping
 
 
 def getTitleInfo(title):
@@ -99,6 +111,109 @@ def getTitleInfo(title):
             polarization = 'AL'
     return scan_number, scanType, energy, polarization, angle
 
+def _ReMagXData(block, E):
+    """
+    Purpose: Convert the 'dataset_xx = value' lines of one ReMagX scan into the scan data with a single
+             vectorized conversion of the values
+    :param block: list of data lines of the scan
+    :param E: energy of the scan used to compute the angle of reflectivity scans
+    :return: scan data [qz, theta, R] or [qz, theta, R, E] for energy scans
+    """
+    tokens = ''.join(block).split()
+    if len(tokens) == 3 * len(block):
+        keys = np.array(tokens[0::3])
+        values = np.array(tokens[2::3], dtype=float)
+    else:  # lines without a value
+        lines = [line.split() for line in block]
+        keys = np.array([line[0] for line in lines if len(line) == 3])
+        values = np.array([line[2] for line in lines if len(line) == 3], dtype=float)
+
+    qz = values[keys == 'dataset_qz']
+    R = values[(keys == 'dataset_A') | (keys == 'dataset_R0')]
+    energies = values[keys == 'dataset_eng']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        theta = np.arcsin(qz / E / (0.001013546247)) * 180 / np.pi
+
+    if len(energies) != 0:
+        return [qz, theta, R, energies]
+    return [qz, theta, R]
+
+
+def IterReMagX(fname):
+    """
+    Purpose: Read the scans of a ReMagX file one at a time. The file is streamed so only the scan being read is held
+             in memory and the numeric data of each scan is converted in one call.
+    :param fname: ReMagX filename
+    :return: generator of (dataset number, scan type, scan name, scan dictionary)
+    """
+    scan = None
+    block = list()
+    current_scan = 0
+    E = 0
+    name = ''
+
+    with open(fname, 'r') as f:
+        for line in f:
+            if line.lstrip().startswith('dataset_'):
+                block.append(line)  # data lines are converted once the block is complete
+                continue
+
+            if len(block) != 0 and scan is not None:
+                scan['Data'] = np.array(_ReMagXData(block, E))
+                block = list()
+
+            line = line.split()
+            if len(line) == 3 and line[1] == '=':  # makes sure we are only evaluating what we want to be
+
+                if line[0] == 'datasetnumber':
+                    if scan is not None:
+                        yield _ReMagXScan(current_scan, name, scan)
+                    current_scan = int(line[2])
+                    scan = None
+
+                elif line[0] == 'datasettitle':
+                    scan_number, scanType, energy, pol, angle = getTitleInfo(line[2])
+                    name = ''
+                    if scanType == 'Reflectivity':
+                        name = scan_number + '_' + energy + '_' + pol
+                        if pol == 'AL' or pol == 'AC':
+                            name = name + '_Asymm'
+                        scan = dict()
+                        scan['Polarization'] = pol
+                        scan['DatasetNumber'] = current_scan
+                        scan['Background Shift'] = 0
+                        scan['Scaling Factor'] = 1
+
+                    elif scanType == 'Energy':
+                        name = scan_number + '_' + energy + '_Th' + angle + '_' + pol
+                        if pol == 'AL' or pol == 'AC':
+                            name = name + '_Asymm'
+                        scan = dict()
+                        scan['Polarization'] = pol
+                        scan['Angle'] = float(angle)
+                        scan['DatasetNumber'] = current_scan
+                        scan['Background Shift'] = 0
+                        scan['Scaling Factor'] = 1
+
+                elif line[0] == 'datasetenergy':
+                    scan['Energy'] = float(line[2])
+                    E = float(line[2])
+                elif line[0] == 'datasetpoints':
+                    scan['DataPoints'] = int(line[2])
+
+    if len(block) != 0 and scan is not None:
+        scan['Data'] = np.array(_ReMagXData(block, E))
+    if scan is not None:
+        yield _ReMagXScan(current_scan, name, scan)
+
+
+def _ReMagXScan(current_scan, name, scan):
+    # scans with an energy axis are energy scans
+    if 'Data' in scan and len(scan['Data']) == 4:
+        return current_scan, 'Energy', name, scan
+    return current_scan, 'Reflectivity', name, scan
+
+
 def Read_ReMagX(fname):
     """
     Purpose: Read ReMagX files and convert to a data and simulation dictionary
@@ -108,116 +223,16 @@ def Read_ReMagX(fname):
     data_dict = dict()
     data_info = []
     if fname.endswith('.all'):  # checks to make sure selected file is a ReMagX file type
-        # good to go
-        is_data = False
-        new_data = True
-
-        current_scan = 0  # keeps track of which scan we are on!
-
-        # keeps track of the data
-        qz_list = list()
-        theta_list = list()
-        R_list = list()
-        E_list = list()
-        scanType = 'Reflectivity'
-        title = ''
-        name = ''
-
-        with open(fname, 'r') as f:
-            for line in f.readlines():
-                line = line.split()
-
-                # determines if we can start reading in the data
-                if '#' in line and 'measurement' in line and 'data' in line:
-                    is_data = True
-
-                if '#' in line and 'dataset' in line and str(current_scan+1) in line:
-                    is_data = False
-
-                if len(line) == 3:
-                    if line[1] == '=':  # makes sure we are only evaluating what we want to be
-
-                        if line[0] == 'datasetnumber':
-                            current_scan = int(line[2])
-                            new_data = True
-
-                        # new data
-                        if new_data:
-                            if current_scan > 1:  # where we can set the data
-                                if len(E_list) != 0:
-                                    data = [qz_list, theta_list, R_list, E_list]
-                                    data_info.append([current_scan, 'Energy', name])
-                                else:
-                                    data = [qz_list, theta_list, R_list]
-                                    data_info.append([current_scan, 'Reflectivity', name])
-                                data_dict[name]['Data'] = np.array(data)
-
-                            qz_list = list()
-                            theta_list = list()
-                            R_list = list()
-                            E_list = list()
-                            new_data = False
-
-
-                        if line[0] == 'datasettitle':
-                            scan_number, scanType, energy, pol, angle = getTitleInfo(line[2])
-                            name = ''
-                            if scanType == 'Reflectivity':
-                                name = scan_number +'_' + energy + '_' + pol
-                                if pol == 'AL' or pol == 'AC':
-                                    name = name + '_Asymm'
-                                data_dict[name] = dict()
-                                data_dict[name]['Polarization'] = pol
-                                data_dict[name]['DatasetNumber'] = current_scan
-                                data_dict[name]['Background Shift'] = 0
-                                data_dict[name]['Scaling Factor'] = 1
-
-
-                            elif scanType == 'Energy':
-                                name = scan_number + '_' + energy + '_Th'+ angle  + '_' + pol
-                                if pol == 'AL' or pol == 'AC':
-                                    name = name + '_Asymm'
-
-                                data_dict[name] = dict()
-                                data_dict[name]['Polarization'] = pol
-                                data_dict[name]['Angle'] = float(angle)
-                                data_dict[name]['DatasetNumber'] = current_scan
-                                data_dict[name]['Background Shift'] = 0
-                                data_dict[name]['Scaling Factor'] = 1
-
-
-                        elif line[0] == 'datasetenergy':
-                            data_dict[name]['Energy'] = float(line[2])
-                            E = float(line[2])
-                        elif line[0] == 'datasetpoints':
-                            data_dict[name]['DataPoints'] = int(line[2])
-                            # do something else
-                        elif line[0] == 'dataset_qz':
-                            qz = float(line[2])
-                            try:
-                                theta = np.arcsin(qz / E / (0.001013546247)) * 180 / np.pi
-                            except RuntimeWarning:
-                                theta=0
-
-
-                            qz_list.append(qz)
-                            theta_list.append(theta)
-                        elif line[0] == 'dataset_A':
-                            R_list.append(float(line[2]))
-                        elif line[0] == 'dataset_R0':
-                            R_list.append(float(line[2]))
-                        elif line[0] == 'dataset_eng':
-                            E_list.append(float(line[2]))
-
-    if len(E_list) != 0:
-        data = [qz_list, theta_list, R_list, E_list]
-        data_info.append([current_scan, 'Energy', name])
-    else:
-        data = [qz_list, theta_list, R_list]
-        data_info.append([current_scan, 'Reflectivity', name])
-    data_dict[name]['Data'] = np.array(data)
-    f.close()
+        previous = None
+        for current_scan, scanType, name, scan in IterReMagX(fname):
+            # a scan is listed with the dataset number of the scan that follows it
+            if previous is not None:
+                data_info.append([current_scan, previous[0], previous[1]])
+            data_dict[name] = scan
+            previous = (scanType, name)
 
+        if previous is not None:
+            data_info.append([current_scan, previous[0], previous[1]])
 
     return data_info, data_dict
 
@@ -487,6 +502,9 @@ def saveSimulationHDF5(fname, sim_dict, version):
     :param sim_dict: Simulation dictionary
     :return:
     """
+    if isinstance(sim_dict, LazyScanDict):
+        sim_dict.detach()  # the simulated datasets are rewritten below
+
     f = h5py.File(fname, 'a')  # create fname hdf5 file
     f.attrs['Version'] = version
     simulated = f['Simulated_data']
@@ -495,6 +513,10 @@ def saveSimulationHDF5(fname, sim_dict, version):
     simE = simulated['Energy_Scan']
 
     for name in list(sim_dict.keys()):
+        attrs = {key: val for key, val in sim_dict[name].items() if key not in ['Data', 'Fingerprint']}
+        fingerprint = Fingerprint(np.array(sim_dict[name]['Data']), attrs)
+        if (simE if 'Angle' in attrs else simR)[name].attrs.get('Fingerprint') == fingerprint:
+            continue  # simulation unchanged since the last save
 
         if 'Angle' in list(sim_dict[name].keys()):
             dset = simE[name]
@@ -527,6 +549,10 @@ def saveSimulationHDF5(fname, sim_dict, version):
             dset.attrs['Polarization'] = sim_dict[name]['Polarization']
             dset.attrs['Background Shift'] = sim_dict[name]['Background Shift']
             dset.attrs['Scaling Factor'] = sim_dict[name]['Scaling Factor']
+        dset.attrs['Fingerprint'] = fingerprint
+
+    WriteScanTable(f)
+    f.close()
 
 def saveAsFileHDF5(fname, sample, data_dict, sim_dict, fit, optimization, version):
     """
@@ -540,6 +566,11 @@ def saveAsFileHDF5(fname, sample, data_dict, sim_dict, fit, optimization, versio
     :return:
     """
 
+    # scans read lazily from fname must be in memory before the file is cleared
+    for scans in [data_dict, sim_dict]:
+        if isinstance(scans, LazyScanDict):
+            scans.detach()
+
     f = h5py.File(fname, 'a')  # create fname hdf5 file
 
     # clears the data file if it already exists
@@ -574,7 +605,7 @@ def saveAsFileHDF5(fname, sample, data_dict, sim_dict, fit, optimization, versio
             dat = data_dict[name]['Data']
             dat = np.array(dat)
             m = np.shape(dat)
-            dset = energyScan.create_dataset(name, m, data=dat, maxshape=(4,None), chunks=True)
+            dset = _CreateScanDataset(energyScan, name, dat)
             dset.attrs['DatasetNumber'] = data_dict[name]['DatasetNumber']
             dset.attrs['DataPoints'] = data_dict[name]['DataPoints']
             dset.attrs['Energy'] = data_dict[name]['Energy']
@@ -584,7 +615,7 @@ def saveAsFileHDF5(fname, sample, data_dict, sim_dict, fit, optimization, versio
             dset.attrs['Scaling Factor'] = data_dict[name]['Scaling Factor']
 
             dat1 = sim_dict[name]['Data']
-            dset1 = simE.create_dataset(name, m, data=dat1,maxshape=(4,None), chunks=True)
+            dset1 = _CreateScanDataset(simE, name, dat1)
             dset1.attrs['DatasetNumber'] = sim_dict[name]['DatasetNumber']
             dset1.attrs['DataPoints'] = sim_dict[name]['DataPoints']
             dset1.attrs['Energy'] = sim_dict[name]['Energy']
@@ -597,7 +628,7 @@ def saveAsFileHDF5(fname, sample, data_dict, sim_dict, fit, optimization, versio
             dat = np.array(dat)
             m = np.shape(dat)
 
-            dset = reflScan.create_dataset(name, m, data=dat, maxshape=(3,None), chunks=True)
+            dset = _CreateScanDataset(reflScan, name, dat)
             dset.attrs['DatasetNumber'] = data_dict[name]['DatasetNumber']
             dset.attrs['DataPoints'] = data_dict[name]['DataPoints']
             dset.attrs['Energy'] = data_dict[name]['Energy']
@@ -606,7 +637,7 @@ def saveAsFileHDF5(fname, sample, data_dict, sim_dict, fit, optimization, versio
             dset.attrs['Scaling Factor'] = data_dict[name]['Scaling Factor']
 
             dat1 = sim_dict[name]['Data']
-            dset1 = simR.create_dataset(name, m, data=dat1, maxshape=(3,None), chunks=True)
+            dset1 = _CreateScanDataset(simR, name, dat1)
             dset1.attrs['DatasetNumber'] = sim_dict[name]['DatasetNumber']
             dset1.attrs['DataPoints'] = sim_dict[name]['DataPoints']
             dset1.attrs['Energy'] = sim_dict[name]['Energy']
@@ -742,6 +773,7 @@ def saveAsFileHDF5(fname, sample, data_dict, sim_dict, fit, optimization, versio
                 else:
                     reflScan[param[1]].attrs['Scaling Factor'] = float(sfBsVal[idx][0])
 
+    WriteScanTable(f)
     f.close()
 
 
@@ -872,6 +904,7 @@ def saveFileHDF5(fname, sample, data_dict, fit, optimization, version):
                 else:
                     reflScan[param[1]].attrs['Scaling Factor'] = float(sfBsVal[idx][0])
 
+    WriteScanTable(f)
     f.close()
 
 def newFileHDF5(fname, sample, version):
@@ -1091,7 +1124,7 @@ def createDataFileHDF5(fname, AScans, AInfo, EScans, EInfo):
 
         name = str(AInfo[i][0]) + "_" + str(np.round(energy, 2)) + "_" + polarization
 
-        dset = grpR.create_dataset(name, data=dat)
+        dset = _CreateScanDataset(grpR, name, dat)
 
         dset.attrs['Energy'] = float(energy)
 
@@ -1126,7 +1159,7 @@ def createDataFileHDF5(fname, AScans, AInfo, EScans, EInfo):
                     polarization = "AC"
                 name = str(AInfo[i - 1][0]) + "-" + str(AInfo[i][0]) + "_" + str(
                     np.round(energy, 2)) + "_" + polarization + "_Asymm"
-                dset = grpR.create_dataset(name, data=dat)
+                dset = _CreateScanDataset(grpR, name, dat)
 
                 dset.attrs['Energy'] = float(energy)
 
@@ -1167,7 +1200,7 @@ def createDataFileHDF5(fname, AScans, AInfo, EScans, EInfo):
 
         name = str(EInfo[i][0]) + "_E" + str(np.round(energy, 2)) + "_Th" + str(np.round(angle, 2)) + "_" + polarization
 
-        dset = grpE.create_dataset(name, data=dat)
+        dset = _CreateScanDataset(grpE, name, dat)
 
         dset.attrs['Energy'] = float(energy)
 
@@ -1206,7 +1239,7 @@ def createDataFileHDF5(fname, AScans, AInfo, EScans, EInfo):
                 name = str(EInfo[i - 1][0]) + "-" + str(EInfo[i][0]) + "_E" + str(np.round(energy, 2)) + "_Th" + str(
                     np.round(angle, 2)) + "_" + polarization + "_Asymm"
 
-                dset = grpE.create_dataset(name, data=dat)
+                dset = _CreateScanDataset(grpE, name, dat)
 
                 dset.attrs['Energy'] = float(energy)
 
@@ -1226,6 +1259,7 @@ def createDataFileHDF5(fname, AScans, AInfo, EScans, EInfo):
 
                 dsNum = dsNum + 1
 
+    WriteScanTable(f)
     f.close()
 
 def WriteDataHDF5(fname, AScans,AInfo, EScans, EInfo, sample):
@@ -1347,8 +1381,8 @@ def WriteDataHDF5(fname, AScans,AInfo, EScans, EInfo, sample):
         name = str(AInfo[i][0]) + "_" + str(np.round(energy,2)) + "_" + polarization
         qz, R = sample.reflectivity(energy, qz)
         sim = np.array([qz, Theta, R[polarization]])
-        dset = grpR.create_dataset(name, data=dat)
-        dset1 = subR.create_dataset(name, data=sim)
+        dset = _CreateScanDataset(grpR, name, dat)
+        dset1 = _CreateScanDataset(subR, name, sim)
 
         dset.attrs['Energy'] = float(energy)
         dset1.attrs['Energy'] = float(energy)
@@ -1388,10 +1422,10 @@ def WriteDataHDF5(fname, AScans,AInfo, EScans, EInfo, sample):
                 elif (AInfo[i - 1][1] == "L" or AInfo[i - 1][1] == "R"):
                     polarization = "AC"
                 name = str(AInfo[i-1][0])+ "-" + str(AInfo[i][0]) + "_" + str(np.round(energy,2)) +"_"+ polarization + "_Asymm"
-                dset = grpR.create_dataset(name, data=dat)
+                dset = _CreateScanDataset(grpR, name, dat)
                 qz, R = sample.reflectivity(energy, qz)
                 sim = np.array([qz,Theta,R[polarization]])
-                dset1 = subR.create_dataset(name,data = sim)
+                dset1 = _CreateScanDataset(subR, name, sim)
 
                 dset.attrs['Energy'] = float(energy)
                 dset1.attrs['Energy'] = float(energy)
@@ -1441,8 +1475,8 @@ def WriteDataHDF5(fname, AScans,AInfo, EScans, EInfo, sample):
         E, R = sample.energy_scan(angle,E)
         sim = np.array([qz, Theta, R[polarization], E])
 
-        dset = grpE.create_dataset(name, data=dat)
-        dset1 = subE.create_dataset(name, data=sim)
+        dset = _CreateScanDataset(grpE, name, dat)
+        dset1 = _CreateScanDataset(subE, name, sim)
 
         dset.attrs['Energy'] = float(energy)
         dset1.attrs['Energy'] = float(energy)
@@ -1489,8 +1523,8 @@ def WriteDataHDF5(fname, AScans,AInfo, EScans, EInfo, sample):
                 E, R = sample.energy_scan(angle, E)
                 sim = np.array([qz, Theta, R[polarization], E])
 
-                dset = grpE.create_dataset(name, data=dat)
-                dset1 = subE.create_dataset(name, data=sim)
+                dset = _CreateScanDataset(grpE, name, dat)
+                dset1 = _CreateScanDataset(subE, name, sim)
 
                 dset.attrs['Energy'] = float(energy)
                 dset1.attrs['Energy'] = float(energy)
@@ -1581,6 +1615,7 @@ def WriteDataHDF5(fname, AScans,AInfo, EScans, EInfo, sample):
     results.attrs['Value'] = str([])
     results.attrs['Chi'] = 0
 
+    WriteScanTable(f)
     f.close()
 
 def ReadFitHDF5(fname):
@@ -1770,147 +1805,377 @@ def ReadSampleHDF5(fname):
 
     return sample
 
-def ReadDataHDF5(fname):
+SCAN_LAYOUT_VERSION = 2  # version 1 files have no scan table and uncompressed scan datasets
+SCAN_GROUPS = [('Experimental_data', 'Reflectivity_Scan'), ('Experimental_data', 'Energy_Scan'),
+               ('Simulated_data', 'Reflectivity_Scan'), ('Simulated_data', 'Energy_Scan')]
+SCAN_TABLE_ATTRS = ['DatasetNumber', 'DataPoints', 'Energy', 'Angle', 'Polarization', 'Background Shift',
+                    'Scaling Factor']  # dataset attributes with their own column in the scan table
+
+
+def _CreateScanDataset(group, name, dat):
     """
-    Purpose: Reads in the experimental and simulated data from hdf5 file and then plots spectrum chosen by user
-    :param fname: File name
-    :return:
+    Purpose: Create a scan dataset in the current layout. The rows (qz, theta, R and E for energy scans) are kept
+             together and the dataset is chunked along the data points so simulations can be resized. The data is
+             compressed with gzip at level 1 (with the shuffle filter), which is fast enough to be used on every save and can be
+             read by every HDF5 build (HDFView, MATLAB, the HDF5 C library) without a filter plugin.
+    :param group: hdf5 group of the scan type
+    :param name: scan name
+    :param dat: scan data with shape (rows, data points)
+    :return: hdf5 dataset
     """
+    dat = np.asarray(dat, dtype=float)
+    return group.create_dataset(name, data=dat, maxshape=(dat.shape[0], None), chunks=True,
+                                compression='gzip', compression_opts=1, shuffle=True)
+
+
+def _ExtraAttrs(attrs):
+    # dataset attributes without a column in the scan table, kept as json so they are not lost by the table
+    extra = dict()
+    for key, val in attrs.items():
+        if key in SCAN_TABLE_ATTRS or key == 'Fingerprint':
+            continue
+        if isinstance(val, bytes):
+            val = val.decode()
+        elif isinstance(val, (np.ndarray, np.generic)):
+            val = val.tolist()
+        extra[key] = val
+    return json.dumps(extra)
+
+
+def _ScanTable(f):
+    # builds the scan table from the attributes of every scan dataset
+    rows = list()
+    for group, scanType in SCAN_GROUPS:
+        if group not in f or scanType not in f[group]:
+            continue
+        for name, dset in f[group][scanType].items():
+            attrs = dset.attrs
+            rows.append((group, scanType, name, int(attrs['DatasetNumber']), int(attrs.get('DataPoints', dset.shape[-1])),
+                         float(attrs['Energy']), float(attrs.get('Angle', np.nan)), str(attrs['Polarization']),
+                         float(attrs.get('Background Shift', 0)), float(attrs.get('Scaling Factor', 1)),
+                         _ExtraAttrs(attrs)))
+
+    strlen = [max([len(row[i].encode()) for row in rows] + [1]) for i in [0, 1, 2, 7, 10]]
+    dtype = [('Group', 'S%d' % strlen[0]), ('Scan Type', 'S%d' % strlen[1]), ('Name', 'S%d' % strlen[2]),
+             ('DatasetNumber', 'i8'), ('DataPoints', 'i8'), ('Energy', 'f8'), ('Angle', 'f8'),
+             ('Polarization', 'S%d' % strlen[3]), ('Background Shift', 'f8'), ('Scaling Factor', 'f8'),
+             ('Attributes', 'S%d' % strlen[4])]
+    return np.array([row[:10] + (row[10].encode(),) for row in rows], dtype=dtype)
+
+
+def WriteScanTable(f):
+    """
+    Purpose: Write the table of scan metadata (one row per experimental and simulated scan) to an open hdf5 file.
+             Every function that changes the scan attributes calls this before closing the file, the table is
+             only checked against the scan names when it is read so attributes changed without it are not seen.
+    :param f: hdf5 file opened for writing
+    """
+    if 'Scan_Table' in f:
+        del f['Scan_Table']
+    f.create_dataset('Scan_Table', data=_ScanTable(f))
+    f.attrs['Scan Layout'] = SCAN_LAYOUT_VERSION
 
-    f = h5py.File(fname, 'r')
-    experiment = f['Experimental_data']
-    simulation = f['Simulated_data']
 
-    RS = experiment['Reflectivity_Scan']
-    Rsim = simulation['Reflectivity_Scan']
+def ReadScanTable(f):
+    """
+    Purpose: Read the scan metadata table in a single call. Files written with an older layout have no table (or a
+             table that no longer holds the same scans) so the table is built from the dataset attributes instead.
+    :param f: file name or open hdf5 file
+    :return: structured numpy array with fields Group, Scan Type, Name, DatasetNumber, DataPoints, Energy,
+             Angle (nan for reflectivity scans), Polarization, Background Shift, Scaling Factor and Attributes (json
+             of the remaining dataset attributes)
+    """
+    if not isinstance(f, h5py.File):
+        with h5py.File(f, 'r') as file:
+            return ReadScanTable(file)
 
-    ES = experiment['Energy_Scan']
-    Esim = simulation['Energy_Scan']
+    if f.attrs.get('Scan Layout', 1) >= SCAN_LAYOUT_VERSION and 'Scan_Table' in f:
+        table = f['Scan_Table'][()]
+        if 'Attributes' in table.dtype.names:
+            names = set()
+            for group, scanType in SCAN_GROUPS:
+                if group in f and scanType in f[group]:
+                    names.update([(group, scanType, name) for name in f[group][scanType].keys()])
+            rows = set([(row['Group'].decode(), row['Scan Type'].decode(), row['Name'].decode()) for row in table])
+            if len(table) == len(names) and rows == names:
+                return table
 
-    # Collects data information to print to terminal
-    data = list()
-    data_dict = dict()
-    sim_dict = dict()
-
-    for Rkey in RS.keys():
-        mydata = RS[Rkey]
-        data_dict[Rkey] = RS[Rkey]
-        sim_dict[Rkey] = Rsim[Rkey]
-        Rdat = [int(mydata.attrs['DatasetNumber']),'Reflectivity', Rkey]
-        data.append(Rdat)
-
-    for Ekey in ES.keys():
-        mydata = ES[Ekey]
-        data_dict[Ekey] = ES[Ekey]
-        sim_dict[Ekey] = Esim[Ekey]
-        Edat = [int(mydata.attrs['DatasetNumber']),'Energy', Ekey]
-        data.append(Edat)
+    return _ScanTable(f)
 
-    # Sorts data in appropriate order
-    data = np.array(data)
-    sort_idx = np.argsort(data[:,0].astype(int))
-    data = data[sort_idx]
 
-    data_dict = hdf5ToDict(data_dict)
-    sim_dict = hdf5ToDict(sim_dict)
-    f.close()
+def ScanTableAttrs(row):
+    """
+    Purpose: Convert a row of the scan table into the scan attributes used in the data dictionaries
+    :param row: row of the scan table
+    :return: dictionary of scan attributes
+    """
+    attrs = dict()
+    attrs['DatasetNumber'] = int(row['DatasetNumber'])
+    attrs['DataPoints'] = int(row['DataPoints'])
+    attrs['Energy'] = float(row['Energy'])
+    if row['Scan Type'].decode() == 'Energy_Scan':
+        attrs['Angle'] = float(row['Angle'])
+    attrs['Polarization'] = row['Polarization'].decode()
+    attrs['Background Shift'] = float(row['Background Shift'])
+    attrs['Scaling Factor'] = float(row['Scaling Factor'])
+    attrs.update(json.loads(row['Attributes'].decode()))
+    return attrs
+
+
+def MigrateFileHDF5(fname, new_fname=None):
+    """
+    Purpose: Rewrite a project file in the current scan layout. The scans are written chunked and compressed and the
+             scan table is added, everything else is copied as is. The file is written to a new file so that the
+             space of the old datasets is released.
+    :param fname: project file to convert
+    :param new_fname: name of the converted file, the original file is replaced if None
+    """
+    target = fname + '.migrate' if new_fname is None else new_fname
 
-    return data, data_dict, sim_dict
+    with h5py.File(fname, 'r') as src, h5py.File(target, 'w') as dst:
+        for key, val in src.attrs.items():
+            dst.attrs[key] = val
 
+        for key in src.keys():
+            if key in ['Experimental_data', 'Simulated_data']:
+                group = dst.create_group(key)
+                for scanType in src[key].keys():
+                    subgroup = group.create_group(scanType)
+                    for name, dset in src[key][scanType].items():
+                        new = _CreateScanDataset(subgroup, name, dset[()])
+                        for attrskey, val in dset.attrs.items():
+                            new.attrs[attrskey] = val
+            elif key != 'Scan_Table':
+                src.copy(src[key], dst, name=key)
 
+        WriteScanTable(dst)
 
-def LoadDataHDF5(fname):
+    if new_fname is None:
+        os.replace(target, fname)
+
+
+class LazyScanDict(MutableMapping):
     """
-    Purpose: Reads in the experimental and simulated data from hdf5 file and then plots spectrum chosen by user
-    :param fname: File name
-    :return:
+    Purpose: Scan dictionary {name: {'Data': array, attribute: value, ...}} that reads a scan from the hdf5 file
+             the first time it is requested. The data is returned as a contiguous numpy array instead of a list of
+             rows. The file is only opened while a scan is read, which keeps it free for the GUI to write to.
     """
+    def __init__(self, fname, paths, attrs=None):
+        """
+        :param fname: hdf5 file name
+        :param paths: list of (scan name, dataset path) in the order the scans should be iterated
+        :param attrs: scan name -> scan attributes already read from the scan table, the dataset attributes are
+                      read for scans not included
+        """
+        self.fname = fname
+        self._entries = dict()  # scan name -> loaded scan dictionary or None if not yet read
+        self._paths = dict()
+        self._attrs = dict() if attrs is None else attrs
+        for name, path in paths:
+            self._entries[name] = None
+            self._paths[name] = path
+
+    def _read(self, f, name):
+        dset = f[self._paths[name]]
+        scan = {'Data': dset[()]}
+        if name in self._attrs:
+            scan.update(self._attrs[name])
+        else:
+            for attrskey, val in dset.attrs.items():
+                if attrskey != 'Fingerprint':
+                    scan[attrskey] = val
+        return scan
 
-    f = h5py.File(fname, 'r')
-    experiment = f['Experimental_data']
-    simulation = f['Simulated_data']
+    def __getitem__(self, key):
+        scan = self._entries[key]
+        if scan is None:
+            with h5py.File(self.fname, 'r') as f:
+                scan = self._read(f, key)
+            self._entries[key] = scan
+        return scan
 
-    RS = experiment['Reflectivity_Scan']
-    ES = experiment['Energy_Scan']
+    def __setitem__(self, key, value):
+        self._entries[key] = value
+        self._paths.pop(key, None)
 
-    RSim = simulation['Reflectivity_Scan']
-    ESim = simulation['Energy_Scan']
-    # Collects data information to print to terminal
+    def __delitem__(self, key):
+        del self._entries[key]
+        self._paths.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def loaded(self):
+        """
+        Purpose: Names of the scans held in memory
+        """
+        return [key for key, scan in self._entries.items() if scan is not None]
+
+    def load_all(self):
+        """
+        Purpose: Read every remaining scan with a single open of the hdf5 file
+        :return: self
+        """
+        missing = [key for key, scan in self._entries.items() if scan is None]
+        if len(missing) > 0:
+            with h5py.File(self.fname, 'r') as f:
+                for key in missing:
+                    self._entries[key] = self._read(f, key)
+        return self
+
+    def detach(self):
+        """
+        Purpose: Read every scan into memory so the dictionary no longer depends on the hdf5 file. This must be
+                 done before the file the scans were read from is overwritten.
+        :return: self
+        """
+        self.load_all()
+        self._paths = dict()
+        return self
+
+    def _new(self, entries):
+        new = LazyScanDict(self.fname, [], self._attrs)
+        new._entries = entries
+        new._paths = dict(self._paths)
+        return new
+
+    def __copy__(self):
+        # scans that have not been read stay lazy in the copy
+        return self._new(dict(self._entries))
+
+    def __deepcopy__(self, memo):
+        return self._new(copy.deepcopy(self._entries, memo))
+
+    def __reduce__(self):
+        # scans that have not been read stay lazy in the copy
+        return (_rebuild_scans, (self.fname, self._entries, self._paths, self._attrs))
+
+
+def _rebuild_scans(fname, entries, paths, attrs):
+    scans = LazyScanDict(fname, [], attrs)
+    scans._entries = entries
+    scans._paths = paths
+    return scans
+
+
+def _ScanIndexHDF5(fname):
+    # reads the scan table, none of the scan data is read
     data = list()
-    data_dict = dict()
-    sim_dict = dict()
-
-    for Rkey in RS.keys():
-        mydata = RS[Rkey]
-        data_dict[Rkey] = RS[Rkey]
-        sim_dict[Rkey] = RSim[Rkey]
-        Rdat = [int(mydata.attrs['DatasetNumber']),'Reflectivity', Rkey]
-        data.append(Rdat)
-
-    for Ekey in ES.keys():
-        mydata = ES[Ekey]
-        data_dict[Ekey] = ES[Ekey]
-        sim_dict[Ekey] = ESim[Ekey]
-        Edat = [int(mydata.attrs['DatasetNumber']),'Energy', Ekey]
-        data.append(Edat)
+    paths = {'Experimental_data': list(), 'Simulated_data': list()}
+    attrs = {'Experimental_data': dict(), 'Simulated_data': dict()}
+    labels = {'Reflectivity_Scan': 'Reflectivity', 'Energy_Scan': 'Energy'}
+
+    for row in ReadScanTable(fname):
+        group = row['Group'].decode()
+        scanType = row['Scan Type'].decode()
+        key = row['Name'].decode()
+
+        paths[group].append((key, group + '/' + scanType + '/' + key))
+        attrs[group][key] = ScanTableAttrs(row)
+        if group == 'Experimental_data':
+            data.append([int(row['DatasetNumber']), labels[scanType], key])
 
     # Sorts data in appropriate order
     data = np.array(data)
     sort_idx = np.argsort(data[:,0].astype(int))
     data = data[sort_idx]
 
-    data_dict = hdf5ToDict(data_dict)
-    sim_dict = hdf5ToDict(sim_dict)
-    f.close()
-
+    data_dict = LazyScanDict(fname, paths['Experimental_data'], attrs['Experimental_data'])
+    sim_dict = LazyScanDict(fname, paths['Simulated_data'], attrs['Simulated_data'])
     return data, data_dict, sim_dict
 
-def WriteSampleHDF5(fname, sample, version):
+
+def ReadDataHDF5(fname):
     """
-    Purpose: Write a new sample to the hdf5 file fname
+    Purpose: Reads in the experimental and simulated data from hdf5 file and then plots spectrum chosen by user
     :param fname: File name
-    :param sample: new sample information as sample type
-    :return:
+    :return: data info, experimental and simulated scan dictionaries (LazyScanDict, scans are read on first access)
     """
 
-    # deletes the previous sample information
-    with h5py.File(fname, "a") as f:
-        if 'Sample' in f:
-            del f['Sample']
-    f.close()
+    return _ScanIndexHDF5(fname)
 
-    f = h5py.File(fname, "a")
-    f.attrs['Version'] = version
-    grp1 = f.create_group('Sample')
 
-    for key in list(sample.poly_elements):
-        sample.poly_elements[key] = list(sample.poly_elements)
-    for key in list(sample.mag_elements):
-        sample.mag_elements[key] = list(sample.mag_elements)
 
+def LoadDataHDF5(fname):
+    """
+    Purpose: Reads in the experimental and simulated data from hdf5 file and then plots spectrum chosen by user
+    :param fname: File name
+    :return: data info, experimental and simulated scan dictionaries (LazyScanDict, scans are read on first access)
+    """
+
+    return _ScanIndexHDF5(fname)
+
+def _UpdateFingerprint(h, item):
+    # hashes containers element by element so numpy arrays are hashed by content and never by their truncated repr
+    if isinstance(item, np.ndarray):
+        h.update(repr((item.dtype.str, item.shape)).encode())
+        h.update(np.ascontiguousarray(item).tobytes())
+    elif isinstance(item, bytes):
+        h.update(item)
+    elif isinstance(item, dict):
+        h.update(b'{')
+        for key, val in item.items():
+            _UpdateFingerprint(h, key)
+            _UpdateFingerprint(h, val)
+        h.update(b'}')
+    elif isinstance(item, (list, tuple)):
+        h.update(b'[')
+        for val in item:
+            _UpdateFingerprint(h, val)
+        h.update(b']')
+    elif hasattr(item, '__dict__'):  # slab objects are hashed by their attributes
+        h.update(type(item).__name__.encode())
+        _UpdateFingerprint(h, vars(item))
+    elif hasattr(item, '__slots__'):  # element objects are hashed by their slots
+        h.update(type(item).__name__.encode())
+        _UpdateFingerprint(h, {key: getattr(item, key) for key in item.__slots__ if hasattr(item, key)})
+    else:
+        h.update(repr(item).encode())
+        h.update(b',')
+
+
+def Fingerprint(*items):
+    """
+    Purpose: Content hash used to find the parts of a project that changed since they were last saved or computed
+    :param items: numbers, strings, bytes, numpy arrays, objects and (nested) lists, tuples and dictionaries of these
+    :return: hexadecimal sha1 digest
+    """
+    h = hashlib.sha1()
+    for item in items:
+        _UpdateFingerprint(h, item)
+    return h.hexdigest()
+
+
+def _SampleRecords(sample):
+    # attributes of the Sample group and of every layer and element group as they are written to the hdf5 file
     m = len(sample.structure)
-    grp1.attrs['findFF'] = str(sample.find_sf)
-    grp1.attrs['NumberLayers'] = int(m)
-    grp1.attrs['PolyElements'] = str(sample.poly_elements)
-    grp1.attrs['MagElements'] = str(sample.mag_elements)
-    grp1.attrs['LayerMagnetized'] = np.array(sample.layer_magnetized)
+    root = dict()
+    root['findFF'] = str(sample.find_sf)
+    root['NumberLayers'] = int(m)
+    root['PolyElements'] = str(sample.poly_elements)
+    root['MagElements'] = str(sample.mag_elements)
+    root['LayerMagnetized'] = np.array(sample.layer_magnetized)
 
     scattering_factor = sample.eShift
     mag_scattering_factor = sample.mag_eShift
 
-    grp1.attrs['FormFactors'] = str(scattering_factor)
-    grp1.attrs['MagFormFactors'] = str(mag_scattering_factor)
+    root['FormFactors'] = str(scattering_factor)
+    root['MagFormFactors'] = str(mag_scattering_factor)
 
-    grp1.attrs['ffScale'] = str(sample.ff_scale)
-    grp1.attrs['ffmScale'] = str(sample.ffm_scale)
+    root['ffScale'] = str(sample.ff_scale)
+    root['ffmScale'] = str(sample.ffm_scale)
 
     # Sets the information for each layer
-    dsLayer = 0
-    for my_layer in sample.structure:
-        name = "Layer_" + str(dsLayer)
-        layer = grp1.create_group(name)
-        layer.attrs['LayerNumber'] = int(dsLayer)
-
+    layers = list()
+    for dsLayer, my_layer in enumerate(sample.structure):
+        layer = dict()
+        layer['LayerNumber'] = int(dsLayer)
 
         formula = ''
         for ele in list(my_layer.keys()):
@@ -1921,163 +2186,446 @@ def WriteSampleHDF5(fname, sample, version):
                 if not(c.isdigit()):
                     new_ele = new_ele + c
 
-
-
             if stoich == 1:
                 formula = formula + new_ele
             else:
                 formula = formula + new_ele + str(stoich)
 
-
-
-        layer.attrs['Formula'] = formula
+        layer['Formula'] = formula
 
         # Sets the information for each element
+        elements = dict()
         for ele in list(my_layer.keys()):
-            element = layer.create_group(ele)
-
-            element.attrs['MolarMass'] = my_layer[ele].molar_mass
-            element.attrs['Density'] = my_layer[ele].density
-            element.attrs['Thickness'] = my_layer[ele].thickness
-            element.attrs['Roughness'] = my_layer[ele].roughness
-            element.attrs['LinkedRoughness'] = my_layer[ele].linked_roughness
-            element.attrs['PolyRatio'] = my_layer[ele].poly_ratio
-            element.attrs['Polymorph'] = my_layer[ele].polymorph
-            element.attrs['Gamma'] = my_layer[ele].gamma
-            element.attrs['Phi'] = my_layer[ele].phi
+            element = dict()
+            element['MolarMass'] = my_layer[ele].molar_mass
+            element['Density'] = my_layer[ele].density
+            element['Thickness'] = my_layer[ele].thickness
+            element['Roughness'] = my_layer[ele].roughness
+            element['LinkedRoughness'] = my_layer[ele].linked_roughness
+            element['PolyRatio'] = my_layer[ele].poly_ratio
+            element['Polymorph'] = my_layer[ele].polymorph
+            element['Gamma'] = my_layer[ele].gamma
+            element['Phi'] = my_layer[ele].phi
 
             if len(my_layer[ele].mag_density) == 0:
-                element.attrs['Magnetic'] = False
+                element['Magnetic'] = False
             else:
-                element.attrs['Magnetic'] = True
+                element['Magnetic'] = True
 
-                element.attrs['MagDensity'] = my_layer[ele].mag_density
-                element.attrs['MagScatteringFactor'] = my_layer[ele].mag_scattering_factor
+                element['MagDensity'] = my_layer[ele].mag_density
+                element['MagScatteringFactor'] = my_layer[ele].mag_scattering_factor
 
-            element.attrs['ScatteringFactor'] = list(my_layer[ele].scattering_factor)
+            element['ScatteringFactor'] = list(my_layer[ele].scattering_factor)
 
-            element.attrs['Position'] = my_layer[ele].position
+            element['Position'] = my_layer[ele].position
+            elements[ele] = element
 
-        dsLayer = dsLayer + 1
+        layers.append((layer, elements))
 
-    f.close()
+    return root, layers
+
+
+def _WriteAttrs(obj, attrs):
+    # replaces all attributes of an hdf5 group or dataset
+    for key in list(obj.attrs.keys()):
+        if key not in attrs:
+            del obj.attrs[key]
+    for key, val in attrs.items():
+        obj.attrs[key] = val
 
 
-def WriteHDF5Simulation(sample):
+def WriteSampleHDF5(fname, sample, version):
+    """
+    Purpose: Write a new sample to the hdf5 file fname. Every group carries a fingerprint of its content so only the
+             sample attributes and layers that changed since the last save are rewritten.
+    :param fname: File name
+    :param sample: new sample information as sample type
+    :return:
     """
-        Purpose: Write a new sample to the hdf5 file fname
-        :param fname: File name
-        :param sample: new sample information as sample type
-        :return:
-        """
 
-    # deletes the previous sample information
+    for key in list(sample.poly_elements):
+        sample.poly_elements[key] = list(sample.poly_elements)
+    for key in list(sample.mag_elements):
+        sample.mag_elements[key] = list(sample.mag_elements)
+
+    root, layers = _SampleRecords(sample)
+
     with h5py.File(fname, "a") as f:
-        if 'Sample' in f:
-            del f['Sample']
-    f.close()
+        f.attrs['Version'] = version
+        if 'Sample' not in f:
+            f.create_group('Sample')
+        grp1 = f['Sample']
 
-    f = h5py.File(fname, "a")
-    grp1 = f.create_group('Sample')
+        fingerprint = Fingerprint(root)
+        if grp1.attrs.get('Fingerprint') != fingerprint:
+            _WriteAttrs(grp1, root)
+            grp1.attrs['Fingerprint'] = fingerprint
 
-    # Sets the general sample information
-    m = len(sample.structure)
-    grp1.attrs['NumberLayers'] = int(m)
-    grp1.attrs['PolyElements'] = str(sample.poly_elements)
-    grp1.attrs['MagElements'] = str(sample.mag_elements)
-    grp1.attrs['LayerMagnetized'] = np.array(sample.layer_magnetized)
+        for dsLayer, (layerAttrs, elements) in enumerate(layers):
+            name = "Layer_" + str(dsLayer)
+            fingerprint = Fingerprint(layerAttrs, elements)
+            if name in grp1:
+                if grp1[name].attrs.get('Fingerprint') == fingerprint:
+                    continue  # layer unchanged
+                del grp1[name]
 
-    scattering_factor = sample.eShift
-    mag_scattering_factor = sample.mag_eShift
+            layer = grp1.create_group(name)
+            _WriteAttrs(layer, layerAttrs)
+            for ele, eleAttrs in elements.items():
+                element = layer.create_group(ele)
+                _WriteAttrs(element, eleAttrs)
+            layer.attrs['Fingerprint'] = fingerprint
 
-    grp1.attrs['FormFactors'] = str(scattering_factor)
-    grp1.attrs['MagFormFactors'] = str(mag_scattering_factor)
+        # removes layers that are no longer part of the sample
+        for name in list(grp1.keys()):
+            if name.startswith('Layer_') and int(name[6:]) >= len(layers):
+                del grp1[name]
 
-    grp1.attrs['ffScale'] = str(sample.ff_scale)
-    grp1.attrs['ffmScale'] = str(sample.ffm_scale)
 
-    # Sets the information for each layer
-    dsLayer = 0
-    for my_layer in sample.structure:
-        name = "Layer_" + str(dsLayer)
-        layer = grp1.create_group(name)
-        layer.attrs['LayerNumber'] = int(dsLayer)
-        ### Need to change back to previous version
+_SAMPLE_HEADER = ['number_layers', 'link', 'myelements', 'poly_elements', 'mag_elements', 'find_sf', 'transition',
+                  'layer_magnetized', 'eShift', 'mag_eShift', 'ff_scale', 'ffm_scale']
 
-        formula = ''
-        for ele in list(my_layer.keys()):
-            stoich = my_layer[ele].stoichiometry
-            if stoich == 1:
-                formula = formula + ele
-            else:
-                formula = formula + ele + str(stoich)
-        layer.attrs['Formula'] = formula
 
-        # Sets the information for each element
-        for ele in list(my_layer.keys()):
-            element = layer.create_group(ele)
+def _TextWidth(strings):
+    # numpy unicode dtype wide enough for every string (at least one character)
+    return 'U' + str(max([len(str(string)) for string in strings] + [1]))
 
-            element.attrs['MolarMass'] = my_layer[ele].molar_mass
-            element.attrs['Density'] = my_layer[ele].density
-            element.attrs['Thickness'] = my_layer[ele].thickness
-            element.attrs['Roughness'] = my_layer[ele].roughness
-            element.attrs['LinkedRoughness'] = my_layer[ele].linked_roughness
-            element.attrs['PolyRatio'] = my_layer[ele].poly_ratio
-            element.attrs['Polymorph'] = my_layer[ele].polymorph
-            element.attrs['Gamma'] = my_layer[ele].gamma
-            element.attrs['Phi'] = my_layer[ele].phi
 
-            if len(my_layer[ele].mag_density) == 0:
-                element.attrs['Magnetic'] = False
+def SampleToArray(sample):
+    """
+    Purpose: Flat representation of a slab. Every element of every layer is a row of a numpy structured array and the
+             polymorphs and magnetic components of the elements are rows of a second structured array, so a snapshot
+             of the sample is copied, pickled or sent to a worker process as a few contiguous buffers.
+    :param sample: slab class
+    :return: records - structured array with one row per element in layer order
+             variations - structured array with the polymorph and magnetic rows of the elements
+             header - dictionary of the slab attributes that do not belong to a layer
+    """
+    rows = list()
+    variations = list()
+    for layer, my_layer in enumerate(sample.structure):
+        for symbol, ele in my_layer.items():
+            polymorph = list(ele.polymorph)
+            mag_density = list(ele.mag_density)
+            mag_sf = list(ele.mag_scattering_factor)
+            if isinstance(ele.scattering_factor, str):
+                sf = ele.scattering_factor
+                sf_list = []
+                n_sf = -1  # scattering factor is a single name
             else:
-                element.attrs['Magnetic'] = True
-                element.attrs['MagDensity'] = my_layer[ele].mag_density
-                element.attrs['MagScatteringFactor'] = my_layer[ele].mag_scattering_factor
+                sf = ''
+                sf_list = list(ele.scattering_factor)
+                n_sf = len(sf_list)
+
+            # the roughness is only linked to the layer below for python floats and integers
+            linked = type(ele.linked_roughness) is float or type(ele.linked_roughness) is int
+            if ele.linked_roughness is None or np.asarray(ele.linked_roughness).dtype.kind == 'b':
+                linked_roughness = np.nan
+            else:
+                linked_roughness = ele.linked_roughness
 
-            element.attrs['ScatteringFactor'] = my_layer[ele].scattering_factor
-            element.attrs['Position'] = my_layer[ele].position
+            if len(polymorph) == 0:
+                poly_ratio = ele.poly_ratio
+                ratio = []
+            else:
+                poly_ratio = np.nan
+                ratio = list(np.ravel(ele.poly_ratio))
+
+            n = max(len(polymorph), len(ratio), len(mag_density), len(mag_sf), n_sf)
+            rows.append((layer, symbol, ele.name, ele.position, ele.stoichiometry, ele.molar_mass, ele.density,
+                         ele.thickness, ele.roughness, linked_roughness, linked, ele.gamma, ele.phi, poly_ratio, sf,
+                         len(variations), len(polymorph), len(mag_density), len(mag_sf), n_sf))
+            for i in range(n):
+                variations.append((polymorph[i] if i < len(polymorph) else '',
+                                   ratio[i] if i < len(ratio) else np.nan,
+                                   sf_list[i] if i < len(sf_list) else '',
+                                   mag_sf[i] if i < len(mag_sf) else '',
+                                   mag_density[i] if i < len(mag_density) else np.nan))
+
+    names = [row[1] for row in rows] + [row[2] for row in rows]
+    records = np.array(rows, dtype=[('layer', 'i4'), ('symbol', _TextWidth(names)), ('name', _TextWidth(names)),
+                                    ('position', 'i4'), ('stoichiometry', 'f8'), ('molar_mass', 'f8'),
+                                    ('density', 'f8'), ('thickness', 'f8'), ('roughness', 'f8'),
+                                    ('linked_roughness', 'f8'), ('linked', '?'), ('gamma', 'f8'), ('phi', 'f8'),
+                                    ('poly_ratio', 'f8'), ('scattering_factor', _TextWidth([row[14] for row in rows])),
+                                    ('start', 'i4'), ('n_poly', 'i4'), ('n_mag', 'i4'), ('n_mag_sf', 'i4'),
+                                    ('n_sf', 'i4')])
+    variations = np.array(variations, dtype=[('polymorph', _TextWidth([var[0] for var in variations])),
+                                             ('poly_ratio', 'f8'),
+                                             ('scattering_factor', _TextWidth([var[2] for var in variations])),
+                                             ('mag_scattering_factor', _TextWidth([var[3] for var in variations])),
+                                             ('mag_density', 'f8')])
+
+    header = copy.deepcopy({key: getattr(sample, key) for key in _SAMPLE_HEADER})
+    return records, variations, header
+
+
+def ArrayToSample(records, variations, header):
+    """
+    Purpose: Recreate the slab of SampleToArray
+    :param records: structured array with one row per element
+    :param variations: structured array with the polymorph and magnetic rows of the elements
+    :param header: dictionary of the slab attributes that do not belong to a layer
+    :return: sample - slab class
+    """
+    sample = slab(int(header['number_layers']))
+    for key, val in copy.deepcopy(header).items():
+        setattr(sample, key, val)
+
+    for row in records.tolist():
+        (layer, symbol, name, position, stoich, molar_mass, density, thickness, roughness, linked_roughness, linked,
+         gamma, phi, poly_ratio, sf, start, n_poly, n_mag, n_mag_sf, n_sf) = row
+
+        ele = element(name, int(stoich) if float(stoich).is_integer() else stoich)
+        ele.position = position
+        ele.molar_mass = molar_mass
+        ele.density = density
+        ele.thickness = thickness
+        ele.roughness = roughness
+        if np.isnan(linked_roughness):
+            ele.linked_roughness = False
+        elif linked:
+            ele.linked_roughness = linked_roughness
+        else:
+            ele.linked_roughness = np.float64(linked_roughness)
+        ele.gamma = gamma
+        ele.phi = phi
+
+        var = variations[start:start + max(n_poly, n_mag, n_mag_sf, n_sf)]
+        ele.polymorph = var['polymorph'][:n_poly].tolist()
+        if n_poly == 0:
+            ele.poly_ratio = int(poly_ratio) if float(poly_ratio).is_integer() else poly_ratio
+        else:
+            ele.poly_ratio = var['poly_ratio'][:n_poly].copy()
+        ele.scattering_factor = sf if n_sf < 0 else var['scattering_factor'][:n_sf].tolist()
+        ele.mag_scattering_factor = var['mag_scattering_factor'][:n_mag_sf].tolist()
+        ele.mag_density = var['mag_density'][:n_mag].copy() if n_mag > 0 else []
 
-        dsLayer = dsLayer + 1
+        sample.structure[layer][symbol] = ele
 
-    h = 4.135667696e-15  # Plank's constant eV*s
-    c = 2.99792458e8  # speed of light m/s
+    return sample
 
-    grp2 = f["Simulated_data"]
 
-    grpR = grp2["Reflectivity_Scan"]
-    grpE = grp2["Energy_Scan"]
+_simulationCache = dict()  # (sample state, scan and settings, form factor identity) -> simulated scan of every polarization
+_SIMULATION_CACHE_SIZE = 4096  # oldest results are removed first
+_simulationWorker = dict()  # sample and settings of a worker process
 
-    # Recalculate the simulated reflectivity scan data
-    for key in list(grpR.keys()):
-        dset = grpR[key]  # retrieves the old data set
-        Rdata = list(dset)  # gets the dataset information
-        qz = np.array(Rdata[0])  # retrieves the momentum transfer
-        E = float(dset.attrs['Energy'])  # retrieves the energy
-        polarization = dset.attrs['Polarization']  # retrieves the polarization
 
-        qz, R = sample.reflectivity(E, qz)  # computes reflecticity
-        Rdata[2] = R[polarization]  # retrieves appropriate reflectivity for the correct polarization
-        dset[...] = Rdata  # overwrites previous dataset with new data
+def ClearSimulationCache():
+    """
+    Purpose: Remove all cached simulations, needed if the form factor database is changed in place
+    """
+    _simulationCache.clear()
 
-    # Recalculates the simulated energy scan data
-    for key in list(grpE.keys()):
-        dset = grpE[key]  # retrieves the old data set
-        Edata = list(dset)  # gets the dataset information
-        E = Edata[3]  # retrieves the numpy energy array
-        theta = dset.attrs['Angle']  # retrieves the angle
-        polarization = dset.attrs['Polarization']  # retrieves the polarization
-        E, R = sample.energy_scan(theta, E)  # recomputes the energy scan
-        Edata[2] = R[polarization]  # retrieves appropriate reflectivity with the correct polarization
-        dset[...] = Edata  # overwrites previous data with new data
 
-    f.close()
+def _FormFactorKey(sf_dict):
+    # identity of the form factors, replacing an entry of sf_dict or of the form factor database changes the key
+    return (tuple((key, id(value)) for key, value in sf_dict.items()),
+            id(material_model.ff), material_model.ff.version, id(material_model.ffm), material_model.ffm.version)
+
+
+def _SampleKey(sample):
+    # the first simulation of a slab fills in attributes such as the form factor shifts and scales, the fingerprint is
+    # taken in that state so a sample has the same key before and after it is simulated
+    sample.energy_shift()
+    return Fingerprint(sample)
+
+
+def _ScanKey(sampleKey, method, x, axis, precision, s_min, bShift, sFactor, sf_dict):
+    # cache key of a simulated scan, method is the simulation method of the slab class
+    return (sampleKey, Fingerprint(method, float(x), np.asarray(axis, dtype=float), float(precision), float(s_min),
+                                   float(bShift), float(sFactor)), _FormFactorKey(sf_dict))
+
+
+def _StoreScan(key, axis, R, sf_dict):
+    # sf_dict and its entries are kept with the result so their ids can not be reused by other objects
+    _simulationCache[key] = (axis, R, (sf_dict, tuple(sf_dict.values())))
+    while len(_simulationCache) > _SIMULATION_CACHE_SIZE:
+        del _simulationCache[next(iter(_simulationCache))]
+
+
+def _CachedScan(sample, method, x, axis, precision, s_min, bShift, sFactor, sf_dict, engine):
+    if engine == 'udkm1Dsim':
+        method = method + '_udkm'
+
+    axis = np.asarray(axis, dtype=float)
+    key = _ScanKey(_SampleKey(sample), method, x, axis, precision, s_min, bShift, sFactor, sf_dict)
+    if key not in _simulationCache:
+        axis_sim, R = getattr(sample, method)(x, axis, precision=precision, s_min=s_min, bShift=bShift,
+                                              sFactor=sFactor, sf_dict=sf_dict)
+        _StoreScan(key, axis_sim, R, sf_dict)
+
+    axis_sim, R, refs = _simulationCache[key]
+    return np.array(axis_sim), {pol: np.array(R[pol]) for pol in R}
+
+
+def CachedReflectivity(sample, E, qz, precision=1e-6, s_min=0.1, bShift=0, sFactor=1, sf_dict={},
+                       engine='PythonReflectivity'):
+    """
+    Purpose: sample.reflectivity (or reflectivity_udkm) for plots and cost displays. The result is taken from memory
+             if the same sample, form factors, momentum transfer and settings were already computed.
+    :param sample: slab class
+    :param E: energy of the scan (eV)
+    :param qz: momentum transfer
+    :param precision: precision of the adaptive layer segmentation
+    :param s_min: minimum slab thickness
+    :param bShift: background shift
+    :param sFactor: scaling factor
+    :param sf_dict: form factor dictionary
+    :param engine: reflectivity engine ('PythonReflectivity' or 'udkm1Dsim')
+    :return: momentum transfer and a dictionary of the reflectivity of every polarization (copies)
+    """
+    return _CachedScan(sample, 'reflectivity', E, qz, precision, s_min, bShift, sFactor, sf_dict, engine)
+
+
+def CachedEnergyScan(sample, Theta, E, precision=1e-11, s_min=0.1, bShift=0, sFactor=1, sf_dict={},
+                     engine='PythonReflectivity'):
+    """
+    Purpose: sample.energy_scan (or energy_scan_udkm) for plots and cost displays. The result is taken from memory
+             if the same sample, form factors, energies and settings were already computed.
+    :param sample: slab class
+    :param Theta: grazing angle of the scan (degrees)
+    :param E: energies of the scan (eV)
+    :param precision: precision of the adaptive layer segmentation
+    :param s_min: minimum slab thickness
+    :param bShift: background shift
+    :param sFactor: scaling factor
+    :param sf_dict: form factor dictionary
+    :param engine: reflectivity engine ('PythonReflectivity' or 'udkm1Dsim')
+    :return: energies and a dictionary of the reflectivity of every polarization (copies)
+    """
+    return _CachedScan(sample, 'energy_scan', Theta, E, precision, s_min, bShift, sFactor, sf_dict, engine)
+
+
+def _SimulationTasks(sim_dict, data_dict):
+    # (name, angle or None, energy, axis, polarization, background shift, scaling factor) for every scan
+    tasks = list()
+    for name in list(sim_dict.keys()):
+        scan = sim_dict[name]
+        bShift = data_dict[name]['Background Shift']
+        sFactor = data_dict[name]['Scaling Factor']
+        if 'Angle' in scan.keys():  # energy scan
+            tasks.append((name, scan['Angle'], scan['Energy'], np.array(scan['Data'][3]), scan['Polarization'], bShift, sFactor))
+        else:  # reflectivity scan
+            tasks.append((name, None, scan['Energy'], np.array(scan['Data'][0]), scan['Polarization'], bShift, sFactor))
+    return tasks
+
+
+def _TaskKey(sampleKey, task, s_min, precision, Eprecision, sf_dict):
+    # the same key as CachedReflectivity and CachedEnergyScan use for the scan
+    name, angle, energy, axis, pol, bShift, sFactor = task
+    if angle is not None:
+        return _ScanKey(sampleKey, 'energy_scan', angle, axis, Eprecision, s_min, bShift, sFactor, sf_dict)
+    return _ScanKey(sampleKey, 'reflectivity', energy, axis, precision, s_min, bShift, sFactor, sf_dict)
+
+
+def _SimulateScan(sample, task, s_min, precision, Eprecision, sf_dict):
+    # simulated scan of every polarization
+    name, angle, energy, axis, pol, bShift, sFactor = task
+    if angle is not None:
+        return sample.energy_scan(angle, axis, precision=Eprecision, s_min=s_min, bShift=bShift, sFactor=sFactor,
+                                  sf_dict=sf_dict)
+    return sample.reflectivity(energy, axis, precision=precision, s_min=s_min, bShift=bShift, sFactor=sFactor,
+                               sf_dict=sf_dict)
+
+
+def _InitSimulationWorker(compact, s_min, precision, Eprecision, sf_dict):
+    # the sample is sent once to every worker instead of with every scan, as the arrays of SampleToArray
+    _simulationWorker['args'] = (ArrayToSample(*compact), s_min, precision, Eprecision, sf_dict)
+
+
+def _SimulationWorker(task):
+    sample, s_min, precision, Eprecision, sf_dict = _simulationWorker['args']
+    return _SimulateScan(sample, task, s_min, precision, Eprecision, sf_dict)
+
+
+def SimulateScans(sample, sim_dict, data_dict=None, s_min=0.1, precision=1e-6, Eprecision=1e-11, sf_dict={},
+                  processes=1, callback=None):
+    """
+    Purpose: Recompute the simulated reflectivity of every scan from the sample model. Scans that were already
+             simulated for the same sample, form factors, scan axis and settings are taken from the cache shared with
+             CachedReflectivity and CachedEnergyScan, the remaining scans are distributed over a pool of worker
+             processes.
+    :param sample: slab class
+    :param sim_dict: simulation dictionary, the reflectivity is written to row 2 of each scan's data
+    :param data_dict: dictionary the background shift and scaling factor are taken from (default sim_dict)
+    :param s_min: minimum slab thickness
+    :param precision: precision of the reflectivity scans
+    :param Eprecision: precision of the energy scans
+    :param sf_dict: form factor dictionary
+    :param processes: number of worker processes, the scans are computed in this process if 1
+    :param callback: function called with the number of scans done
+    :return: sim_dict
+    """
+    if data_dict is None:
+        data_dict = sim_dict
+
+    tasks = _SimulationTasks(sim_dict, data_dict)
+    sampleKey = _SampleKey(sample)
+
+    results = dict()
+    todo = list()
+    for task in tasks:
+        key = _TaskKey(sampleKey, task, s_min, precision, Eprecision, sf_dict)
+        if key in _simulationCache:
+            results[task[0]] = _simulationCache[key][1][task[4]]
+        else:
+            todo.append((key, task))
+
+    done = len(results)
+    if callback is not None:
+        callback(done)
+
+    if processes > 1 and len(todo) > 1:
+        pool = mp.Pool(min(processes, len(todo)), initializer=_InitSimulationWorker,
+                       initargs=(SampleToArray(sample), s_min, precision, Eprecision, sf_dict))
+        computed = pool.imap(_SimulationWorker, [task for key, task in todo])
+    else:
+        pool = None
+        computed = (_SimulateScan(sample, task, s_min, precision, Eprecision, sf_dict) for key, task in todo)
+
+    try:
+        for (key, task), (axis, R) in zip(todo, computed):
+            results[task[0]] = R[task[4]]
+            _StoreScan(key, axis, R, sf_dict)
+            done = done + 1
+            if callback is not None:
+                callback(done)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    for name, R in results.items():
+        sim_dict[name]['Data'][2] = np.array(R)
+
+    return sim_dict
+
+
+def WriteHDF5Simulation(fname, sample, version, s_min=0.1, precision=1e-6, Eprecision=1e-11, sf_dict={}, processes=1):
+    """
+        Purpose: Write a new sample to the hdf5 file fname and recompute the simulated scans
+        :param fname: File name
+        :param sample: new sample information as sample type
+        :param version: GO-RXR version
+        :param processes: number of worker processes used for the simulations
+        :return:
+        """
+
+    WriteSampleHDF5(fname, sample, version)
+
+    data, data_dict, sim_dict = ReadDataHDF5(fname)
+    sim_dict = SimulateScans(sample, sim_dict, data_dict, s_min=s_min, precision=precision, Eprecision=Eprecision,
+                             sf_dict=sf_dict, processes=processes)
+
+    saveSimulationHDF5(fname, sim_dict, version)
 
 def updateHDF5Data(fname, scalingFactor, backgroundShift):
 
     h = 4.135667696e-15  # Plank's constant eV*s
     c = 2.99792458e8  # speed of light m/s
 
-    f = h5py.File(fname, 'r')
+    f = h5py.File(fname, 'a')
     experiment = f['Experimental_data']
 
     RS = experiment['Reflectivity_Scan']
@@ -2088,16 +2636,17 @@ def updateHDF5Data(fname, scalingFactor, backgroundShift):
     # Recalculate the simulated reflectivity scan data
     idx = 0
     for key in list(RS.keys()):
-        RS[key].attrs['ScalingFactor'] = scalingFactor[idx]
-        RS[key].attrs['BackgroundShift'] = backgroundShift[idx]
+        RS[key].attrs['Scaling Factor'] = scalingFactor[idx]
+        RS[key].attrs['Background Shift'] = backgroundShift[idx]
         idx = idx + 1
 
     # Recalculates the simulated energy scan data
     for key in list(ES.keys()):
-        ES[key].attrs['ScalingFactor'] = scalingFactor[idx]
-        ES[key].attrs['BackgroundShift'] = backgroundShift[idx]
+        ES[key].attrs['Scaling Factor'] = scalingFactor[idx]
+        ES[key].attrs['Background Shift'] = backgroundShift[idx]
         idx = idx + 1
 
+    WriteScanTable(f)
     f.close()
 
 
@@ -2455,7 +3004,7 @@ def WriteDataASCII(fname,AScans,AInfo,EScans,EInfo, sample):
     WriteSampleASCII(file, sample)  # writes the sample information
     WriteExperimentalDataASCII(file, AScans,AInfo,EScans,EInfo)  # writes the experimental data
     WriteSimulationASCII(file, AScans, AInfo, EScans, EInfo, sample)  # writes the simulation data
-    f.close()
+    file.close()
 
 def getScanInfo(title):
     """
@@ -2612,8 +3161,8 @@ def ConvertASCIItoHDF5(fascii, fhdf5):
 
             datasetpoints = len(qz)
 
-            dset = grpR.create_dataset(name, data=dat)
-            dset1 = subR.create_dataset(name, data=sim)
+            dset = _CreateScanDataset(grpR, name, dat)
+            dset1 = _CreateScanDataset(subR, name, sim)
 
 
             dset.attrs['Energy'] = float(energy)
@@ -2650,8 +3199,8 @@ def ConvertASCIItoHDF5(fascii, fhdf5):
                 name = str(info['dataNumber']) + "_E" +str(np.round(energy,2)) + "_Th" + str(np.round(angle,2)) + "_" + info['polarization'] + "_Asymm"
 
             datasetpoints = len(E)
-            dset = grpE.create_dataset(name, data=dat)
-            dset1 = subE.create_dataset(name, data=sim)
+            dset = _CreateScanDataset(grpE, name, dat)
+            dset1 = _CreateScanDataset(subE, name, sim)
 
             dset.attrs['Energy'] = float(energy)
             dset1.attrs['Energy'] = float(energy)
@@ -2670,415 +3219,327 @@ def ConvertASCIItoHDF5(fascii, fhdf5):
             dsNum = dsNum + 1
 
 
+    WriteScanTable(f)
     f.close()
 
 
+def _FindLines(mm, word, prefix, start, end):
+    """
+    Purpose: Find the lines of a memory mapped file that start with a word. The word is searched as a literal and
+             only the matches are checked to be at the start of a line.
+    :param mm: memory mapped file
+    :param word: first word of the line as bytes
+    :param prefix: tokens allowed before the word (b'' or b'#')
+    :param start: offset to start the search at
+    :param end: offset to end the search at
+    :return: list of the offsets of the lines
+    """
+    offsets = list()
+    pos = mm.find(word, start, end)
+    while pos != -1:
+        line = max(mm.rfind(b'\n', start, pos) + 1, start)
+        after = mm[pos + len(word):pos + len(word) + 1]
+        if mm[line:pos].strip() == prefix and (after == b'' or after.isspace()):
+            offsets.append(line)
+        pos = mm.find(word, pos + len(word), end)
+    return offsets
+
+
+def _KeyValueTokens(block):
+    """
+    Purpose: Split a block of 'key = value' lines into keys and values. The whole block is split in one call and
+             the lines are only checked one at a time if the block is not made of three token lines.
+    :param block: bytes of the 'key = value' lines
+    :return: lists of the keys and the values (as bytes)
+    """
+    tokens = block.split()
+    if len(tokens) % 3 == 0 and tokens[1::3].count(b'=') == len(tokens) // 3:
+        return tokens[0::3], tokens[2::3]
+
+    keys = list()
+    values = list()
+    for line in block.splitlines():
+        line = line.split()
+        if len(line) != 0 and line[0] != b'#':
+            if b'=' not in line:
+                raise SyntaxError('Data file is improperly initialized.')
+            line.remove(b'=')  # removes the equal sign
+            keys.append(line[0])
+            values.append(line[1])
+    return keys, values
+
+
+def _DataColumns(keys, values):
+    """
+    Purpose: Collect the dataset_* columns of a scan. The data lines repeat the same keys in the same order, so each
+             column is a strided slice of the values and is converted to floats at once.
+    :param keys: keys of the scan lines
+    :param values: values of the scan lines
+    :return: header as a list of (key, value) pairs and a dictionary of the data columns
+    """
+    start = next((idx for idx, key in enumerate(keys) if key.startswith(b'dataset_')), len(keys))
+    header = list(zip(keys[:start], values[:start]))
+    columns = dict()
+
+    data_keys = keys[start:]
+    if len(data_keys) == 0:
+        return header, columns
+
+    period = data_keys.index(data_keys[0], 1) if data_keys.count(data_keys[0]) > 1 else len(data_keys)
+    if len(data_keys) % period == 0 and all(data_keys[j::period].count(data_keys[j]) == len(data_keys) // period
+                                           for j in range(period)):
+        for j in range(period):
+            columns[data_keys[j].decode()] = values[start + j::period]
+    else:
+        for key, value in zip(data_keys, values[start:]):
+            if key.startswith(b'dataset_'):
+                columns.setdefault(key.decode(), list()).append(value)
+            else:
+                header.append((key, value))
+
+    columns = {key: np.fromiter(map(float, column), float, len(column)) for key, column in columns.items()}
+    return header, columns
+
+
+def _IndexASCII(mm):
+    """
+    Purpose: First pass of the ASCII reader, finds the byte offsets of the sections of a .all file
+    :param mm: memory mapped file
+    :return: dictionary {section: (start, end)} with the offsets of the section content
+    """
+    headers = sorted((offset, section) for section in ['Structure', 'Experimental_Data', 'Simulation']
+                     for offset in _FindLines(mm, section.encode(), b'#', 0, len(mm)))
+    sections = dict()
+    for idx, (offset, section) in enumerate(headers):
+        end = headers[idx + 1][0] if idx + 1 < len(headers) else len(mm)
+        sections[section] = (mm.find(b'\n', offset, end) + 1 or end, end)
+    return sections
+
+
+def _ReadStructureASCII(text):
+    # sample information of the Structure section, read line by line as it is only a few lines long
+    sample = None
+    layer = 0
+    new_element = False
+    element = ''
+    for line in text.splitlines():
+        line = line.split()
+        if len(line) == 0 or line[0] == '#':
+            continue
+        if '=' not in line:
+            raise SyntaxError('Data file is improperly initialized.')
+        line.remove('=')  # removes the equal sign
+
+        # initializing the slab with correct number of layers
+        if line[0] == 'numberlayers':
+            sample = slab(int(line[1]))
+        elif line[0] == 'polyelements':
+            line.pop(0)
+            line = ''.join(line)
+            polyelements = ast.literal_eval(line)
+            sample.poly_elements = polyelements
+        elif line[0] == 'magelements':
+            line.pop(0)
+            line = ''.join(line)
+            magelements = ast.literal_eval(line)
+            sample.mag_elements = magelements
+
+        elif line[0] == 'layermagnetized':
+            line.pop(0)
+            line = ''.join(line)
+            layermagnetized = ast.literal_eval(line)
+            sample.layer_magnetized = layermagnetized
+        elif line[0] == 'scalingfactor':
+            scaling_factor = float(line[1])
+            sample.scaling_factor = scaling_factor
+        elif line[0] == 'backgroundshift':
+            background_shift = float(line[1])
+            sample.background_shift = background_shift
+        elif line[0] == 'layer':
+            layer = int(line[1])
+        elif line[0] == 'formula':
+            formula = line[1]
+
+            thickness = 20  # temporary assignment of the layer thickness
+            sample.addlayer(layer, formula, thickness)  # add layer
+
+        elif line[0] == 'element':
+            element = line[1]
+            new_element = True
+            sample.structure[layer][element].name = element
+
+        if new_element:
+            if line[0] == 'molarmass':
+                molarmass= float(line[1])
+                sample.structure[layer][element].molar_mass = molarmass
+
+            elif line[0] == 'density':
+                density = float(line[1])
+                sample.structure[layer][element].density = density
+            elif line[0] == 'thickness':
+                thickness = float(line[1])
+                sample.structure[layer][element].thickness = thickness
+            elif line[0] == 'roughness':
+                roughness = float(line[1])
+                sample.structure[layer][element].roughness = roughness
+            elif line[0] == 'linkedroughness':
+                linked_roughness = float(line[1])
+                sample.structure[layer][element].linked_roughness = linked_roughness
+            elif line[0] == 'scatteringfactor':
+                line.pop(0)
+                if len(line) == 1:
+                    scatteringfactor = line[0]
+                else:
+                    scatteringfactor = ast.literal_eval(''.join(line))
+                sample.structure[layer][element].scattering_factor = scatteringfactor
+
+            elif line[0] == 'polymorph':
+                line.pop(0)
+                polymorph = ast.literal_eval(''.join(line))
+                sample.structure[layer][element].polymorph = polymorph
+            elif line[0] == 'polyratio':
+                line.pop(0)
+                if len(line) == 1:
+                    polyratio = 1
+                else:
+                    polyratio = ast.literal_eval(''.join(line))
+                    polyratio = np.array([float(poly) for poly in polyratio])
+                sample.structure[layer][element].poly_ratio = np.array(polyratio)
+            elif line[0] == 'gamma':
+                gamma = float(line[1])
+                sample.structure[layer][element].gamma = gamma
+            elif line[0] == 'phi':
+                phi = float(line[1])
+                sample.structure[layer][element].phi = phi
+            elif line[0] == 'magdensity':
+                line.pop(0)
+                magdensity = ast.literal_eval(''.join(line))
+                if len(magdensity) != 0:
+                    magdensity = np.array([float(mag) for mag in magdensity])
+                sample.structure[layer][element].mag_density = magdensity
+
+            elif line[0] == 'magscatteringfactor':
+                line.pop(0)
+                if len(line)==0:
+                    magscatteringfactor = None
+                else:
+                    magscatteringfactor = ast.literal_eval(''.join(line))
+                sample.structure[layer][element].mag_scattering_factor = magscatteringfactor
+            elif line[0] == 'position':
+                position = int(line[1])
+                sample.structure[layer][element].position = position
+                new_element = False  # make sure we do not enter this if statement
+
+    return sample
+
+
+def _ReadScansASCII(mm, start, end):
+    """
+    Purpose: Second pass of the ASCII reader for the Experimental_Data or Simulation section. Each scan is split into
+             keys and values in one call and each data column is converted to floats at once.
+    :param mm: memory mapped file
+    :param start: offset of the section content
+    :param end: offset of the end of the section
+    :return: scan information and scan data as returned by ReadDataASCII
+    """
+    info = list()
+    scans = list()
+
+    # a scan starts at each datasetnumber, anything before the second one belongs to the first scan
+    starts = _FindLines(mm, b'datasetnumber', b'', start, end)
+    starts = [start] + starts[1:] + [end]
+
+    # the first scan starts with zeros, later scans with None and the polarization of the previous scan
+    scan_number = 0
+    scanType = 0
+    angle = 0
+    energy = 0
+    polarization = 0
+    numberPoints = 0
+    for n, (scan_start, scan_end) in enumerate(zip(starts[:-1], starts[1:])):
+        keys, values = _KeyValueTokens(mm[scan_start:scan_end])
+        if len(keys) == 0:
+            continue
+
+        if n != 0:
+            scan_number = None
+            scanType = None
+            angle = None
+            energy = None
+            numberPoints = None
+
+        scan_info = createNewDict()
+        header, columns = _DataColumns(keys, values)
+        for key, value in header:
+            key = key.decode()
+            value = value.decode()
+            if key == 'datasetnumber':
+                if scan_info['dataNumber'] is None:
+                    scan_info['dataNumber'] = int(value)
+            elif key == 'datasettitle':
+                scan_number, scanType, angle = getScanInfo(value)
+                if angle != None:
+                    angle = float(angle)
+            elif scanType == 'Energy' or scanType == 'Reflectivity':
+                if key == 'datasetenergy':
+                    energy = float(value)
+                elif key == 'polarization':
+                    polarization = value
+                elif key == 'datasetpoints':
+                    numberPoints = int(value)
+
+        scan_info['scanNumber'] = scan_number
+        scan_info['scanType'] = scanType
+        scan_info['angle'] = angle
+        scan_info['energy'] = energy
+        scan_info['polarization'] = polarization
+        scan_info['numberPoints'] = numberPoints
+        info.append(scan_info)
+
+        empty = np.array([], dtype=float)
+        qz = columns.get('dataset_qz', empty)
+        R = columns.get('dataset_R0', columns.get('dataset_A', empty))
+        if scanType == 'Energy':
+            scans.append([columns.get('dataset_eng', empty), R, qz])
+        elif scanType == 'Reflectivity':
+            scans.append([qz, R])
+
+    if len(info) == 0:
+        # a section without scans
+        scan_info = createNewDict()
+        scan_info['scanNumber'] = scan_number
+        scan_info['scanType'] = scanType
+        scan_info['angle'] = angle
+        scan_info['energy'] = energy
+        scan_info['polarization'] = polarization
+        scan_info['numberPoints'] = numberPoints
+        info.append(scan_info)
+
+    return info, scans
+
+
 def ReadDataASCII(fname):
     """
-    Purpose: Read .all file that contains sample and experimental information
+    Purpose: Read .all file that contains sample and experimental information. The file is memory mapped, a first
+             pass finds the sections and a second pass converts the scans of each section block by block.
     :param fname: Name of file contatining related information
     :return: Sscan - list of energy/reflectivity data
              Sinfo - contains a dictionary of relevant scan information
              sample - pre-initialized slab class
     """
 
-    file = open(fname)
-    Structure = False
-    experimental_data = False
-    simulation = False
-    for line in file:
-        line = line.split()
-        if len(line) != 0:
-            if line[0] == '#':
-                if line[1] == 'Structure':
-                    Structure = True
-                    experimental_data = False
-                    simulation = False
-                    layer = 0
-
-                    new_element = False
-                    element = ''
-
-                elif line[1] == 'Experimental_Data':
-
-                    if simulation:
-                        SimInfo[idx]['scanNumber'] = scan_number
-                        SimInfo[idx]['scanType'] = scanType
-                        SimInfo[idx]['angle'] = angle
-                        SimInfo[idx]['energy'] = energy
-                        SimInfo[idx]['polarization'] = polarization
-                        SimInfo[idx]['numberPoints'] = numberPoints
-                        if scanType == 'Energy':
-                            SimScan.append([x_axis, y_axis, energy_qz])
-                        elif scanType == 'Reflectivity':
-                            SimScan.append([x_axis, y_axis])
-
-                    Structure = False
-                    experimental_data = True
-                    simulation = False
-
-                    idx = 0  # index of scan
-                    Sinfo = []  # will contain information of sample
-                    Sinfo.append(createNewDict())
-                    Sscan = []
-
-                    # initialization of parameters
-                    x_axis = list()
-                    y_axis = list()
-                    energy_qz = list()
-                    scan_number = 0
-                    scanType = 0
-                    angle = 0
-                    energy = 0
-                    polarization = 0
-                    numberPoints = 0
-
-                    #NewScan = False  # determines if we have a new scan
-                    first = True
-                    # Read in each line one at a time
-                elif line[1] == 'Simulation':
-                    # Attaches last experiment element
-                    if experimental_data:
-                        Sinfo[idx]['scanNumber'] = scan_number
-                        Sinfo[idx]['scanType'] = scanType
-                        Sinfo[idx]['angle'] = angle
-                        Sinfo[idx]['energy'] = energy
-                        Sinfo[idx]['polarization'] = polarization
-                        Sinfo[idx]['numberPoints'] = numberPoints
-                        if scanType == 'Energy':
-                            Sscan.append([x_axis, y_axis, energy_qz])
-                        elif scanType == 'Reflectivity':
-                            Sscan.append([x_axis, y_axis])
-
-                    Structure = False
-                    experimental_data = False
-                    simulation = True
-
-                    idx = 0  # index of scan
-                    SimInfo = []  # will contain information of sample
-                    SimInfo.append(createNewDict())
-                    SimScan = []
-
-                    # initialization of parameters
-                    x_axis = list()
-                    y_axis = list()
-                    energy_qz = list()
-                    scan_number = 0
-                    scanType = 0
-                    angle = 0
-                    energy = 0
-                    polarization = 0
-                    numberPoints = 0
-
-                    first = True
-                    # Read in each line one at a time
-            else:
-                if Structure:
-                    if '=' not in line:
-                        raise SyntaxError('Data file is improperly initialized.')
-                    line.remove('=')  # removes the equal sign
-
-                    # initializing the slab with correct number of layers
-                    if line[0] == 'numberlayers':
-                        sample = slab(int(line[1]))
-                    elif line[0] == 'polyelements':
-                        line.pop(0)
-                        line = ''.join(line)
-                        polyelements = ast.literal_eval(line)
-                        sample.poly_elements = polyelements
-                    elif line[0] == 'magelements':
-                        line.pop(0)
-                        line = ''.join(line)
-                        magelements = ast.literal_eval(line)
-                        sample.mag_elements = magelements
-
-                    elif line[0] == 'layermagnetized':
-                        line.pop(0)
-                        line = ''.join(line)
-                        layermagnetized = ast.literal_eval(line)
-                        sample.layer_magnetized = layermagnetized
-                    elif line[0] == 'scalingfactor':
-                        scaling_factor = float(line[1])
-                        sample.scaling_factor = scaling_factor
-                    elif line[0] == 'backgroundshift':
-                        background_shift = float(line[1])
-                        sample.background_shift = background_shift
-                    elif line[0] == 'layer':
-                        layer = int(line[1])
-                    elif line[0] == 'formula':
-                        formula = line[1]
-
-                        thickness = 20  # temporary assignment of the layer thickness
-                        sample.addlayer(layer, formula, thickness)  # add layer
-
-                    elif line[0] == 'element':
-                        element = line[1]
-                        new_element = True
-                        sample.structure[layer][element].name = element
-
-                    if new_element:
-                        if line[0] == 'molarmass':
-                            molarmass= float(line[1])
-                            sample.structure[layer][element].molar_mass = molarmass
-
-                        elif line[0] == 'density':
-                            density = float(line[1])
-                            sample.structure[layer][element].density = density
-                        elif line[0] == 'thickness':
-                            thickness = float(line[1])
-                            sample.structure[layer][element].thickness = thickness
-                        elif line[0] == 'roughness':
-                            roughness = float(line[1])
-                            sample.structure[layer][element].roughness = roughness
-                        elif line[0] == 'linkedroughness':
-                            linked_roughness = float(line[1])
-                            sample.structure[layer][element].linked_roughness = linked_roughness
-                        elif line[0] == 'scatteringfactor':
-                            line.pop(0)
-                            if len(line) == 1:
-                                scatteringfactor = line[0]
-                            else:
-                                scatteringfactor = ast.literal_eval(''.join(line))
-                            sample.structure[layer][element].scattering_factor = scatteringfactor
-
-                        elif line[0] == 'polymorph':
-                            line.pop(0)
-                            polymorph = ast.literal_eval(''.join(line))
-                            sample.structure[layer][element].polymorph = polymorph
-                        elif line[0] == 'polyratio':
-                            line.pop(0)
-                            if len(line) == 1:
-                                polyratio = 1
-                            else:
-                                polyratio = ast.literal_eval(''.join(line))
-                                polyratio = np.array([float(poly) for poly in polyratio])
-                            sample.structure[layer][element].poly_ratio = np.array(polyratio)
-                        elif line[0] == 'gamma':
-                            gamma = float(line[1])
-                            sample.structure[layer][element].gamma = gamma
-                        elif line[0] == 'phi':
-                            phi = float(line[1])
-                            sample.structure[layer][element].phi = phi
-                        elif line[0] == 'magdensity':
-                            line.pop(0)
-                            magdensity = ast.literal_eval(''.join(line))
-                            if len(magdensity) != 0:
-                                magdensity = np.array([float(mag) for mag in magdensity])
-                            sample.structure[layer][element].mag_density = magdensity
-
-                        elif line[0] == 'magscatteringfactor':
-                            line.pop(0)
-                            if len(line)==0:
-                                magscatteringfactor = None
-                            else:
-                                magscatteringfactor = ast.literal_eval(''.join(line))
-                            sample.structure[layer][element].mag_scattering_factor = magscatteringfactor
-                        elif line[0] == 'position':
-                            position = int(line[1])
-                            sample.structure[layer][element].position = position
-                            new_element = False  # make sure we do not enter this if statement
-
-                elif experimental_data:
-
-                    if '=' not in line:
-                        raise SyntaxError('Data file is improperly initialized.')
-                    line.remove('=')  # removes the equal sign
-
-                    info = line[0]  # data identifier
-                    data = line[1]  # data value
-
-                    # retrieves the datasetnumber
-                    if info == 'datasetnumber':
-                        if first:
-                            data = int(data)
-                            Sinfo[idx]['dataNumber'] = data
-                            first = False
-                        else:
-                            Sinfo[idx]['scanNumber'] = scan_number
-                            Sinfo[idx]['scanType'] = scanType
-                            Sinfo[idx]['angle'] = angle
-                            Sinfo[idx]['energy'] = energy
-                            Sinfo[idx]['polarization'] = polarization
-                            Sinfo[idx]['numberPoints'] = numberPoints
-
-                            # Attaches appropriate dataset for different scan types
-                            if scanType == 'Energy':
-                                Sscan.append([x_axis, y_axis, energy_qz])
-                            elif scanType == 'Reflectivity':
-                                Sscan.append([x_axis, y_axis])
-
-
-                            # resets all parameters when new scan
-                            Sinfo.append(createNewDict())
-                            x_axis = list()
-                            y_axis = list()
-                            energy_qz = list()
-                            scan_number = None
-                            scanType = None
-                            angle = None
-                            energy = None
-                            numberPoints = None
-                            idx = idx + 1
-                            data = int(data)
-                            Sinfo[idx]['dataNumber'] = data
-
-                    # retrieves the data set title
-                    if info == 'datasettitle':
-                        scan_number, scanType, angle = getScanInfo(data)
-                        if angle != None:
-                            angle = float(angle)
-
-                    # sets parameters based on scan type
-                    if scanType == 'Energy':
-                        if info == 'datasetenergy':
-                            energy = float(data)
-                        if info == 'polarization':
-                            polarization = data
-                        if info == 'datasetpoints':
-                            numberPoints = int(data)
-                        if info == 'dataset_R0':
-                            data = float(data)
-                            y_axis.append(data)
-                        if info == 'dataset_A':
-                            data = float(data)
-                            y_axis.append(data)
-                        if info == 'dataset_eng':
-                            data = float(data)
-                            x_axis.append(data)
-                        if info == 'dataset_qz':
-                            data = float(data)
-                            energy_qz.append(data)
-                    elif scanType == 'Reflectivity':
-                        if info == 'datasetenergy':
-                            energy = float(data)
-                        elif info == 'polarization':
-                            polarization = data
-                        elif info == 'datasetpoints':
-                            numberPoints = int(data)
-                        elif info == 'dataset_qz':
-                            data = float(data)
-                            x_axis.append(data)
-                        elif info == 'dataset_R0':
-                            data = float(data)
-                            y_axis.append(data)
-                        elif info == 'dataset_A':
-                            data = float(data)
-                            y_axis.append(data)
-
-                elif simulation:
-
-                    if '=' not in line:
-                        raise SyntaxError('Data file is improperly initialized.')
-                    line.remove('=')  # removes the equal sign
-
-                    info = line[0]  # data identifier
-                    data = line[1]  # data value
-
-                    # retrieves the datasetnumber
-                    if info == 'datasetnumber':
-
-                        if first:
-                            data = int(data)
-                            SimInfo[idx]['dataNumber'] = data
-                            first = False
-                        else:
-                            SimInfo[idx]['scanNumber'] = scan_number
-                            SimInfo[idx]['scanType'] = scanType
-                            SimInfo[idx]['angle'] = angle
-                            SimInfo[idx]['energy'] = energy
-                            SimInfo[idx]['polarization'] = polarization
-                            SimInfo[idx]['numberPoints'] = numberPoints
-
-                            # Attaches different elements for different scan types
-                            if scanType == 'Energy':
-                                SimScan.append([x_axis, y_axis, energy_qz])
-                            elif scanType == 'Reflectivity':
-                                SimScan.append([x_axis, y_axis])
-
-
-                            # resets all parameters when new scan
-                            SimInfo.append(createNewDict())
-                            x_axis = list()
-                            y_axis = list()
-                            energy_qz = list()
-                            scan_number = None
-                            scanType = None
-                            angle = None
-                            energy = None
-                            numberPoints = None
-                            idx = idx + 1
-                            data = int(data)
-                            SimInfo[idx]['dataNumber'] = data
-
-                    # retrieves the data set title
-                    if info == 'datasettitle':
-                        scan_number, scanType, angle = getScanInfo(data)
-                        if angle != None:
-                            angle = float(angle)
-
-                    # sets parameters based on scan type
-                    if scanType == 'Energy':
-                        if info == 'datasetenergy':
-                            energy = float(data)
-                        if info == 'polarization':
-                            polarization = data
-                        if info == 'datasetpoints':
-                            numberPoints = int(data)
-                        if info == 'dataset_R0':
-                            data = float(data)
-                            y_axis.append(data)
-                        if info == 'dataset_A':
-                            data = float(data)
-                            y_axis.append(data)
-                        if info == 'dataset_eng':
-                            data = float(data)
-                            x_axis.append(data)
-                        if info == 'dataset_qz':
-                            data = float(data)
-                            energy_qz.append(data)
-                    elif scanType == 'Reflectivity':
-                        if info == 'datasetenergy':
-                            energy = float(data)
-                        elif info == 'polarization':
-                            polarization = data
-                        elif info == 'datasetpoints':
-                            numberPoints = int(data)
-                        elif info == 'dataset_qz':
-                            data = float(data)
-                            x_axis.append(data)
-                        elif info == 'dataset_R0':
-                            data = float(data)
-                            y_axis.append(data)
-                        elif info == 'dataset_A':
-                            data = float(data)
-                            y_axis.append(data)
-
-
-    if experimental_data:
-        Sinfo[idx]['scanNumber'] = scan_number
-        Sinfo[idx]['scanType'] = scanType
-        Sinfo[idx]['angle'] = angle
-        Sinfo[idx]['energy'] = energy
-        Sinfo[idx]['polarization'] = polarization
-        Sinfo[idx]['numberPoints'] = numberPoints
-        if scanType == 'Energy':
-            Sscan.append([x_axis, y_axis, energy_qz])
-        elif scanType == 'Reflectivity':
-            Sscan.append([x_axis, y_axis])
-
-    elif simulation:
-        SimInfo[idx]['scanNumber'] = scan_number
-        SimInfo[idx]['scanType'] = scanType
-        SimInfo[idx]['angle'] = angle
-        SimInfo[idx]['energy'] = energy
-        SimInfo[idx]['polarization'] = polarization
-        SimInfo[idx]['numberPoints'] = numberPoints
-        if scanType == 'Energy':
-            SimScan.append([x_axis, y_axis, energy_qz])
-        elif scanType == 'Reflectivity':
-            SimScan.append([x_axis, y_axis])
+    Sinfo, Sscan, SimInfo, SimScan, sample = None, None, None, None, None
+    with open(fname, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            sections = _IndexASCII(mm)
 
-    f.close()
+            if 'Structure' in sections:
+                start, end = sections['Structure']
+                sample = _ReadStructureASCII(mm[start:end].decode())
+            if 'Experimental_Data' in sections:
+                Sinfo, Sscan = _ReadScansASCII(mm, *sections['Experimental_Data'])
+            if 'Simulation' in sections:
+                SimInfo, SimScan = _ReadScansASCII(mm, *sections['Simulation'])
 
     return Sinfo, Sscan, SimInfo, SimScan, sample
 
@@ -3204,8 +3665,8 @@ def saveNewFile(fname, info, data_dict, sample):
             sim = np.array([data[0], data[1], R, data[3]])
             dat = np.array([data[0], data[1], data[2], data[3]])
 
-            dset = grpE.create_dataset(name, data=dat)
-            dset1 = subE.create_dataset(name, data=sim)
+            dset = _CreateScanDataset(grpE, name, dat)
+            dset1 = _CreateScanDataset(subE, name, sim)
 
             dset.attrs['Energy'] = float(energy)
             dset1.attrs['Energy'] = float(energy)
@@ -3235,8 +3696,8 @@ def saveNewFile(fname, info, data_dict, sample):
 
             sim = np.array([data[0],data[1],R])
 
-            dset = grpR.create_dataset(name, data=dat)
-            dset1 = subR.create_dataset(name, data=sim)
+            dset = _CreateScanDataset(grpR, name, dat)
+            dset1 = _CreateScanDataset(subR, name, sim)
 
             dset.attrs['Energy'] = float(energy)
             dset1.attrs['Energy'] = float(energy)
@@ -3250,80 +3711,77 @@ def saveNewFile(fname, info, data_dict, sample):
             dset.attrs['DatasetNumber'] = int(dsNum)
             dset1.attrs['DatasetNumber'] = int(dsNum)
 
+    WriteScanTable(f)
     f.close()
     return
 
-def QUAD_to_data_dict(fname):
-    data_dict = dict()
+def _QUADScan(header, block):
+    # header line 'scan polarization type energy angle' followed by the rows 'E theta qz R'
+    line = header.split()
+    scan_number = line[0]
+    pol = line[1]
+    scan_type = line[2]
+    energy = float(line[3])
+    angle = float(line[4])
 
-    # read the data file and convert each line into a list format
-    with open(fname) as f:
-        lines = [line for line in f]
+    temp_energy = str(round(float(line[3]),2))
+    temp_angle = str(round(float(line[4]),2))
 
-    f.close()
-    start_new = True
-    data = [[],[],[],[]]
     name = ''
-    scan_type = ''
-    for idx,line in enumerate(lines):
-        if idx == 0 or start_new:  # initialization
-            line = line.split()
-            scan_number = line[0]
-            pol = line[1]
-            scan_type = line[2]
-            energy = float(line[3])
-            angle = float(line[4])
-
-            temp_energy = str(round(float(line[3]),2))
-            temp_angle = str(round(float(line[4]),2))
-
-            name = ''
-            if scan_type == 'A':
-                name = line[0] + '_' + temp_energy + '_' + line[1]
-            else:
-                name = line[0] + '_E' + temp_energy + '_Th' + temp_angle + '_' + line[1]
-
-            data_dict[name] = dict()
-            data_dict[name]['Background Shift'] = 0
-            data_dict[name]['Scaling Factor'] = 1
-            data_dict[name]['DatasetNumber'] = scan_number
-            data_dict[name]['Polarization'] = pol
-            data_dict[name]['Energy'] = energy
-            if scan_type == 'E':
-                data_dict[name]['Angle'] = angle
-
-            start_new = False
-            data = [[],[],[],[]]
-
-        elif line[0] == '=':
-            # terminate and start new
-            n = len(data[0])
-            if scan_type == 'A':
-                data[0] = np.array(data[0])
-                data[1] = np.array(data[1])
-                data[2] = np.array(data[2])
-                data.pop()
-            else:
-                data[0] = np.array(data[0])
-                data[1] = np.array(data[1])
-                data[2] = np.array(data[2])
-                data[3] = np.array(data[3])
-
-            data_dict[name]['DataPoints'] = n
-            data_dict[name]['Data'] = data
-            start_new = True
-        else:
-            line = line.split()
-            # save the data
-            if scan_type == 'A':
-                data[0].append(float(line[2]))  # qz
-                data[1].append(float(line[1]))  # Theta
-                data[2].append(float(line[3]))  # R
+    if scan_type == 'A':
+        name = line[0] + '_' + temp_energy + '_' + line[1]
+    else:
+        name = line[0] + '_E' + temp_energy + '_Th' + temp_angle + '_' + line[1]
+
+    scan = dict()
+    scan['Background Shift'] = 0
+    scan['Scaling Factor'] = 1
+    scan['DatasetNumber'] = scan_number
+    scan['Polarization'] = pol
+    scan['Energy'] = energy
+    if scan_type == 'E':
+        scan['Angle'] = angle
+
+    values = np.loadtxt(block, ndmin=2) if len(block) != 0 else np.zeros((0, 4))
+    if scan_type == 'A':
+        data = [values[:, 2], values[:, 1], values[:, 3]]  # qz, Theta, R
+    else:
+        data = [values[:, 2], values[:, 1], values[:, 3], values[:, 0]]  # qz, Theta, R, E
+
+    scan['DataPoints'] = len(values)
+    scan['Data'] = data
+    return name, scan
+
+
+def IterQUAD(fname):
+    """
+    Purpose: Read the scans of a QUAD file one at a time. The file is streamed and the rows of each scan are converted
+             with one call of np.loadtxt.
+    :param fname: QUAD filename
+    :return: generator of (scan name, scan dictionary)
+    """
+    header = None
+    block = list()
+    with open(fname) as f:
+        for line in f:
+            if header is None:  # initialization
+                header = line
+                block = list()
+            elif line[0] == '=':
+                # terminate and start new
+                yield _QUADScan(header, block)
+                header = None
             else:
-                data[0].append(float(line[2]))  # qz
-                data[1].append(float(line[1]))  # Theta
-                data[2].append(float(line[3]))  # R
-                data[3].append(float(line[0]))  # E
+                block.append(line)
+
+    if header is not None:
+        yield _QUADScan(header, block)
+
+
+def QUAD_to_data_dict(fname):
+    data_dict = dict()
+    for name, scan in IterQUAD(fname):
+        data_dict[name] = scan
     return data_dict
 
 def createDataHDF5fromDict(filename, data_dict_list):
@@ -3354,7 +3812,7 @@ def createDataHDF5fromDict(filename, data_dict_list):
                     dat = data_dict[name]['Data']
                     dat = np.array(dat)
                     m = np.shape(dat)
-                    dset = energyScan.create_dataset(name, m, data=dat, maxshape=(4, None), chunks=True)
+                    dset = _CreateScanDataset(energyScan, name, dat)
                     dset.attrs['DatasetNumber'] = data_dict[name]['DatasetNumber']
                     dset.attrs['DataPoints'] = data_dict[name]['DataPoints']
                     dset.attrs['Energy'] = data_dict[name]['Energy']
@@ -3364,7 +3822,7 @@ def createDataHDF5fromDict(filename, data_dict_list):
                     dset.attrs['Scaling Factor'] = data_dict[name]['Scaling Factor']
 
                     dat1 = data_dict[name]['Data']
-                    dset1 = simE.create_dataset(name, m, data=dat1, maxshape=(4, None), chunks=True)
+                    dset1 = _CreateScanDataset(simE, name, dat1)
                     dset1.attrs['DatasetNumber'] = data_dict[name]['DatasetNumber']
                     dset1.attrs['DataPoints'] = data_dict[name]['DataPoints']
                     dset1.attrs['Energy'] = data_dict[name]['Energy']
@@ -3377,7 +3835,7 @@ def createDataHDF5fromDict(filename, data_dict_list):
                     dat = np.array(dat)
                     m = np.shape(dat)
 
-                    dset = reflScan.create_dataset(name, m, data=dat, maxshape=(3, None), chunks=True)
+                    dset = _CreateScanDataset(reflScan, name, dat)
                     dset.attrs['DatasetNumber'] = data_dict[name]['DatasetNumber']
                     dset.attrs['DataPoints'] = data_dict[name]['DataPoints']
                     dset.attrs['Energy'] = data_dict[name]['Energy']
@@ -3386,7 +3844,7 @@ def createDataHDF5fromDict(filename, data_dict_list):
                     dset.attrs['Scaling Factor'] = data_dict[name]['Scaling Factor']
 
                     dat1 = data_dict[name]['Data']
-                    dset1 = simR.create_dataset(name, m, data=dat1, maxshape=(3, None), chunks=True)
+                    dset1 = _CreateScanDataset(simR, name, dat1)
                     dset1.attrs['DatasetNumber'] = data_dict[name]['DatasetNumber']
                     dset1.attrs['DataPoints'] = data_dict[name]['DataPoints']
                     dset1.attrs['Energy'] = data_dict[name]['Energy']
@@ -3394,6 +3852,7 @@ def createDataHDF5fromDict(filename, data_dict_list):
                     dset1.attrs['Background Shift'] = data_dict[name]['Background Shift']
                     dset1.attrs['Scaling Factor'] = data_dict[name]['Scaling Factor']
 
+        WriteScanTable(f)
         f.close()
 
 
@@ -31,11 +31,234 @@ from UTILS.data_structure import *
 import time
 from UTILS.material_model import *
 import copy
+import os
+import pickle
+import h5py
+import json
+import ast
+import multiprocessing as mp
+from collections import OrderedDict, deque
 from UTILS.Ti34_XAS_Python import GetTiFormFactor
 #import pygmo as pg
 
+
+class TrajectoryLog():
+    """
+    Purpose: Keeps track of the parameter values visited by a data fitting. Only the last maxlen iterations are kept
+             in memory while every iteration is appended to extendable datasets of an HDF5 file (if a file name is
+             given), so long fits do not grow in memory and a crashed fit still leaves its trajectory on disk.
+
+             Iterations are indexed from the start of the fit, len() returns the total number of iterations and
+             slicing only returns the iterations that are still in memory. A log continued with append=True starts
+             with the last maxlen iterations of the file in memory.
+
+             Each iteration is kept as a single record (parameters, cost, cost of each scan, total variation term of
+             each scan) appended to a ring buffer, so the progress plots read the values computed by the cost
+             function while the fit is running instead of simulating the scans again.
+    """
+    def __init__(self, fname=None, maxlen=10000, scans=None, append=False):
+        """
+        :param fname: HDF5 file name of the on-disk log (None for an in-memory log only)
+        :param maxlen: number of iterations kept in memory
+        :param scans: names of the scans used in the cost function
+        :param append: continue the on-disk log of a resumed data fitting instead of starting a new one
+        """
+        self.fname = fname
+        self.maxlen = maxlen
+        self.scans = [] if scans is None else [str(name) for name in scans]
+        self.first = 0  # index of the oldest iteration kept in memory
+        self.start = time.time()
+
+        self._records = deque(maxlen=maxlen)  # (x, cost, scan costs, scan total variation terms)
+        self._evaluated = OrderedDict()  # cost function values of the last evaluations
+        self._best = None  # best evaluation so far, never dropped as the callbacks record the best parameters
+        self._n = 0
+        self._file = None
+
+        if fname is not None:
+            if append and os.path.exists(fname):
+                # iterations of the previous run are numbered first, the last maxlen of them are loaded into memory
+                self._file = h5py.File(fname, 'a')
+                self.start = float(self._file.attrs['Start'])
+                if 'x' in self._file:
+                    self._n = self._file['x'].shape[0]
+                    if 'variation' not in self._file:  # log written before the total variation was recorded
+                        m = self._file['scan_cost'].shape[1]
+                        self._file.create_dataset('variation', data=np.full((self._n, m), np.nan),
+                                                  maxshape=(None, m), chunks=(256, m))
+
+                    self.first = max(self._n - maxlen, 0)
+                    tail = [self._file[name][self.first:self._n] for name in ['x', 'cost', 'scan_cost', 'variation']]
+                    self._records.extend(zip(*tail))
+            else:
+                self._file = h5py.File(fname, 'w')
+                self._file.attrs['Scans'] = np.array(self.scans, dtype=h5py.string_dtype())
+                self._file.attrs['Start'] = self.start
+
+    def _create(self, n):
+        # the datasets are created on the first iteration once the number of parameters is known
+        m = max(len(self.scans), 1)
+        self._file.create_dataset('x', shape=(0, n), maxshape=(None, n), dtype=float, chunks=(256, n))
+        self._file.create_dataset('cost', shape=(0,), maxshape=(None,), dtype=float, chunks=(256,))
+        self._file.create_dataset('scan_cost', shape=(0, m), maxshape=(None, m), dtype=float, chunks=(256, m))
+        self._file.create_dataset('variation', shape=(0, m), maxshape=(None, m), dtype=float, chunks=(256, m))
+        self._file.create_dataset('time', shape=(0,), maxshape=(None,), dtype=float, chunks=(256,))
+
+    def _row(self, values):
+        # one value per scan, nan if not known
+        row = np.full(max(len(self.scans), 1), np.nan)
+        if values is not None:
+            values = np.ravel(values)[:len(row)]
+            row[:len(values)] = values
+        return row
+
+    def evaluated(self, x, cost, scan_costs=None, variations=None):
+        """
+        Purpose: Remember the cost of an evaluation so a later append of the same parameters can record it
+        :param x: parameter values
+        :param cost: cost function value
+        :param scan_costs: cost function value of each scan
+        :param variations: weighted total variation term of each scan
+        """
+        key = np.asarray(x, dtype=float).tobytes()
+        self._evaluated[key] = (cost, scan_costs, variations)
+        if self._best is None or cost < self._best[1] or np.isnan(self._best[1]):
+            self._best = (key, cost, scan_costs, variations)
+        if len(self._evaluated) > 4096:
+            self._evaluated.popitem(last=False)
+
+    def append(self, x, cost=None, scan_costs=None, variations=None):
+        """
+        Purpose: Record an iteration of the data fitting
+        :param x: parameter values
+        :param cost: cost function value (looked up from the evaluations with the scan costs if not given)
+        :param scan_costs: cost function value of each scan
+        :param variations: weighted total variation term of each scan
+        """
+        x = np.array(x, dtype=float)
+        if scan_costs is None:
+            evaluation = self._evaluated.get(x.tobytes(), (None, None, None))
+            if evaluation[0] is None and self._best is not None and self._best[0] == x.tobytes():
+                evaluation = self._best[1:]  # evaluated before the last evaluations kept
+            if cost is None or evaluation[0] == cost:
+                cost, scan_costs, variations = evaluation
+        cost = np.nan if cost is None else float(cost)
+        scan_costs = self._row(scan_costs)
+        variations = self._row(variations)
+
+        if len(self._records) == self.maxlen:
+            self.first = self.first + 1
+        # a single append of the whole record, readers in other threads never see a partial iteration
+        self._records.append((x, cost, scan_costs, variations))
+        self._n = self._n + 1
+
+        if self._file is not None:
+            if 'x' not in self._file:
+                self._create(len(x))
+
+            n = self._n
+            for name, value in [('x', x), ('cost', cost), ('scan_cost', scan_costs), ('variation', variations),
+                                ('time', time.time() - self.start)]:
+                dset = self._file[name]
+                dset.resize(n, axis=0)
+                dset[n - 1] = value
+            self._file.flush()
+
+    def costs(self):
+        """
+        Purpose: Return the cost function values of the iterations kept in memory
+        :return: numpy array of the cost function values
+        """
+        return np.array([record[1] for record in list(self._records)])
+
+    def window(self):
+        """
+        Purpose: Return the iterations kept in memory with their iteration numbers (starting at 1)
+        :return: numpy array of the iteration numbers and list of the parameter values
+        """
+        records = list(self._records)
+        return np.arange(self._n - len(records), self._n) + 1, [record[0] for record in records]
+
+    def telemetry(self):
+        """
+        Purpose: Return the cost function terms of the iterations kept in memory, as computed by the cost function
+        :return: dictionary with the iteration numbers 'iteration' (starting at 1), the cost function 'cost', the
+                 cost of each scan 'scan_cost' and the weighted total variation term of each scan 'variation' (one
+                 column per scan in the order of the scans attribute)
+        """
+        records = list(self._records)  # snapshot, the fit keeps appending while the progress is plotted
+        m = max(len(self.scans), 1)
+        telemetry = dict()
+        telemetry['iteration'] = np.arange(self._n - len(records), self._n) + 1
+        telemetry['cost'] = np.array([record[1] for record in records])
+        telemetry['scan_cost'] = np.array([record[2] for record in records]).reshape(len(records), m)
+        telemetry['variation'] = np.array([record[3] for record in records]).reshape(len(records), m)
+        return telemetry
+
+    def close(self):
+        """
+        Purpose: Close the on-disk log, the iterations in memory are still available
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        return iter([record[0] for record in list(self._records)])
+
+    def __getitem__(self, idx):
+        x = [record[0] for record in list(self._records)]
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self._n)
+            start = max(start - self.first, 0)
+            stop = max(stop - self.first, 0)
+            return x[start:stop:step]
+
+        if idx < 0:
+            idx = idx + self._n
+        if idx < self.first or idx >= self._n:
+            raise IndexError('Iteration ' + str(idx) + ' is not kept in memory.')
+        return x[idx - self.first]
+
+
+def ReadTrajectoryHDF5(fname):
+    """
+    Purpose: Read the on-disk log of a data fitting written by TrajectoryLog
+    :param fname: HDF5 file name
+    :return: dictionary with the parameter values 'x', the cost 'cost', the cost of each scan 'scan_cost', the
+             weighted total variation term of each scan 'variation', the time since the start of the fit 'time' and
+             the scan names 'scans'
+    """
+    with h5py.File(fname, 'r') as f:
+        trajectory = dict()
+        trajectory['scans'] = [name.decode() if isinstance(name, bytes) else str(name) for name in f.attrs['Scans']]
+        for name in ['x', 'cost', 'scan_cost', 'variation', 'time']:
+            if name in f:
+                trajectory[name] = f[name][()]
+            else:
+                trajectory[name] = np.array([])  # fit stopped before the first iteration
+    return trajectory
+
+
 global x_vars
-x_vars = []
+x_vars = TrajectoryLog()
+
+
+def reset_x(fname=None, scans=None, append=False):
+    """
+    Purpose: Start a new trajectory log for a data fitting
+    :param fname: HDF5 file name of the on-disk log (None for an in-memory log only)
+    :param scans: names of the scans used in the cost function
+    :param append: continue the on-disk log of a resumed data fitting
+    :return: the new trajectory log
+    """
+    global x_vars
+    x_vars.close()
+    x_vars = TrajectoryLog(fname, scans=scans, append=append)
+    return x_vars
 
 
 def changeSampleParams(x, parameters, sample, backS, scaleF, script, orbitals, use_script=False):
@@ -490,6 +713,8 @@ def scanCompute(x, *args):
 
     fun = 0  # used to minimize the global optimization
     gamma = 0
+    scan_costs = []  # cost function of each scan
+    variations = []  # weighted total variation term of each scan
 
     sample = args[0]  # slab class
     scans = args[1]  # list of scan names to use in cost function
@@ -515,10 +740,6 @@ def scanCompute(x, *args):
     prec = float(args[21])
     precE = float(args[22])
 
-    # determines if saving will be done in callback function
-    if optimizeSave:
-        x_vars.append(x)
-
     # change the sample parameters
     sample, backS, scaleF, orbitals = changeSampleParams(x, parameters, sample, backS, scaleF,script, orbitals, use_script=use_script)
 
@@ -609,10 +830,13 @@ def scanCompute(x, *args):
                     elif objective == 'Arctan':
                         fun_val = fun_val + sum(np.arctan((Rdat[idx] - Rsim[idx]) ** 2)) * w
             fun = fun + fun_val/m  # updates cost function
+            scan_costs.append(fun_val/m)
 
             # calculates total variation over entire boundary
             var_idx = [x for x in range(len(qz)) if qz[x] >= xbound[0][0] and qz[x] < xbound[-1][1]]
-            gamma = gamma + total_variation(Rsmooth[var_idx], Rsim[var_idx])/len(Rsmooth[var_idx])
+            val = total_variation(Rsmooth[var_idx], Rsim[var_idx])/len(Rsmooth[var_idx])
+            gamma = gamma + val
+            variations.append(val*shape_weight)
 
         elif scanType == 'Energy':
             myDataScan = data[name]
@@ -696,13 +920,21 @@ def scanCompute(x, *args):
                             fun_val = fun_val + sum(np.arctan((Rdat[idx] - Rsim[idx]) ** 2)) * w
 
             fun = fun + fun_val/m  # calculates cost function
+            scan_costs.append(fun_val/m)
 
             # calculates the total variation for entire boundary
             var_idx = [x for x in range(len(E)) if E[x] >= xbound[0][0] and E[x] < xbound[-1][1]]
-            gamma = gamma + total_variation(Rsmooth[var_idx], Rsim[var_idx])/len(Rsmooth[var_idx])
+            val = total_variation(Rsmooth[var_idx], Rsim[var_idx])/len(Rsmooth[var_idx])
+            gamma = gamma + val
+            variations.append(val*shape_weight)
 
     fun = fun + gamma*shape_weight  # adds the total variation to the cost function
 
+    # publishes the cost terms for the callback function and the progress plots, saves the iteration if requested
+    x_vars.evaluated(x, fun, scan_costs, variations)
+    if optimizeSave:
+        x_vars.append(x, fun, scan_costs, variations)
+
     return fun
 
 def residuals(x, *args):
@@ -715,6 +947,7 @@ def residuals(x, *args):
 
     fun = np.array([])  # used to minimize the global optimization
     gamma = np.array([])
+    scan_costs = []  # cost function of each scan
 
     sample = args[0]  # slab class
     scans = args[1]  # list of scan names to use in cost function
@@ -740,10 +973,6 @@ def residuals(x, *args):
     prec = float(args[21])
     precE = float(args[22])
 
-    # determines if saving will be done in callback function
-    if optimizeSave:
-        x_vars.append(x)
-
     # change the sample parameters
     sample, backS, scaleF, orbitals = changeSampleParams(x, parameters, sample, backS, scaleF,script, orbitals, use_script=use_script)
 
@@ -760,6 +989,7 @@ def residuals(x, *args):
 
         scanType = scan[1]  # retrieves scan type
         name = scan[2]  # name of scan
+        n_start = len(fun)  # first residual of the scan
 
         Rsmooth = smooth_dict[name]['Data'][2]  # retrieve smoothed data scan
 
@@ -914,14 +1144,130 @@ def residuals(x, *args):
             var_idx = [x for x in range(len(E)) if E[x] >= xbound[0][0] and E[x] < xbound[-1][1]]
             #gamma = np.concatenate((gamma, tv(Rsmooth[var_idx], Rsim[var_idx])))
 
+        scan_costs.append(0.5*np.sum(fun[n_start:]**2))
+
     #fun = fun + gamma*shape_weight  # adds the total variation to the cost function
 
+    # least squares cost of the residuals
+    x_vars.evaluated(x, 0.5*np.sum(fun**2), scan_costs, np.zeros(len(scan_costs)))
+    if optimizeSave:
+        x_vars.append(x, 0.5*np.sum(fun**2), scan_costs, np.zeros(len(scan_costs)))
+
     return fun
 """
 Note that all the global optimization wrappers are identical. As a result I will only go in detail for the differential
 evolution wrapper. 
 """
-def differential_evolution(sample, data_info, data,scan,backS, scaleF, parameters, bounds,sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict, script, orbitals, sf_dict,nd,temperature, reflectivity_engine,step, prec, precE,use_script=False):
+class FidelitySchedule():
+    """
+    Purpose: Coarse to fine simulation precision of a data fitting. The data fitting starts with a coarser depth step
+             of the density profile, a looser precision of the adaptive layer segmentation and a subset of the data
+             points of each scan, which are refined one level at a time once the population has converged or the
+             best cost function value has stopped improving at the current level. The last level is the precision
+             of the data fitting with all the data points.
+    """
+    def __init__(self, step, prec, precE, levels=3, step_factor=2, prec_factor=10, tol=1e-2, patience=10, rtol=1e-3,
+                 fraction=1, seed=None):
+        """
+        :param step: depth step of the density profile of the last level
+        :param prec: reflectivity scan precision of the last level
+        :param precE: energy scan precision of the last level
+        :param levels: number of precision levels (1 for the precision of the data fitting only)
+        :param step_factor: factor the depth step is increased by for each coarser level
+        :param prec_factor: factor the precisions are increased by for each coarser level
+        :param tol: relative standard deviation of the population cost function values for which the population has
+                    converged at a coarse level
+        :param patience: number of iterations without an improvement after which the cost has stopped improving
+        :param rtol: relative improvement of the best cost function value that resets the patience
+        :param fraction: fraction of the data points used at the first level, it grows geometrically to all the data
+                         points at the last level
+        :param seed: seed of the data point subsets (the same subsets are drawn for the same seed and level)
+        """
+        self.step = float(step)
+        self.prec = float(prec)
+        self.precE = float(precE)
+        self.levels = max(int(levels), 1)
+        self.level = self.levels - 1
+        self.step_factor = step_factor
+        self.prec_factor = prec_factor
+        self.tol = tol
+        self.patience = patience
+        self.rtol = rtol
+        self.fraction = float(fraction)
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.best = np.inf
+        self.stall = 0
+
+    def current(self):
+        """
+        Purpose: Simulation precision of the current level
+        :return: depth step, reflectivity scan precision and energy scan precision
+        """
+        return (self.step * self.step_factor ** self.level, self.prec * self.prec_factor ** self.level,
+                self.precE * self.prec_factor ** self.level)
+
+    def subsample(self, data, smooth_dict, scans, sBounds):
+        """
+        Purpose: Data points of the current level. The points of each scan boundary are divided into consecutive
+                 strata of the same size and one point is drawn from each stratum.
+        :param data: dictionary containing the data
+        :param smooth_dict: dictionary containing the smoothed data
+        :param scans: list of lists [[scan number, scan type, scan name]] of the scans to optimize
+        :param sBounds: A list of lists containing the scan boundaries
+        :return: data and smooth_dict with the data points of the current level
+        """
+        fraction = self.fraction ** (self.level / max(self.levels - 1, 1))
+        if fraction >= 1:
+            return data, smooth_dict
+
+        rng = np.random.default_rng([self.seed, self.level])
+        data = dict(data)
+        smooth_dict = dict(smooth_dict)
+        for info, xbound in zip(scans, sBounds):
+            name = info[2]
+            myData = np.asarray(data[name]['Data'])
+            x = myData[0] if info[1] == 'Reflectivity' else myData[3]  # momentum transfer or energy
+
+            idx = []
+            for lw, up in xbound:
+                # points used by the cost function in the boundary
+                points = np.flatnonzero((x >= lw) & (x < up) & (x > xbound[0][0]) & (x < xbound[-1][-1]))
+                if len(points) != 0:
+                    strata = np.array_split(points, int(np.ceil(fraction * len(points))))
+                    idx.extend([stratum[rng.integers(len(stratum))] for stratum in strata])
+            idx = np.unique(idx).astype(int)
+
+            data[name] = dict(data[name], Data=myData[:, idx])
+            smooth_dict[name] = dict(smooth_dict[name], Data=np.asarray(smooth_dict[name]['Data'])[:, idx])
+        return data, smooth_dict
+
+    def update(self, fun, energies):
+        """
+        Purpose: Keep track of the progress of the data fitting at the current level
+        :param fun: best cost function value of the iteration
+        :param energies: cost function values of the population
+        :return: True if the data fitting should continue at the next level
+        """
+        if np.isinf(self.best) or fun < self.best - self.rtol * abs(self.best):
+            self.best = fun
+            self.stall = 0
+        else:
+            self.stall = self.stall + 1
+
+        converged = np.std(energies) <= self.tol * abs(np.mean(energies))
+        return self.level > 0 and (converged or self.stall >= self.patience)
+
+    def refine(self, final=False):
+        """
+        Purpose: Continue at the next level
+        :param final: skip to the last level
+        """
+        self.level = 0 if final else max(self.level - 1, 0)
+        self.best = np.inf
+        self.stall = 0
+
+
+def differential_evolution(sample, data_info, data,scan,backS, scaleF, parameters, bounds,sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict, script, orbitals, sf_dict,nd,temperature, reflectivity_engine,step, prec, precE,use_script=False, trajectory=None, workers=1, seed=None, checkpoint=None, checkpoint_interval=60, state=None, fidelity=None, subsample=None):
     """
     Purpose: wrapper used to setup and run the scipy differential evolution algorithm
     :param sample: slab class
@@ -942,13 +1288,25 @@ def differential_evolution(sample, data_info, data,scan,backS, scaleF, parameter
     :param smooth_dict: Dictionary containing the smoothed data using the smooth data feature in the GUI
     :param script: A list containing the lines of code in the script
     :param use_script: Boolean that determines if the script should be used
+    :param trajectory: HDF5 file name used to log the parameter values of each iteration (None to only keep them in memory)
+    :param workers: number of processes the population is evaluated with (the cost terms of the iterations are then
+                    not recorded in the trajectory log)
+    :param seed: seed of the random number generator (None for a random seed)
+    :param checkpoint: file name used to periodically save the state of the data fitting (None for no checkpoints)
+    :param checkpoint_interval: minimum time in seconds between two checkpoints
+    :param state: state of an interrupted data fitting (used by resume)
+    :param fidelity: number of precision levels of a coarse to fine data fitting (None for the precision of the data
+                     fitting only, see FidelitySchedule). Each level continues from the population of the previous
+                     level, which is evaluated again, and the last level is polished at the precision of the data
+                     fitting.
+    :param subsample: fraction of the data points of each scan used at the first level of a coarse to fine data
+                      fitting (None for all the data points). The cost function value returned always uses all the
+                      data points at the precision of the data fitting.
     :return:
         x - the parameter values
         fun - the cost function value
     """
-    # performs the differential evolution global optimization
-    global x_vars  # resets the parameters values
-    x_vars = []  # this is used to keep track of the parameter values after each iteration
+    ck = _StartCheckpoint(checkpoint, 'differential evolution', locals(), checkpoint_interval, state)
 
     scans = []
     # retrieves scan names
@@ -956,6 +1314,9 @@ def differential_evolution(sample, data_info, data,scan,backS, scaleF, parameter
         if info[2] in scan:
             scans.append(info)
 
+    # keeps track of the parameter values after each iteration
+    log = reset_x(trajectory, [info[2] for info in scans], append=state is not None)
+
 
     params = [sample, scans, data,backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, False, r_scale, smooth_dict,script,use_script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE]  # required format for function scanCompute
 
@@ -965,24 +1326,109 @@ def differential_evolution(sample, data_info, data,scan,backS, scaleF, parameter
         p = True
     else:
         p = False
-    # This line will be used to select and use different global optimization algorithms
-    ret = optimize.differential_evolution(scanCompute, bounds, args=params, strategy=goParam[0], maxiter=int(goParam[1]),
-                                          popsize=int(goParam[2]),tol=float(goParam[3]), atol=float(goParam[4]),
-                                          mutation=(float(goParam[5]), float(goParam[6])), recombination=float(goParam[7]),
-                                          polish=p, init=goParam[9], updating=goParam[10], disp=True,
-                                          callback=cb.stop_evolution)
+
+    func = scanCompute
+    callback = cb.stop_evolution
+    maxiter = int(goParam[1])
+    init = goParam[9]
+    workers = int(workers)
+    nit = 0
+    stopped = False
+
+    schedule = None
+    if fidelity is not None:
+        fraction = 1 if subsample is None else subsample
+        schedule = FidelitySchedule(step, prec, precE, levels=int(fidelity), fraction=fraction, seed=seed)
+    elif subsample is not None:
+        # only the data points are refined
+        schedule = FidelitySchedule(step, prec, precE, step_factor=1, prec_factor=1, fraction=subsample, seed=seed)
+    full = list(params)
+
+    seed = np.random.default_rng(seed)  # same random numbers as a data fitting with checkpoints
+
+    if ck is not None:
+        if workers == 1:
+            func = ck.objective  # the evaluations of worker processes can not be counted
+        seed = ck.rng
+        nit = ck.state['nit']
+        if 'population' in ck.state:
+            # continue with the population of the interrupted data fitting
+            init = ck.state['population']
+            maxiter = max(maxiter - nit, 0)
+        if schedule is not None:
+            schedule.level = ck.state.get('fidelity', schedule.level)
+            schedule.seed = ck.state.setdefault('subsample_seed', schedule.seed)
+
+    if ck is not None or schedule is not None:
+        # the population and the random number generator are saved after each generation, a level of the coarse to
+        # fine data fitting ends once the population has converged
+        def callback(intermediate_result):
+            nonlocal stopped
+            stopped = bool(cb.stop_evolution(intermediate_result.x, getattr(intermediate_result, 'convergence', 0)))
+            if ck is not None:
+                ck.update(nit=nit + int(intermediate_result.nit), x=intermediate_result.x,
+                          fun=intermediate_result.fun, population=intermediate_result.population,
+                          population_energies=intermediate_result.population_energies, stopped=stopped)
+                if schedule is not None:
+                    ck.state['fidelity'] = schedule.level
+            if schedule is not None and schedule.update(intermediate_result.fun,
+                                                        intermediate_result.population_energies):
+                return True
+            return stopped
+
+    try:
+        while True:
+            final = schedule is None or schedule.level == 0
+            if schedule is not None:
+                params[20], params[21], params[22] = schedule.current()
+                params[2], params[12] = schedule.subsample(data, smooth_dict, scans, sBounds)
+
+            # This line will be used to select and use different global optimization algorithms
+            ret = optimize.differential_evolution(func, bounds, args=params, strategy=goParam[0], maxiter=maxiter,
+                                                  popsize=int(goParam[2]),tol=float(goParam[3]), atol=float(goParam[4]),
+                                                  mutation=(float(goParam[5]), float(goParam[6])), recombination=float(goParam[7]),
+                                                  polish=p and final, init=init, updating=goParam[10], disp=True,
+                                                  callback=callback, seed=seed, workers=workers)
+            if final or stopped:
+                break
+
+            # the next level continues from the population, only the last level is run once the iterations are used up
+            init = ret.population
+            nit = nit + int(ret.nit)
+            maxiter = max(maxiter - int(ret.nit), 0)
+            schedule.refine(final=maxiter == 0)
+            if ck is not None:
+                # the best cost function values of different levels can not be compared
+                ck.state.pop('x', None)
+                ck.state.pop('fun', None)
+                ck.update(nit=nit, population=init, fidelity=schedule.level)
+    except BaseException:
+        if ck is not None:
+            ck.save()  # the interrupted data fitting can be resumed from its last state
+        raise
+    finally:
+        log.close()
     x = ret.x
     fun = ret.fun
 
+    if not final:
+        # stopped before the last level, the cost function value of all the data points at the precision of the fit
+        fun = scanCompute(x, *full)
+        if ck is not None:
+            ck.state.pop('fun', None)
+
+    if ck is not None:
+        x, fun = ck.best(x, fun)
+        ck.save(finished=not stopped)
+
 
     print('Chi: ' + str(fun))
     print('Fitting parameters: ', x)
 
     return x, fun
 
-def shgo(sample, data_info, data, scan, backS, scaleF, parameters, bounds, sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict,script,orbitals, sf_dict, nd, temperature, reflectivity_engine,step, prec, precE, use_script=False):
-    global x_vars
-    x_vars = []
+def shgo(sample, data_info, data, scan, backS, scaleF, parameters, bounds, sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict,script,orbitals, sf_dict, nd, temperature, reflectivity_engine,step, prec, precE, use_script=False, trajectory=None, workers=1, checkpoint=None, checkpoint_interval=60, state=None):
+    ck = _StartCheckpoint(checkpoint, 'simplicial homology', locals(), checkpoint_interval, state)
 
     scans = []
     # retrieves scan names
@@ -990,6 +1436,9 @@ def shgo(sample, data_info, data, scan, backS, scaleF, parameters, bounds, sBoun
         if info[2] in scan:
             scans.append(info)
 
+    # keeps track of the parameter values after each iteration
+    log = reset_x(trajectory, [info[2] for info in scans], append=state is not None)
+
     params = [sample, scans, data,backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, False, r_scale, smooth_dict, script, use_script, orbitals,  sf_dict, nd, temperature, reflectivity_engine, step, prec, precE]  # required format for function scanCompute
 
     p = None
@@ -997,26 +1446,52 @@ def shgo(sample, data_info, data, scan, backS, scaleF, parameters, bounds, sBoun
         p = None
     else:
         p = int(goParam[0])
-    ret = optimize.shgo(scanCompute, bounds, args=tuple(params), n=p, iters=int(goParam[1]),sampling_method=goParam[2],
-                        options={'disp': True}, callback=cb.stop_simplicial)
+
+    func = scanCompute
+    callback = cb.stop_simplicial
+    if ck is not None:
+        # shgo can not be restarted from its complex, only the best parameters found are kept by the checkpoint
+        def callback(x):
+            ck.update()
+            return cb.stop_simplicial(x)
+
+        func = ck.objective
+
+    if int(workers) != 1:
+        func = scanCompute  # the evaluations of worker processes can not be counted
+
+    try:
+        ret = optimize.shgo(func, bounds, args=tuple(params), n=p, iters=int(goParam[1]),sampling_method=goParam[2],
+                            options={'disp': True}, callback=callback, workers=int(workers))
+    except BaseException:
+        if ck is not None:
+            ck.save()  # the interrupted data fitting can be resumed from its last state
+        raise
+    finally:
+        log.close()
     x = ret.x
     fun = ret.fun
 
+    if ck is not None:
+        x, fun = ck.best(x, fun)
+        ck.save(finished=True)
+
     print('Chi: ' + str(fun))
     print('Fitting parameters: ', x)
 
-    f.close()
     return x, fun
 
-def dual_annealing(sample, data_info, data, scan,backS, scaleF, parameters, bounds,sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict,script,orbitals, sf_dict, nd, temperature, reflectivity_engine,step, prec, precE, use_script=False):
-    global x_vars
-    x_vars = []
+def dual_annealing(sample, data_info, data, scan,backS, scaleF, parameters, bounds,sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict,script,orbitals, sf_dict, nd, temperature, reflectivity_engine,step, prec, precE, use_script=False, trajectory=None, seed=None, checkpoint=None, checkpoint_interval=60, state=None):
+    ck = _StartCheckpoint(checkpoint, 'dual annealing', locals(), checkpoint_interval, state)
 
     scans = []
     for s, info in enumerate(data_info):
         if info[2] in scan:
             scans.append(info)
 
+    # keeps track of the parameter values after each iteration
+    log = reset_x(trajectory, [info[2] for info in scans], append=state is not None)
+
     params = [sample, scans, data,backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, False, r_scale, smooth_dict,script, use_script, orbitals, sf_dict,nd, temperature, reflectivity_engine, step, prec, precE]
 
     p = True
@@ -1025,30 +1500,175 @@ def dual_annealing(sample, data_info, data, scan,backS, scaleF, parameters, boun
     else:
         p = True
 
-    ret = optimize.dual_annealing(scanCompute, bounds, args=params, maxiter=int(goParam[0]), initial_temp=float(goParam[1]),
-                                  restart_temp_ratio=float(goParam[2]), visit=float(goParam[3]), accept=float(goParam[4]),
-                                  maxfun=float(goParam[5]), no_local_search=p, callback=cb.stop_annealing)
+    func = scanCompute
+    callback = cb.stop_annealing
+    maxfun = float(goParam[5])
+    x0 = None
+    seed = np.random.default_rng(seed)  # same random numbers as a data fitting with checkpoints
+    if ck is not None:
+        # the annealing is continued from the best parameters found with the saved random number generator and the
+        # function evaluations left, maxiter starts again
+        def callback(x, f, context):
+            ck.update()
+            ck.state['stopped'] = bool(cb.stop_annealing(x, f, context))
+            return ck.state['stopped']
+
+        func = ck.objective
+        seed = ck.rng
+        x0 = ck.state.get('x', None)
+        maxfun = max(maxfun - ck.state['nfev'], 1)
+        ck.state['stopped'] = False  # the resumed annealing may never call the callback
+
+    try:
+        ret = optimize.dual_annealing(func, bounds, args=params, maxiter=int(goParam[0]), initial_temp=float(goParam[1]),
+                                      restart_temp_ratio=float(goParam[2]), visit=float(goParam[3]), accept=float(goParam[4]),
+                                      maxfun=maxfun, no_local_search=p, callback=callback, x0=x0, seed=seed)
+    except BaseException:
+        if ck is not None:
+            ck.save()  # the interrupted data fitting can be resumed from its last state
+        raise
+    finally:
+        log.close()
     x = ret.x
     fun = ret.fun
 
+    if ck is not None:
+        x, fun = ck.best(x, fun)
+        ck.save(finished=not ck.state.get('stopped', False))
+
 
     print('Chi: ' + str(fun))
     print('Fitting parameters: ', x)
 
-    f.close()
     return x, fun
 
-def least_squares(x0, sample, data_info, data, scan,backS, scaleF, parameters, bounds,sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict, script,orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE, use_script=False):
-    global x_vars
-    x_vars = []
+def surrogate(sample, data_info, data, scan, backS, scaleF, parameters, bounds, sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict, script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE, use_script=False, trajectory=None, workers=1, seed=None):
+    """
+    Purpose: Surrogate assisted global optimization for expensive cost functions. A radial basis function
+             interpolation of all the evaluated cost function values is used to choose the next parameters. The
+             candidates are drawn around the best parameters within a trust region and only the candidates the
+             surrogate predicts to improve on the best cost are evaluated (a batch per iteration, in parallel). The
+             trust region grows after repeated improvements and shrinks after repeated failures or when the surrogate
+             predicts no improvement, the optimization stops once it is too small.
+    :param goParam: algorithm parameters [maximum number of iterations, number of evaluations per iteration,
+                    number of initial points ('None' for 2*(number of parameters + 1))]
+    :param workers: number of processes each batch is evaluated with
+    :param seed: seed of the random number generator
+    :return:
+        x - the parameter values
+        fun - the cost function value
+    The other parameters are the same as for differential_evolution.
+    """
+    from scipy.interpolate import RBFInterpolator
+    from scipy.spatial.distance import cdist
+    from scipy.stats import qmc
 
     scans = []
     for s, info in enumerate(data_info):
         if info[2] in scan:
             scans.append(info)
 
-    params = [sample, scans, data, backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, True, r_scale, smooth_dict, script, use_script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE]
+    # keeps track of the parameter values after each iteration
+    log = reset_x(trajectory, [info[2] for info in scans])
+
+    params = [sample, scans, data, backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, False, r_scale, smooth_dict, script, use_script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE]
+
+    lw = np.array([b[0] for b in bounds], dtype=float)
+    up = np.array([b[1] for b in bounds], dtype=float)
+    width = up - lw  # a fixed parameter (lw == up) stays at its value, distances are computed in the unit cube
+    n = len(lw)
+
+    maxiter = int(goParam[0])
+    batch = max(int(goParam[1]), 1)
+    if goParam[2] == 'None' or goParam[2] == None:
+        n_init = 2 * (n + 1)
+    else:
+        n_init = max(int(goParam[2]), n + 1)
 
+    rng = np.random.default_rng(seed)
+    sigma_max = 0.2  # trust region radius in units of the boundary width
+    sigma_min = sigma_max / 2 ** 6
+    sigma = sigma_max
+    successes = 0
+    failures = 0
+
+    pool = None
+    if int(workers) > 1:
+        pool = mp.Pool(int(workers), initializer=_InitCostWorker, initargs=(SampleToArray(sample), params[1:], None, None))
+
+    try:
+        # the parameters are scaled to the unit cube for the surrogate
+        U = qmc.LatinHypercube(n, seed=rng).random(n_init)
+        F = batchCompute(lw + U * width, *params, pool=pool)
+
+        for it in range(maxiter):
+            best = np.argmin(F)
+            model = RBFInterpolator(U, F, kernel='thin_plate_spline', degree=1)
+
+            # candidates perturb a few parameters of the best parameters (all of them for a small number of parameters)
+            C = np.tile(U[best], (100 * n, 1))
+            mask = rng.random(C.shape) < min(1, 20 / n)
+            mask[np.arange(len(C)), rng.integers(0, n, len(C))] = True
+            C[mask] = C[mask] + sigma * rng.standard_normal(np.sum(mask))
+            C = np.clip(C, 0, 1)
+
+            # the minimum of the surrogate can be far from the best parameters along a narrow valley
+            minimum = optimize.minimize(lambda u: model(u[None, :])[0], U[best], method='L-BFGS-B',
+                                        bounds=[(0, 1)] * n)
+            C = np.vstack([minimum.x, C])
+
+            predicted = model(C)
+            predicted[np.min(cdist(C, U), axis=1) < 1e-9] = np.inf  # already evaluated
+
+            # the candidates predicted to improve the best cost, away from each other
+            chosen = []
+            for j in np.argsort(predicted):
+                if predicted[j] >= F[best] or len(chosen) == batch:
+                    break
+                if all([np.linalg.norm(C[j] - C[k]) > 1e-3 * sigma for k in chosen]):
+                    chosen.append(j)
+
+            if len(chosen) == 0:
+                # the surrogate predicts no improvement, no evaluation is spent
+                sigma = sigma / 2
+            else:
+                F_new = batchCompute(lw + C[chosen] * width, *params, pool=pool)
+                if np.min(F_new) < F[best] - 1e-3 * abs(F[best]):
+                    successes = successes + 1
+                    failures = 0
+                else:
+                    failures = failures + 1
+                    successes = 0
+                U = np.vstack([U, C[chosen]])
+                F = np.concatenate([F, F_new])
+
+                if successes >= 3:
+                    sigma = min(2 * sigma, sigma_max)
+                    successes = 0
+                elif failures >= np.ceil(max(n, 4) / batch):
+                    sigma = sigma / 2
+                    failures = 0
+
+            best = np.argmin(F)
+            if cb.stop_surrogate(lw + U[best] * width, F[best]) or sigma < sigma_min:
+                break
+    finally:
+        log.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    best = np.argmin(F)
+    x = lw + U[best] * width
+    fun = F[best]
+
+    print('Chi: ' + str(fun))
+    print('Fitting parameters: ', x)
+
+    return x, fun
+
+def _LeastSquaresFit(x0, params, bounds, goParam):
+    # runs the scipy least squares algorithm from x0 with the algorithm parameters of the GUI
     diff = goParam[8]
     _max = goParam[9]
 
@@ -1074,8 +1694,247 @@ def least_squares(x0, sample, data_info, data, scan,backS, scaleF, parameters, b
                                         x_scale=float(goParam[5]), loss=goParam[6], f_scale=float(goParam[7]),
                                         diff_step=diff,
                                         max_nfev=_max)
+    return result
+
+
+def _JacobianErrors(jac):
+    # standard deviations of the parameters from the covariance matrix (J^T J)^-1 of the least squares fit
+    cov_matrix = np.linalg.pinv(jac.T @ jac)
+    return np.sqrt(np.abs(np.diag(cov_matrix)))
 
 
+_costWorker = dict()  # cost function arguments of the worker processes
+
+
+def _InitCostWorker(compact, params, bounds, goParam):
+    # the sample is sent once to every worker only as the arrays of SampleToArray (params are the cost function
+    # arguments without the sample), the iterations are only kept in memory
+    global x_vars
+    x_vars = TrajectoryLog()
+    _costWorker['args'] = ([ArrayToSample(*compact)] + list(params), bounds, goParam)
+
+
+def _MultistartWorker(x0):
+    params, bounds, goParam = _costWorker['args']
+    result = _LeastSquaresFit(x0, params, bounds, goParam)
+    return result.x, result.cost, _JacobianErrors(result.jac), result.nfev, result.success
+
+
+def multistart_least_squares(sample, data_info, data, scan, backS, scaleF, parameters, bounds, sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict, script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE, use_script=False, trajectory=None, x0=None, n_starts=10, sampling='latinhypercube', workers=1, seed=None, xtol=1e-3):
+    """
+    Purpose: Run the least squares algorithm from several starting points drawn within the parameter boundaries to
+             avoid getting stuck in a local minimum. The local fits are run in a pool of worker processes, solutions
+             that converged to the same parameters are merged and the solutions are ranked by their cost.
+    :param bounds: parameter boundaries as a tuple (lower bounds, upper bounds) as in least_squares
+    :param x0: current parameter values used as an additional starting point (None for the sampled points only)
+    :param n_starts: number of sampled starting points (a power of 2 for the 'sobol' sampling)
+    :param sampling: sampling of the starting points ('latinhypercube' or 'sobol')
+    :param workers: number of processes the local fits are run with
+    :param seed: seed of the sampling of the starting points
+    :param xtol: two solutions are merged if their parameters differ by less than xtol times the boundary width
+    :return: list of solutions ranked by cost, each a dictionary with
+        x - the parameter values
+        fun - the cost function value
+        std - the standard deviations of the parameters from the Jacobian of the residuals
+        nfev - number of residual evaluations of the best local fit
+        success - convergence of the best local fit
+        count - number of local fits that converged to this solution
+    The other parameters are the same as for least_squares.
+    """
+    from scipy.stats import qmc
+
+    n_starts = int(n_starts)
+    if sampling == 'sobol' and (n_starts < 1 or n_starts & (n_starts - 1) != 0):
+        # the balance properties of the Sobol' sequence require a power of 2 points
+        raise ValueError("The 'sobol' sampling requires a power of 2 starting points, not " + str(n_starts))
+
+    scans = []
+    for s, info in enumerate(data_info):
+        if info[2] in scan:
+            scans.append(info)
+
+    # only the solution of each local fit is recorded in the trajectory
+    log = reset_x(trajectory, [info[2] for info in scans])
+
+    params = [sample, scans, data, backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, False, r_scale, smooth_dict, script, use_script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE]
+
+    lw = np.array(bounds[0], dtype=float)
+    up = np.array(bounds[1], dtype=float)
+    if sampling == 'sobol':
+        sampler = qmc.Sobol(len(lw), seed=seed)
+        points = sampler.random_base2(n_starts.bit_length() - 1)
+    else:
+        sampler = qmc.LatinHypercube(len(lw), seed=seed)
+        points = sampler.random(n_starts)
+    starts = list(qmc.scale(points, lw, up))
+    if x0 is not None:
+        starts.insert(0, np.array(x0, dtype=float))
+
+    workers = min(int(workers), len(starts))
+    if workers > 1:
+        pool = mp.Pool(workers, initializer=_InitCostWorker,
+                       initargs=(SampleToArray(sample), params[1:], bounds, goParam))
+        computed = pool.imap(_MultistartWorker, starts)
+    else:
+        pool = None
+        computed = ((result.x, result.cost, _JacobianErrors(result.jac), result.nfev, result.success)
+                    for result in (_LeastSquaresFit(start, params, bounds, goParam) for start in starts))
+
+    fits = []
+    try:
+        for x, fun, std, nfev, success in computed:
+            log.append(x, fun)
+            fits.append({'x': x, 'fun': fun, 'std': std, 'nfev': nfev, 'success': success, 'count': 1})
+    finally:
+        log.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # merges the local fits that converged to the same parameters, keeping the one with the lowest cost
+    width = np.where(up > lw, up - lw, 1)
+    solutions = []
+    for fit in sorted(fits, key=lambda fit: fit['fun']):
+        for solution in solutions:
+            if np.all(np.abs(fit['x'] - solution['x']) <= xtol * width):
+                solution['count'] = solution['count'] + 1
+                break
+        else:
+            solutions.append(fit)
+
+    print('Chi: ' + str(solutions[0]['fun']))
+    print('Fitting parameters: ', solutions[0]['x'])
+
+    return solutions
+
+def _ResampleParams(params, task):
+    # cost function arguments of a bootstrap sample ({scan name: data point indices}) or of a leave-one-scan-out
+    # sample (index of the scan left out)
+    params = list(params)
+    if isinstance(task, dict):
+        data = dict()
+        smooth_dict = dict()
+        for name, idx in task.items():
+            scan = params[2][name]
+            data[name] = dict(scan, Data=np.asarray(scan['Data'])[:, idx])
+            smooth = params[12][name]
+            smooth_dict[name] = dict(smooth, Data=np.asarray(smooth['Data'])[:, idx])
+        params[2] = data
+        params[12] = smooth_dict
+    else:
+        for i in [1, 6, 7]:  # scans, scan boundaries and scan weights
+            params[i] = [value for k, value in enumerate(params[i]) if k != task]
+    return params
+
+
+def _Refit(x0, params, bounds, goParam, task):
+    result = _LeastSquaresFit(x0, _ResampleParams(params, task), bounds, goParam)
+    return result.x, result.cost
+
+
+def _ResampleWorker(args):
+    x0, task = args
+    params, bounds, goParam = _costWorker['args']
+    return _Refit(x0, params, bounds, goParam, task)
+
+
+def resample_uncertainty(x0, sample, data_info, data, scan, backS, scaleF, parameters, bounds, sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict, script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE, use_script=False, method='bootstrap', n_samples=50, workers=1, seed=None):
+    """
+    Purpose: Estimate the uncertainty of fitted parameters by refitting resampled data sets with the least squares
+             algorithm, starting from the best fit. The bootstrap draws the data points of every scan with
+             replacement, the jackknife leaves one scan out at a time. The refits are run in a pool of worker
+             processes.
+    :param x0: parameter values of the best fit
+    :param bounds: parameter boundaries as a tuple (lower bounds, upper bounds) as in least_squares
+    :param method: 'bootstrap' or 'jackknife'
+    :param n_samples: number of bootstrap samples (the jackknife has one sample per scan)
+    :param workers: number of processes the refits are run with
+    :param seed: seed of the bootstrap resampling
+    :return: dictionary with
+        x - parameter values of every resampled fit (samples x parameters)
+        fun - cost function value of every resampled fit
+        mean - mean of the parameter values
+        std - standard deviation of the parameters
+        correlation - correlation matrix of the parameters
+    The other parameters are the same as for least_squares.
+    """
+    scans = []
+    for s, info in enumerate(data_info):
+        if info[2] in scan:
+            scans.append(info)
+
+    params = [sample, scans, data, backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, False, r_scale, smooth_dict, script, use_script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE]
+
+    x0 = np.clip(np.array(x0, dtype=float), bounds[0], bounds[1])
+    if method == 'jackknife':
+        if len(scans) < 2:
+            raise ValueError('The jackknife needs at least two scans.')
+        tasks = list(range(len(scans)))
+    elif method == 'bootstrap':
+        rng = np.random.default_rng(seed)
+        tasks = []
+        for i in range(int(n_samples)):
+            task = dict()
+            for info in scans:
+                n = np.shape(data[info[2]]['Data'])[1]
+                task[info[2]] = np.sort(rng.integers(0, n, n))
+            tasks.append(task)
+    else:
+        raise ValueError('Unknown resampling method ' + str(method))
+
+    workers = min(int(workers), len(tasks))
+    if workers > 1:
+        pool = mp.Pool(workers, initializer=_InitCostWorker,
+                       initargs=(SampleToArray(sample), params[1:], bounds, goParam))
+        computed = pool.imap(_ResampleWorker, [(x0, task) for task in tasks])
+    else:
+        pool = None
+        computed = (_Refit(x0, params, bounds, goParam, task) for task in tasks)
+
+    x = []
+    fun = []
+    try:
+        for x_sample, fun_sample in computed:
+            x.append(x_sample)
+            fun.append(fun_sample)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    x = np.array(x)
+    n = len(x)
+    mean = np.mean(x, axis=0)
+    if method == 'jackknife':
+        std = np.sqrt((n - 1) / n * np.sum((x - mean) ** 2, axis=0))
+    else:
+        std = np.std(x, axis=0, ddof=1)
+
+    # parameters that did not change in any refit are uncorrelated
+    deviation = x - mean
+    norm = np.sqrt(np.sum(deviation ** 2, axis=0))
+    norm[norm == 0] = 1
+    correlation = (deviation.T @ deviation) / np.outer(norm, norm)
+    correlation[np.diag_indices_from(correlation)] = 1
+
+    return {'x': x, 'fun': np.array(fun), 'mean': mean, 'std': std, 'correlation': correlation}
+
+
+def least_squares(x0, sample, data_info, data, scan,backS, scaleF, parameters, bounds,sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict, script,orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE, use_script=False, trajectory=None):
+    scans = []
+    for s, info in enumerate(data_info):
+        if info[2] in scan:
+            scans.append(info)
+
+    # keeps track of the parameter values after each iteration
+    log = reset_x(trajectory, [info[2] for info in scans])
+
+    params = [sample, scans, data, backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, True, r_scale, smooth_dict, script, use_script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE]
+
+    try:
+        result = _LeastSquaresFit(x0, params, bounds, goParam)
+    finally:
+        log.close()
 
     x = result.x
     fun = result.cost
@@ -1087,37 +1946,157 @@ def least_squares(x0, sample, data_info, data, scan,backS, scaleF, parameters, b
     #correlation_matrix = cov_matrix / np.outer(std_devs, std_devs)
     print(np.diag(cov_matrix))
 
-    f.close()
     return x, fun
 
-def direct(sample, data_info, data,scan,backS, scaleF, parameters, bounds,sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict,script,orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE, use_script=False):
-    # performs the differential evolution global optimization
-    global x_vars
-    x_vars = []
-
+def _PotentiallyOptimal(d, F, eps):
+    # indices of the potentially optimal hyperrectangles: the lowest cost of each size on the lower right convex hull
+    # of (size, cost) that can improve on the best cost by at least eps
+    fmin = np.min(F)
+    sizes = np.unique(d)
+    groups = [np.flatnonzero(d == size)[np.argmin(F[d == size])] for size in sizes]
+    start = max([k for k, g in enumerate(groups) if F[g] == fmin])
+
+    hull = []
+    for g in groups[start:]:
+        while len(hull) > 1 and ((F[hull[-1]] - F[hull[-2]]) * (d[g] - d[hull[-2]]) >=
+                                 (F[g] - F[hull[-2]]) * (d[hull[-1]] - d[hull[-2]])):
+            hull.pop()
+        hull.append(g)
+
+    selected = []
+    for k, g in enumerate(hull[:-1]):
+        K = (F[hull[k + 1]] - F[g]) / (d[hull[k + 1]] - d[g])
+        if F[g] - K * d[g] <= fmin - eps * abs(fmin):
+            selected.append(g)
+    selected.append(hull[-1])
+    return selected
+
+
+def direct(sample, data_info, data,scan,backS, scaleF, parameters, bounds,sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict,script,orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE, use_script=False, trajectory=None, workers=1, f_min=None):
+    """
+    Purpose: DIRECT (dividing rectangles) global optimization. The parameter space is divided into hyperrectangles
+             and in every iteration all the potentially optimal hyperrectangles are trisected along their longest
+             sides. The new centers of an iteration are evaluated together as one batch, in parallel when workers > 1,
+             so the result does not depend on the number of workers.
+    :param goParam: algorithm parameters [eps, maximum number of function evaluations ('None' for 1000 times the
+                    number of parameters), maximum number of iterations, locally biased, f_min_rtol, volume tolerance,
+                    length tolerance]
+    :param workers: number of processes each batch is evaluated with
+    :param f_min: known minimum of the cost function, the data fitting stops once the cost is within f_min_rtol of it
+                  (relative, absolute if f_min is zero). f_min_rtol is not used if None.
+    :return:
+        x - the parameter values
+        fun - the cost function value
+    The other parameters are the same as for differential_evolution.
+    """
     scans = []
     for s, info in enumerate(data_info):
         if info[2] in scan:
             scans.append(info)
 
+    # keeps track of the parameter values after each iteration
+    log = reset_x(trajectory, [info[2] for info in scans])
+
     params = [sample, scans, data,backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, False, r_scale, smooth_dict, script, use_script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE]  # required format for function scanCompute
 
-    # checking if locally biased
-    p=True
-    if goParam[3] == 'True':
-        p = True
+    lw = np.array([b[0] for b in bounds], dtype=float)
+    up = np.array([b[1] for b in bounds], dtype=float)
+    width = up - lw
+    n = len(lw)
+
+    eps = float(goParam[0])
+    if goParam[1] == 'None' or goParam[1] == None:
+        maxfun = 1000 * n
     else:
-        p = False
-    # This line will be used to select and use different global optimization algorithms
-    #ret = optimize.direct(scanCompute, bounds, )
-    #x = ret.x
-    #fun = ret.fun
+        maxfun = int(goParam[1])
+    maxiter = int(goParam[2])
 
-    x =[]
-    fun = []
+    # checking if locally biased
+    p = goParam[3] == 'True' or goParam[3] == True
+    f_min_rtol = float(goParam[4])
+    vol_tol = float(goParam[5])
+    len_tol = float(goParam[6])
+
+    pool = None
+    if int(workers) > 1:
+        pool = mp.Pool(int(workers), initializer=_InitCostWorker, initargs=(SampleToArray(sample), params[1:], None, None))
 
-    #print('Chi: ' + str(fun))
-    #print('Fitting parameters: ', x)
+    try:
+        # hyperrectangles of the unit cube, the sides of a hyperrectangle are 3**-level
+        C = np.full((1, n), 0.5)
+        L = np.zeros((1, n), dtype=int)
+        F = batchCompute(lw + C * width, *params, pool=pool)
+
+        for it in range(maxiter):
+            side = 3.0 ** -L
+            if p:
+                d = np.round(0.5 * np.max(side, axis=1), 12)  # locally biased uses the longest side
+            else:
+                d = np.round(0.5 * np.sqrt(np.sum(side ** 2, axis=1)), 12)
+            selected = _PotentiallyOptimal(d, F, eps)
+
+            # the centers of the new hyperrectangles along the longest sides of every selected hyperrectangle
+            dims = []
+            points = []
+            for j in selected:
+                I = np.flatnonzero(L[j] == np.min(L[j]))
+                delta = side[j, I[0]] / 3
+                dims.append(I)
+                for i in I:
+                    for sign in [1, -1]:
+                        c = C[j].copy()
+                        c[i] = c[i] + sign * delta
+                        points.append(c)
+            points = np.array(points)
+            f_new = batchCompute(lw + points * width, *params, pool=pool)
+
+            # the sides with the best new centers are divided first, so they end up in the largest hyperrectangles
+            levels = []
+            k = 0
+            for j, I in zip(selected, dims):
+                f_pair = f_new[k:k + 2 * len(I)].reshape(len(I), 2)
+                order = I[np.argsort(np.min(f_pair, axis=1), kind='stable')]
+                rows = {i: r for r, i in enumerate(I)}
+                level = L[j].copy()
+                child = np.empty((2 * len(I), n), dtype=int)
+                for i in order:
+                    level[i] = level[i] + 1
+                    child[2 * rows[i]] = level
+                    child[2 * rows[i] + 1] = level
+                levels.append(child)
+                L[j] = level
+                k = k + 2 * len(I)
+
+            C = np.vstack([C, points])
+            L = np.vstack([L] + levels)
+            F = np.concatenate([F, f_new])
+
+            best = np.argmin(F)
+            side = 3.0 ** -L[best]
+            if p:
+                size = 0.5 * np.max(side)
+            else:
+                size = 0.5 * np.sqrt(np.sum(side ** 2))
+
+            if cb.stop_direct(lw + C[best] * width, F[best]):
+                break
+            if f_min is not None:
+                if F[best] - f_min <= f_min_rtol * (abs(f_min) if f_min != 0 else 1):
+                    break
+            if len(F) >= maxfun or np.prod(side) <= vol_tol or size <= len_tol:
+                break
+    finally:
+        log.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    best = np.argmin(F)
+    x = lw + C[best] * width
+    fun = F[best]
+
+    print('Chi: ' + str(fun))
+    print('Fitting parameters: ', x)
 
     return x, fun
 
@@ -1125,6 +2104,303 @@ def return_x():
     global x_vars
     return x_vars
 
+
+class Checkpoint():
+    """
+    Purpose: Periodically saves the state of a data fitting (algorithm state, random number generator and the fit
+             configuration) so an interrupted data fitting can be continued with resume
+    """
+    def __init__(self, fname, algorithm, config, interval=60, state=None, seed=None):
+        """
+        :param fname: file name of the checkpoint
+        :param algorithm: name of the data fitting algorithm
+        :param config: arguments of the data fitting wrapper
+        :param interval: minimum time in seconds between two checkpoints
+        :param state: state of the interrupted data fitting
+        :param seed: seed of the random number generator of a new data fitting
+        """
+        self.fname = fname
+        self.algorithm = algorithm
+        self.config = config
+        self.interval = interval
+        self.state = {'nit': 0, 'nfev': 0} if state is None else state
+        self.rng = np.random.default_rng(seed)
+        if 'rng' in self.state:
+            self.rng.bit_generator.state = self.state['rng']
+        self.last = time.time()
+
+    def objective(self, x, *args):
+        # counts the function evaluations and keeps the best parameters
+        fun = scanCompute(x, *args)
+        self.state['nfev'] = self.state['nfev'] + 1
+        if fun < self.state.get('fun', np.inf):
+            self.state['x'] = np.array(x)
+            self.state['fun'] = fun
+        return fun
+
+    def best(self, x, fun):
+        """
+        Purpose: Keep the best parameters of the resumed and interrupted runs
+        :param x: parameters found by the data fitting
+        :param fun: cost function value of x
+        :return: best parameters and their cost function value
+        """
+        if 'fun' in self.state and self.state['fun'] < fun:
+            return self.state['x'], self.state['fun']
+        self.state['x'] = x
+        self.state['fun'] = fun
+        return x, fun
+
+    def update(self, **state):
+        """
+        Purpose: Update the algorithm state and save it if the checkpoint interval has passed
+        """
+        self.state.update(state)
+        if time.time() - self.last >= self.interval:
+            self.save()
+
+    def save(self, finished=False):
+        """
+        Purpose: Save the checkpoint, the file is replaced in one step so an interrupted save keeps the old checkpoint
+        :param finished: True if the data fitting has finished
+        """
+        self.state['rng'] = self.rng.bit_generator.state
+        checkpoint = {'Algorithm': self.algorithm, 'Config': self.config, 'State': self.state,
+                      'Finished': finished, 'Time': time.time()}
+        with open(self.fname + '.tmp', 'wb') as f:
+            pickle.dump(checkpoint, f)
+        os.replace(self.fname + '.tmp', self.fname)
+        self.last = time.time()
+
+
+def _StartCheckpoint(fname, algorithm, config, interval, state):
+    # copies the configuration before the data fitting changes the sample
+    if fname is None:
+        return None
+    config = {key: value for key, value in config.items()
+              if key not in ['cb', 'checkpoint', 'checkpoint_interval', 'state']}
+    ck = Checkpoint(fname, algorithm, copy.deepcopy(config), interval, state, config.get('seed', None))
+    ck.save()
+    return ck
+
+
+class FitCallback():
+    """
+    Purpose: Callback used when a data fitting is run without the GUI, it records the iterations and never stops
+    """
+    def stop_evolution(self, x, convergence):
+        x_vars.append(x)
+        return False
+
+    def stop_simplicial(self, x):
+        x_vars.append(x)
+        return False
+
+    def stop_annealing(self, x, f, context):
+        x_vars.append(x, f)
+        return False
+
+    def stop_surrogate(self, x, f):
+        x_vars.append(x, f)
+        return False
+
+    def stop_direct(self, x, f):
+        x_vars.append(x, f)
+        return False
+
+
+def resume(fname, cb=None, checkpoint_interval=60):
+    """
+    Purpose: Continue a data fitting from its checkpoint. Differential evolution continues from the saved population
+             and generation. Dual annealing starts a new annealing (from the initial temperature) at the best
+             parameters found, with the saved random number generator and the function evaluations that were left
+             (maxfun is reduced, maxiter starts again). Simplicial homology can not be continued: the search is run
+             again from the start and the checkpoint only keeps the best parameters of the interrupted run when they
+             are better.
+    :param fname: file name of the checkpoint
+    :param cb: callback class used to stop the data fitting (FitCallback if None)
+    :param checkpoint_interval: minimum time in seconds between two checkpoints
+    :return:
+        x - the parameter values
+        fun - the cost function value
+    """
+    with open(fname, 'rb') as f:
+        checkpoint = pickle.load(f)
+
+    state = checkpoint['State']
+    if checkpoint['Finished']:
+        return state['x'], state['fun']
+
+    algorithms = {'differential evolution': differential_evolution, 'simplicial homology': shgo,
+                  'dual annealing': dual_annealing}
+    if cb is None:
+        cb = FitCallback()
+
+    return algorithms[checkpoint['Algorithm']](**checkpoint['Config'], cb=cb, checkpoint=fname,
+                                               checkpoint_interval=checkpoint_interval, state=state)
+
+def _CostWorker(x):
+    params, bounds, goParam = _costWorker['args']
+    return scanCompute(x, *params)
+
+
+def batchCompute(X, *args, pool=None):
+    """
+    Purpose: Calculate the cost function for a batch of parameter values, in a pool of worker processes if given
+    :param X: array of parameter values (one row per evaluation)
+    :param args: List of required parameters for cost function calculation (same as scanCompute)
+    :param pool: multiprocessing pool started with _InitCostWorker (None to evaluate in this process)
+    :return: numpy array of the cost function values
+    """
+    if pool is not None:
+        return np.array(pool.map(_CostWorker, list(X)))
+    return np.array([scanCompute(x, *args) for x in X])
+
+
+def _LogProbability(X, params, lw, up, scale, pool):
+    # flat prior within the parameter boundaries, the walkers outside the boundaries are not evaluated
+    inside = np.all((X >= lw) & (X <= up), axis=1)
+    log_prob = np.full(len(X), -np.inf)
+    if np.any(inside):
+        log_prob[inside] = -batchCompute(X[inside], *params, pool=pool) / scale
+    return log_prob
+
+
+def mcmc(sample, data_info, data, scan, backS, scaleF, parameters, bounds, sBounds, sWeights, goParam, cb, objective, shape_weight, r_scale, smooth_dict, script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE, use_script=False, x0=None, n_walkers=None, n_steps=1000, scale=1.0, workers=1, seed=None, chain=None, resume=False):
+    """
+    Purpose: Sample the posterior distribution of the parameters with the affine-invariant ensemble sampler (stretch
+             move of Goodman and Weare). The log probability is -cost/scale with a flat prior within the parameter
+             boundaries. Each half of the ensemble is moved at once, its proposals are evaluated as a batch in a pool
+             of worker processes. The chain is appended to an HDF5 file after every step together with the state of
+             the random number generator, so an interrupted sampling can be continued with resume=True.
+    :param bounds: list of parameter boundaries (lower, upper)
+    :param x0: parameter values of the best fit, the walkers start in a small ball around it (None to start the
+               walkers uniformly within the boundaries)
+    :param n_walkers: number of walkers, even and at least twice the number of parameters (default)
+    :param n_steps: total number of steps of the chain (including the steps of a resumed chain)
+    :param scale: temperature of the cost function, log probability = -cost/scale
+    :param workers: number of processes the walkers are evaluated with
+    :param seed: seed of the random number generator
+    :param chain: HDF5 file name the chain is written to (None to only keep it in memory)
+    :param resume: continue the chain of the file instead of starting a new one
+    :return: dictionary with
+        chain - positions of the walkers (steps x walkers x parameters)
+        log_prob - log probability of the walkers (steps x walkers)
+        acceptance - fraction of the accepted moves of each walker
+    The other parameters are the same as for differential_evolution.
+    """
+    scans = []
+    for s, info in enumerate(data_info):
+        if info[2] in scan:
+            scans.append(info)
+
+    params = [sample, scans, data, backS, scaleF, parameters, sBounds, sWeights, objective, shape_weight, False, r_scale, smooth_dict, script, use_script, orbitals, sf_dict, nd, temperature, reflectivity_engine, step, prec, precE]
+
+    lw = np.array([b[0] for b in bounds], dtype=float)
+    up = np.array([b[1] for b in bounds], dtype=float)
+    n = len(lw)
+    if n_walkers is None:
+        n_walkers = 2 * n
+    n_walkers = max(int(n_walkers) + int(n_walkers) % 2, 2 * n)
+    a = 2.0  # scale of the stretch move
+
+    rng = np.random.default_rng(seed)
+    positions = []
+    log_probs = []
+    accepted = np.zeros(n_walkers)
+    done = 0
+    f = None
+    if chain is not None and resume and os.path.exists(chain):
+        f = h5py.File(chain, 'a')
+        done = f['chain'].shape[0]
+        n_walkers = f['chain'].shape[1]
+        rng.bit_generator.state = json.loads(f.attrs['RNG'])
+        if done > 0:
+            X = f['chain'][done - 1]
+            log_prob = f['log_prob'][done - 1]
+            accepted = f.attrs['Accepted'] * done
+    elif chain is not None:
+        # the state of the random number generator before the walkers are drawn, a chain interrupted before its
+        # first step starts again with the same walkers
+        f = h5py.File(chain, 'w')
+        f.attrs['Parameters'] = str(parameters)
+        f.attrs['Scale'] = scale
+        f.attrs['Accepted'] = accepted
+        f.attrs['RNG'] = json.dumps(rng.bit_generator.state)
+        f.create_dataset('chain', shape=(0, n_walkers, n), maxshape=(None, n_walkers, n), dtype=float,
+                         chunks=(16, n_walkers, n))
+        f.create_dataset('log_prob', shape=(0, n_walkers), maxshape=(None, n_walkers), dtype=float,
+                         chunks=(16, n_walkers))
+        f.flush()
+
+    if done == 0:
+        if x0 is None:
+            X = lw + (up - lw) * rng.random((n_walkers, n))
+        else:
+            X = np.clip(np.array(x0, dtype=float) + 1e-3 * (up - lw) * rng.standard_normal((n_walkers, n)), lw, up)
+
+    pool = None
+    if int(workers) > 1:
+        pool = mp.Pool(int(workers), initializer=_InitCostWorker, initargs=(SampleToArray(sample), params[1:], None, None))
+
+    try:
+        if done == 0:
+            log_prob = _LogProbability(X, params, lw, up, scale, pool)
+
+        half = n_walkers // 2
+        for i in range(done, int(n_steps)):
+            # each half of the ensemble is moved using the positions of the other half
+            for first, other in [(slice(0, half), slice(half, n_walkers)), (slice(half, n_walkers), slice(0, half))]:
+                S = X[first]
+                C = X[other][rng.integers(0, half, half)]  # a walker of the other half for each walker
+                z = ((a - 1) * rng.random(half) + 1) ** 2 / a  # g(z) proportional to 1/sqrt(z) on [1/a, a]
+                Y = C + z[:, None] * (S - C)
+                new_log_prob = _LogProbability(Y, params, lw, up, scale, pool)
+                accept = np.log(rng.random(half)) < (n - 1) * np.log(z) + new_log_prob - log_prob[first]
+                X[first][accept] = Y[accept]
+                log_prob[first][accept] = new_log_prob[accept]
+                accepted[first] = accepted[first] + accept
+
+            positions.append(np.copy(X))
+            log_probs.append(np.copy(log_prob))
+            if f is not None:
+                for name, value in [('chain', X), ('log_prob', log_prob)]:
+                    dset = f[name]
+                    dset.resize(i + 1, axis=0)
+                    dset[i] = value
+                f.attrs['Accepted'] = accepted / (i + 1)
+                f.attrs['RNG'] = json.dumps(rng.bit_generator.state)
+                f.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if f is not None:
+        f.close()
+        return ReadChainHDF5(chain)
+
+    return {'chain': np.array(positions).reshape(-1, n_walkers, n), 'log_prob': np.array(log_probs).reshape(-1, n_walkers),
+            'acceptance': accepted / max(len(positions), 1)}
+
+
+def ReadChainHDF5(fname):
+    """
+    Purpose: Read the chain of the ensemble sampler written by mcmc
+    :param fname: HDF5 file name
+    :return: dictionary with the positions of the walkers 'chain' (steps x walkers x parameters), their log
+             probability 'log_prob' (steps x walkers), the fraction of accepted moves of each walker 'acceptance' and
+             the fitting parameters 'parameters'
+    """
+    with h5py.File(fname, 'r') as f:
+        result = dict()
+        result['chain'] = f['chain'][()]
+        result['log_prob'] = f['log_prob'][()]
+        result['acceptance'] = np.array(f.attrs.get('Accepted', np.zeros(result['chain'].shape[1])))
+        result['parameters'] = ast.literal_eval(f.attrs['Parameters'])
+    return result
+
+
 class MinimizeStopper(object):
     def __init__(self, max_sec=0.3):
         self.max_sec = max_sec
@@ -40,29 +40,160 @@ from UTILS.material_structure import *  # version
 import pickle
 from numba import *
 from scipy import interpolate
+from collections.abc import MutableMapping
+import h5py
+import copy
 import os
 
 # Import ROOT_DIR from the __init__.py file
 from . import ROOT_DIR
 
-# Loads the non-magnetic form factors stored in our database
-with open(os.path.join(ROOT_DIR, 'DATA/form_factor.pkl'), 'rb') as f:
-    global ff
-    ff = dict()
-    ff_temp = pickle.load(f)  # This is made a global variable so we do not have to keep on loading in the file
-    for key in ff_temp.keys():
-        ff[key] = ff_temp[key]['Data']
+class FormFactorStore(MutableMapping):
+    """
+    Purpose: Dictionary of form factors where the database entries are only read when first requested.
+             The database is an HDF5 file with one contiguous dataset per element. These datasets are memory
+             mapped copy-on-write, so forked worker processes share the same pages until an array is modified.
+             Entries assigned through change_ff or _use_given_ff take precedence over the database.
+             If the HDF5 file does not exist the legacy pickle is loaded in full on first access.
+    """
+    def __init__(self, filename, fallback=None):
+        """
+        :param filename: HDF5 form factor database written by WriteFormFactorHDF5
+        :param fallback: pickle database {element: {'Data': array, ...}} used if filename does not exist
+        """
+        self.filename = filename
+        self.fallback = fallback
+        self._index = None  # element -> (offset, shape, dtype), offset is None if the dataset cannot be mapped
+        self._data = dict()  # loaded or user assigned form factors
+        self._removed = set()
+        self.version = 0  # changed by every assignment so cached simulations can tell the database changed
+
+    def _open(self):
+        # reads the element index (not the data) the first time the store is used
+        if self._index is not None:
+            return
+        index = dict()
+        if os.path.isfile(self.filename):
+            with h5py.File(self.filename, 'r') as f:
+                for key in f.keys():
+                    dset = f[key]
+                    index[key] = (dset.id.get_offset(), dset.shape, dset.dtype)
+        else:
+            with open(self.fallback, 'rb') as f:
+                ff_temp = pickle.load(f)
+            for key in ff_temp.keys():
+                index[key] = (None, None, None)
+                self._data.setdefault(key, ff_temp[key]['Data'])
+        self._index = index
+
+    def _load(self, key):
+        offset, shape, dtype = self._index[key]
+        if offset is not None:
+            return np.memmap(self.filename, dtype=dtype, mode='c', offset=offset, shape=shape)
+        with h5py.File(self.filename, 'r') as f:
+            return np.array(f[key])
+
+    def __getitem__(self, key):
+        if key not in self._data:
+            self._open()
+            if key in self._removed or key not in self._index:
+                raise KeyError(key)
+            self._data[key] = self._load(key)
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._removed.discard(key)
+        self.version = self.version + 1
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._data.pop(key, None)
+        self._removed.add(key)
+        self.version = self.version + 1
+
+    def __contains__(self, key):
+        if key in self._data:
+            return True
+        self._open()
+        return key in self._index and key not in self._removed
+
+    def __iter__(self):
+        self._open()
+        for key in self._index:
+            if key not in self._removed:
+                yield key
+        for key in list(self._data.keys()):
+            if key not in self._index:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def loaded(self):
+        """
+        Purpose: Names of the form factors held in memory (read from the database or assigned)
+        """
+        return list(self._data.keys())
 
-f.close()
+    def restore(self, other):
+        """
+        Purpose: Reset the entries to the entries of a copy of the store (the store object itself is kept as it is
+                 shared by the modules that imported it)
+        :param other: copy of the store made with copy.copy
+        """
+        self._data = dict(other._data)
+        self._removed = set(other._removed)
+        self.version = self.version + 1
+
+    def __copy__(self):
+        new = FormFactorStore(self.filename, self.fallback)
+        new._index = self._index
+        new._data = dict(self._data)
+        new._removed = set(self._removed)
+        return new
+
+    def __deepcopy__(self, memo):
+        new = FormFactorStore(self.filename, self.fallback)
+        new._index = self._index
+        new._data = copy.deepcopy(self._data, memo)
+        new._removed = set(self._removed)
+        return new
+
+    def __reduce__(self):
+        # memory mapped entries are re-mapped lazily by the receiving process, only assigned arrays are sent
+        data = {key: value for key, value in self._data.items() if not isinstance(value, np.memmap)}
+        return (_rebuild_store, (self.filename, self.fallback, data, self._removed))
+
+
+def _rebuild_store(filename, fallback, data, removed):
+    store = FormFactorStore(filename, fallback)
+    store._data = data
+    store._removed = set(removed)
+    return store
+
+
+def WriteFormFactorHDF5(pkl_file, h5_file):
+    """
+    Purpose: Convert a pickled form factor database into the HDF5 database read by FormFactorStore
+    :param pkl_file: pickle file {element: {'Data': array, 'Source': str, 'Updated': str}}
+    :param h5_file: name of the HDF5 file to create
+    """
+    with open(pkl_file, 'rb') as f:
+        ff_temp = pickle.load(f)
 
-# Loads the magnetic form factors stored in our database
-with open(os.path.join(ROOT_DIR, 'DATA/form_factor_magnetic.pkl'),'rb') as f:
-    global ffm
-    ffm = dict()
-    ffm_temp = pickle.load(f)
-    for key in ffm_temp.keys():
-        ffm[key] = ffm_temp[key]['Data']
-f.close()
+    with h5py.File(h5_file, 'w') as f:
+        for key in ff_temp.keys():
+            dset = f.create_dataset(key, data=np.ascontiguousarray(ff_temp[key]['Data']))  # contiguous, uncompressed
+            for attr in ff_temp[key].keys():
+                if attr != 'Data':
+                    dset.attrs[attr] = str(ff_temp[key][attr])
+
+
+# Non-magnetic and magnetic form factors stored in our database, elements are only read when first used
+ff = FormFactorStore(os.path.join(ROOT_DIR, 'DATA/form_factor.h5'), fallback=os.path.join(ROOT_DIR, 'DATA/form_factor.pkl'))
+ffm = FormFactorStore(os.path.join(ROOT_DIR, 'DATA/form_factor_magnetic.h5'), fallback=os.path.join(ROOT_DIR, 'DATA/form_factor_magnetic.pkl'))
 
 def change_ff(ffname, value): #As long as the value that is loaded is [ff_x, ff_y, ff_z]
     # changes the value of a form factor
@@ -172,18 +303,15 @@ def find_form_factor(element, E, mag):
     """
     #global ffm
     #global ff
-    mag_keys = list(ffm.keys())
     if mag:  # magnetic form factor
-        mag_keys = list(ffm.keys())
-        if element not in mag_keys:
+        if element not in ffm:
             raise NameError(element + " not found in magnetic form factors")
         F = form_factor_m(ffm[element],E)
     else:  # non-magnetic form factor
-        struc_keys = list(ff.keys())
-        if element not in struc_keys:
+        if element not in ff:
             raise NameError(element + " not found in structural form factors")
         if len(ff[element][0, :]) == 9:
-            F = form_factor(ff, E)
+            F = form_factor(ff[element], E)
         else: #Duplicate it to be an isotropic case where ff-x = ff-y = ff-z
             ff_new = np.array([ [ff[element][k, 0], ff[element][k, 0], ff[element][k, 0], ff[element][k, 1],ff[element][k, 1],ff[element][k, 1],ff[element][k, 2], ff[element][k, 2], ff[element][k, 2]] for k in range(len(ff[element][:, 0]))])
             F = form_factor(ff_new, E)
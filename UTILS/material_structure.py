@@ -133,6 +133,7 @@ def generate_structure(thickness, structure, my_slabs, epsilon, epsilon_mag, lay
     m = len(my_slabs)  # number of slabs
     # m = len(epsilon)
     A = pr.Generate_structure(m)  # creates object for reflectivity computation
+    layer_transition = np.max(transition, axis=0)  # thickness at which each layer ends
     m_j = 0  # previous slab
     idx = 0  # keeps track of current layer
     layer = 0
@@ -154,8 +155,7 @@ def generate_structure(thickness, structure, my_slabs, epsilon, epsilon_mag, lay
                         phi = structure[0][ele].phi
 
         # Determines the magnetization direction of the other layers
-        temp_list = [transition[i][layer] for i in range(len(transition))]
-        trans = max(temp_list)
+        trans = layer_transition[layer]
         if trans <= thickness[m_j] and layer < len(transition[0]) - 1:
             layer = layer + 1
             if layer_magnetized[layer]:
@@ -416,6 +416,12 @@ def error_function(t, sigma1, sigma2, offset1, offset2):
     return result
 
 class element: 
+    # the attributes are stored in slots instead of a per-instance dictionary, which makes the many element objects of
+    # a sample smaller and their attribute access faster
+    __slots__ = ('name', 'molar_mass', 'density', 'thickness', 'roughness', 'linked_roughness', 'stoichiometry',
+                 'poly_ratio', 'polymorph', 'gamma', 'phi', 'mag_density', 'scattering_factor',
+                 'mag_scattering_factor', 'position')
+
     def __init__(self, name, stoichiometry):
         """
         Purpose: Used in class slab. Used to keep track of element properties for each layer
@@ -438,6 +444,16 @@ class element:
         self.mag_scattering_factor = []
         self.position = None
 
+    def __getstate__(self):
+        return {key: getattr(self, key) for key in self.__slots__ if hasattr(self, key)}
+
+    def __setstate__(self, state):
+        # elements pickled before the attributes were slots carry their attribute dictionary
+        if isinstance(state, tuple):
+            state = {**(state[0] or dict()), **(state[1] or dict())}
+        for key, val in state.items():
+            setattr(self, key, val)
+
 class slab:
     def __init__(self, num_layers): 
         """
@@ -862,6 +878,9 @@ class slab:
 
         next_density = 0  # initialization required for algorithm
         n = len(self.structure)  # number of layers
+        # layer table, the element symbols and element objects of every layer are listed once in position order
+        layer_keys = [list(my_layer.keys()) for my_layer in self.structure]
+        layer_elements = [list(my_layer.values()) for my_layer in self.structure]
         thickness = np.array([])  # thickness array
         density_struct = {k: np.array([]) for k in self.myelements}  # hold structure density
         density_poly = {k: dict() for k in list(self.poly_elements.keys())}  # hold polymorph elements
@@ -883,13 +902,13 @@ class slab:
         mag_keys = list(self.mag_elements.keys())  # retrieves magnetic keys
         # for an arbitrary size of elements
         # note that this relies that all layers in the slab definition have the same number of elements!
-        num_ele = len(list(self.structure[0].keys()))  # assumes all layers have the same number of elements
+        num_ele = len(layer_keys[0])  # assumes all layers have the same number of elements
         transition = [[0] for i in range(num_ele)]  # assumes same number elements through entire sample
-        thick_array = np.array([0.0 for i in range(len(list(self.structure[0].keys())))])
+        thick_array = np.array([0.0 for i in range(num_ele)])
 
         for layer in range(1,n):  # loop over all layers
             for i in range(num_ele):  # loop over all elements
-                val = transition[i][layer-1] + list(self.structure[layer].values())[i].thickness
+                val = transition[i][layer-1] + layer_elements[layer][i].thickness
 
                 transition[i].append(val)
                 thick_array[i] = val
@@ -916,7 +935,7 @@ class slab:
                 offset_list = []
 
                 for layer in range(n):
-                    if ele in list(self.structure[layer].keys()):
+                    if ele in self.structure[layer]:
                         position = self.structure[layer][ele].position  # position of element
                         offset_list = transition[position]  # offset for new implementation
                 # Loops through all layers
@@ -926,7 +945,7 @@ class slab:
                     #offset = transition[layer]
 
                     # Element is found in the current layer (ignore linked roughness)
-                    if ele in list(self.structure[layer].keys()):
+                    if ele in self.structure[layer]:
 
                         # saves scattering factor to be used in computation, by comparing the sf element 
                         if ele not in self.find_sf[0]:
@@ -942,7 +961,7 @@ class slab:
                         current_density = self.structure[layer][ele].density  # current density
                         if layer == n - 1:  # Last layer
                             next_density = 0  # density of element in next layer
-                        elif ele in list(self.structure[layer+1].keys()):  # element in next layer
+                        elif ele in self.structure[layer+1]:  # element in next layer
                             next_density = self.structure[layer+1][ele].density
                         else:  # element not in the next layer
                             next_density = 0
@@ -961,12 +980,12 @@ class slab:
                         if layer == n - 1:  # Last layer
                             next_density = current_density
                             sigma = 0
-                        elif ele in list(self.structure[layer+1].keys()):  # element in next layer
+                        elif ele in self.structure[layer+1]:  # element in next layer
                             if type(self.structure[layer+1][ele].linked_roughness) is float or type(self.structure[layer+1][ele].linked_roughness) is int:  # roughness is NOT linked to the previous site
                                 sigma = self.structure[layer+1][ele].linked_roughness
                             else:  # roughness is linked to the previous site
                                 position = self.structure[layer + 1][ele].position  # position of element
-                                previous_element = list(self.structure[layer].keys())[position]
+                                previous_element = layer_keys[layer][position]
                                 sigma = self.structure[layer][previous_element].roughness
 
                             next_density = self.structure[layer+1][ele].density # next layer density
@@ -988,7 +1007,7 @@ class slab:
                 layer = 0
                 not_found = True
                 while not_found or layer<=n-1:
-                    if ele in list(self.structure[layer].keys()):
+                    if ele in self.structure[layer]:
                         if len(list(self.structure[layer][ele].polymorph)) == 0:
                             raise SyntaxError('Polymorph not defined for ' + str(ele) + ' in layer ' + str(layer))
 
@@ -1004,7 +1023,7 @@ class slab:
             # Polymorphous elements
             if ele in poly_keys:
                 for layer in range(n):
-                    if ele in list(self.structure[layer].keys()):
+                    if ele in self.structure[layer]:
                         position = self.structure[layer][ele].position  # position of element
                         offset_list = transition[position]
  
@@ -1014,14 +1033,14 @@ class slab:
                     #offset = transition[layer]
 
                     # Element found in current layer
-                    if ele in list(self.structure[layer].keys()):
+                    if ele in self.structure[layer]:
 
                         position = self.structure[layer][ele].position  # position of element
                         sigma = self.structure[layer][ele].roughness  # roughness parameterization
                         current_density = self.structure[layer][ele].density*self.structure[layer][ele].poly_ratio  # current density
                         if layer == n - 1:  # On last layer
                             next_density = np.zeros(pn)  # density of element in next layer
-                        elif ele in list(self.structure[layer + 1].keys()):  # element in next layer
+                        elif ele in self.structure[layer + 1]:  # element in next layer
                             next_density = self.structure[layer + 1][ele].density* self.structure[layer+1][ele].poly_ratio
                         else:  # element not in the next layer
                             next_density = np.zeros(pn)
@@ -1054,12 +1073,12 @@ class slab:
                         if layer == n - 1:  # Last layer
                             next_density = current_density
                             sigma = 0
-                        elif ele in list(self.structure[layer + 1].keys()):
+                        elif ele in self.structure[layer + 1]:
                             if type(self.structure[layer+1][ele].linked_roughness) is float or type(self.structure[layer+1][ele].linked_roughness) is int:
                                 sigma = self.structure[layer+1][ele].linked_roughness
                             else:
                                 position = self.structure[layer + 1][ele].position  # position of element
-                                previous_element = list(self.structure[layer].keys())[position]
+                                previous_element = layer_keys[layer][position]
                                 sigma = self.structure[layer][previous_element].roughness
 
                             next_density = self.structure[layer + 1][ele].density * self.structure[layer+1][ele].poly_ratio  # next layer density
@@ -1085,7 +1104,7 @@ class slab:
                 layer = 0
                 not_found = True
                 while not_found or layer <= n - 1:
-                    if ele in list(self.structure[layer].keys()):
+                    if ele in self.structure[layer]:
                         density_mag[ele] = {k: np.zeros(len(thickness)) for k in list(self.mag_elements[ele])}
                         if len(self.structure[layer][ele].mag_density) == 0:
                             raise SyntaxError('Magnetization not defined for ' + str(ele) + ' in layer ' + str(layer))
@@ -1099,7 +1118,7 @@ class slab:
             # Magnetic elements
             if ele in mag_keys:
                 for layer in range(n):
-                    if ele in list(self.structure[layer].keys()):
+                    if ele in self.structure[layer]:
                         position = self.structure[layer][ele].position  # position of element
                         offset_list = transition[position]
 
@@ -1108,14 +1127,14 @@ class slab:
                     offset = offset_list[layer]  # offset for new implementation
 
                     # Element found in current layer
-                    if ele in list(self.structure[layer].keys()):
+                    if ele in self.structure[layer]:
                         position = self.structure[layer][ele].position  # position of element
                         sigma = self.structure[layer][ele].roughness  # roughness parameterization
                         #current_density = self.structure[layer][ele].stoichiometry * np.array(self.structure[layer][ele].mag_density) * np.array(self.structure[layer][ele].density) / self.structure[layer][ele].molar_mass  # current density
                         current_density = np.array(self.structure[layer][ele].mag_density)
                         if layer == n - 1:  # Last layer
                             next_density = np.zeros(pm)  # density of element in next layer
-                        elif ele in list(self.structure[layer + 1].keys()):  # element in next layer
+                        elif ele in self.structure[layer + 1]:  # element in next layer
                             #next_density = self.structure[layer + 1][ele].stoichiometry * np.array(self.structure[layer + 1][ele].mag_density) * np.array(self.structure[layer + 1][ele].density) / self.structure[layer + 1][ele].molar_mass
                             next_density = np.array(self.structure[layer + 1][ele].mag_density)
                         else:  # element not in the next layer
@@ -1154,12 +1173,12 @@ class slab:
                         if layer == n - 1:  # Last layer
                             next_density = current_density
                             sigma = 0
-                        elif ele in list(self.structure[layer + 1].keys()):
+                        elif ele in self.structure[layer + 1]:
                             if type(self.structure[layer+1][ele].linked_roughness) is float or type(self.structure[layer+1][ele].linked_roughness) is int:
                                 sigma = self.structure[layer+1][ele].linked_roughness
                             else:
                                 position = self.structure[layer + 1][ele].position  # position of element
-                                previous_element = list(self.structure[layer].keys())[position]
+                                previous_element = layer_keys[layer][position]
                                 sigma = self.structure[layer][previous_element].roughness
                             #next_density = self.structure[layer + 1][ele].stoichiometry * np.array(self.structure[layer + 1][ele].mag_density)*np.array(self.structure[layer + 1][ele].density) / self.structure[layer + 1][ele].molar_mass  # next layer density
                             next_density = np.array(self.structure[layer + 1][ele].mag_density)
@@ -1321,6 +1340,7 @@ class slab:
         m = len(my_slabs)  # number of slabs
 
         A =pr.Generate_structure(m)  # initializes Pythonreflectivity object class
+        layer_transition = np.max(self.transition, axis=0)  # thickness at which each layer ends
 
         m_j=0  # previous slab
         idx = 0  # keeps track of current layer
@@ -1345,8 +1365,7 @@ class slab:
 
 
             # Determines the magnetization direction of the other layers
-            temp_list = [self.transition[i][layer] for i in range(len(self.transition))]
-            transition = max(temp_list)
+            transition = layer_transition[layer]
 
             # makes sure we are properly defining the magnetization direction as desired
             if transition<=thickness[m_j] and layer<len(self.transition[0])-1: